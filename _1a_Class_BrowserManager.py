@@ -1,22 +1,194 @@
 # _1a_Class_BrowserManager.py
 
+import json
 import os
+import re
+import shutil
+import subprocess
+import threading
+import time
 import traceback
+from dataclasses import dataclass
 
 # Используем стандартный Selenium и его помощников
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium_stealth import stealth
 
 from pyvirtualdisplay import Display
 
+from _1i_Class_Metrics import DEFAULT_METRICS
+
 CHROME_BINARY_PATH = "/usr/bin/google-chrome-stable"
 
 # Директория для хранения профиля Chrome.
 # Используем новую папку, чтобы избежать конфликтов со старыми профилями.
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 USER_DATA_DIR = os.path.join(APP_DIR, "chrome_profile_stealth")
+# Кэш chromedriver по мажорной версии Chrome: cache/chromedriver/<версия>/chromedriver
+DRIVER_CACHE_DIR = os.path.join(APP_DIR, "cache", "chromedriver")
+
+# Найденные за время процесса драйверы: повторные запуски браузеров не ищут их заново
+_resolved_drivers: dict[tuple, str] = { }
+_resolve_lock = threading.Lock()
+
+# Шаблоны URL для блокировки ресурсов по типу (Network.setBlockedURLs работает только по URL)
+RESOURCE_TYPE_PATTERNS = {
+        "Image": ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*"],
+        "Font" : ["*.woff*", "*.woff2*", "*.ttf*", "*.otf*", "*.eot*"],
+        "Media": ["*.mp4*", "*.webm*", "*.m3u8*", "*.mp3*", "*.ogg*"],
+        }
+# Счётчики и сторонние трекеры: парсеру они не нужны
+TRACKER_PATTERNS = [
+        "*mc.yandex.ru*", "*an.yandex.ru*", "*google-analytics.com*", "*googletagmanager.com*",
+        "*doubleclick.net*", "*top-fwz1.mail.ru*", "*vk.com/rtrg*", "*criteo*", "*adfox*",
+        ]
+
+
+@dataclass
+class PerformanceProfile:
+    """
+    Облегчённый профиль Chrome для парсинга: парсер читает несколько текстовых узлов,
+    поэтому картинки, шрифты, видео и трекеры не загружаются.
+    """
+
+    blocked_resource_types: tuple[str, ...] = ("Image", "Font", "Media")
+    blocked_url_patterns: tuple[str, ...] = tuple(TRACKER_PATTERNS)
+    disable_images: bool = True
+    window_size: tuple[int, int] = (1280, 800)
+    # В режиме --headless=new виртуальный дисплей Xvfb не нужен
+    skip_virtual_display: bool = True
+    # Журнал сетевых событий для подсчёта трафика страницы (см. page_traffic)
+    measure_traffic: bool = True
+
+    def blocked_urls(self) -> list[str]:
+        patterns = list(self.blocked_url_patterns)
+        for resource_type in self.blocked_resource_types:
+            patterns += RESOURCE_TYPE_PATTERNS.get(resource_type, [])
+        return patterns
+
+
+def page_traffic(driver) -> dict | None:
+    """
+    Забирает накопленные сетевые события из журнала performance и возвращает трафик с прошлого вызова:
+    запросы, переданные байты и заблокированные профилем запросы.
+    Возвращает None, если журнал не включён (браузер запущен без PerformanceProfile.measure_traffic).
+    """
+
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return None
+
+    traffic = { "requests": 0, "bytes": 0, "blocked": 0 }
+
+    for entry in entries:
+        message = json.loads(entry["message"])["message"]
+        method = message.get("method")
+
+        if method == "Network.requestWillBeSent":
+            traffic["requests"] += 1
+        elif method == "Network.loadingFinished":
+            traffic["bytes"] += int(message["params"].get("encodedDataLength", 0))
+        elif method == "Network.loadingFailed" and message["params"].get("blockedReason"):
+            traffic["blocked"] += 1
+
+    return traffic
+
+
+def binary_version(path: str) -> str | None:
+    """'Google Chrome 126.0.6478.126' или 'ChromeDriver 126.0.6478.126 (...)' -> '126.0.6478.126'."""
+
+    try:
+        output = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    match = re.search(r"\d+\.\d+\.\d+\.\d+", output)
+    return match.group(0) if match else None
+
+
+def _store_driver(source: str, cached_path: str) -> None:
+    """Копирует драйвер в кэш атомарно: параллельные процессы не увидят недописанный файл."""
+
+    os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+    temp_path = f"{cached_path}.{os.getpid()}.tmp"
+    shutil.copy2(source, temp_path)
+    os.replace(temp_path, cached_path)
+
+
+def resolve_chromedriver(driver_path: str | None = None, allow_download: bool = False,
+                         chrome_binary: str = CHROME_BINARY_PATH, cache_dir: str = DRIVER_CACHE_DIR,
+                         logger_callback=print
+                         ) -> str:
+    """
+    Находит chromedriver без обращения к сети, по порядку:
+    1. driver_path - закреплённый в настройках путь, используется как есть;
+    2. кэш на диске по мажорной версии Chrome из chrome_binary;
+    3. chromedriver из PATH, если его мажорная версия совпадает с Chrome (копируется в кэш);
+    4. webdriver-manager (поиск версии и загрузка по сети) - только при allow_download=True, результат
+       тоже копируется в кэш.
+    Результат запоминается на время процесса.
+
+    :raises RuntimeError: Драйвер не найден, а загрузка не разрешена.
+    """
+
+    key = (driver_path, allow_download, chrome_binary, cache_dir)
+
+    with _resolve_lock:
+        if key in _resolved_drivers:
+            return _resolved_drivers[key]
+
+        if driver_path:
+            if not os.path.isfile(driver_path):
+                raise RuntimeError(f"chromedriver не найден по пути из настроек: {driver_path}")
+            resolved = driver_path
+        else:
+            resolved = _find_chromedriver(allow_download, chrome_binary, cache_dir, logger_callback)
+
+        _resolved_drivers[key] = resolved
+        return resolved
+
+
+def _find_chromedriver(allow_download: bool, chrome_binary: str, cache_dir: str, logger_callback) -> str:
+    chrome_version = binary_version(chrome_binary)
+    major = chrome_version.split(".")[0] if chrome_version else None
+    cached_path = os.path.join(cache_dir, major, "chromedriver") if major else None
+
+    if cached_path and os.path.isfile(cached_path):
+        logger_callback(f"chromedriver для Chrome {major} взят из кэша: {cached_path}")
+        return cached_path
+
+    if major is None:
+        logger_callback(f"Не удалось определить версию Chrome ({chrome_binary}), кэш драйверов не используется.")
+
+    system_driver = shutil.which("chromedriver")
+    if system_driver:
+        driver_version = binary_version(system_driver)
+        if major is None or (driver_version and driver_version.split(".")[0] == major):
+            logger_callback(f"Используется chromedriver из PATH: {system_driver} ({driver_version}).")
+            if cached_path:
+                _store_driver(system_driver, cached_path)
+                return cached_path
+            return system_driver
+        logger_callback(f"chromedriver из PATH ({driver_version}) не подходит к Chrome {chrome_version}.")
+
+    if not allow_download:
+        expected_path = cached_path or os.path.join(cache_dir, "<мажорная версия Chrome>", "chromedriver")
+        raise RuntimeError(f"chromedriver для Chrome {chrome_version or '?'} не найден локально, загрузка по сети "
+                           f"выключена. Укажите путь к драйверу (browser.driver_path в settings.json или "
+                           f"CHROMEDRIVER_PATH) либо положите драйвер в кэш: {expected_path}. "
+                           f"Загрузку можно разрешить явно: browser.allow_driver_download / CHROMEDRIVER_DOWNLOAD=1.")
+
+    # Сетевой путь - только по явному разрешению
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    logger_callback("Загрузка chromedriver через webdriver-manager...")
+    downloaded = ChromeDriverManager().install()
+    if cached_path:
+        _store_driver(downloaded, cached_path)
+        return cached_path
+    return downloaded
 
 
 class BrowserManager:
@@ -26,11 +198,30 @@ class BrowserManager:
     Гарантирует, что браузер будет всегда корректно закрыт.
     """
 
-    def __init__(self, logger_callback=print, use_virtual_display: bool = True):
-        """Инициализация менеджера."""
+    def __init__(self, logger_callback=print, use_virtual_display: bool = True, user_data_dir: str = USER_DATA_DIR,
+                 driver_path: str | None = None, performance_profile: PerformanceProfile | None = None,
+                 allow_driver_download: bool = False, session_store=None
+                 ):
+        """
+        Инициализация менеджера.
+
+        :param user_data_dir: Папка профиля Chrome. Одновременно работающим браузерам нужны разные папки.
+        :param driver_path: Закреплённый путь к chromedriver. Если не указан, драйвер ищется в локальном кэше
+                            и PATH (см. resolve_chromedriver).
+        :param performance_profile: Облегчённый профиль (блокировка ресурсов, без картинок, маленькое окно).
+                                    None - обычный браузер.
+        :param allow_driver_download: Разрешить загрузку chromedriver по сети, если локально его нет.
+        :param session_store: Сохранённая сессия сайта (SessionStore) - переносится в браузер до первой загрузки.
+        """
 
         self.log = logger_callback
         self.driver = None
+        self.driver_path = driver_path
+        self.allow_driver_download = allow_driver_download
+        # Длительность фаз последнего запуска, секунд: display, driver_resolve, chrome_launch, stealth, session_restore
+        self.startup_timings: dict[str, float] = { }
+        self.performance_profile = performance_profile
+        self.session_store = session_store
 
         options = webdriver.ChromeOptions()
         # Отключаем флаги, которые могут выдавать автоматизацию
@@ -43,9 +234,25 @@ class BrowserManager:
         # Стандартные аргументы для стабильности
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--no-sandbox')
-        options.add_argument("--start-maximized")
         options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument(f'--user-data-dir={USER_DATA_DIR}')
+        options.add_argument(f'--user-data-dir={user_data_dir}')
+
+        profile = performance_profile
+        if profile is None:
+            options.add_argument("--start-maximized")
+        else:
+            width, height = profile.window_size
+            options.add_argument(f"--window-size={width},{height}")
+            # Фоновые службы Chrome, которые парсеру не нужны
+            for argument in ("--disable-extensions", "--disable-background-networking", "--disable-component-update",
+                             "--disable-sync", "--disable-default-apps", "--no-first-run", "--mute-audio"):
+                options.add_argument(argument)
+            if profile.disable_images:
+                options.add_argument("--blink-settings=imagesEnabled=false")
+                options.add_experimental_option("prefs", { "profile.managed_default_content_settings.images": 2 })
+            if profile.measure_traffic:
+                options.set_capability("goog:loggingPrefs", { "performance": "ALL" })
+            use_virtual_display = use_virtual_display and not profile.skip_virtual_display
 
         self.use_virtual_display = use_virtual_display
         self.display = None
@@ -56,6 +263,15 @@ class BrowserManager:
 
         self.log("Запуск браузера с selenium-stealth...")
 
+        timings = self.startup_timings = { }
+        phase_started = time.monotonic()
+
+        def phase_done(name: str) -> None:
+            nonlocal phase_started
+            now = time.monotonic()
+            timings[name] = round(now - phase_started, 3)
+            phase_started = now
+
         try:
             if self.use_virtual_display:
                 self.log("Запуск виртуального дисплея...")
@@ -63,12 +279,18 @@ class BrowserManager:
                 self.display.start()
                 self.log(f"Виртуальный дисплей запущен на DISPLAY={self.display.display}.")
                 os.environ['DISPLAY'] = f':{self.display.display}'
+            phase_done("display")
+
+            # Локальный кэш драйверов; сеть - только если разрешено
+            self.log("Поиск chromedriver...")
+            service = ChromeService(resolve_chromedriver(self.driver_path, self.allow_driver_download,
+                                                         logger_callback=self.log
+                                                         ))
+            phase_done("driver_resolve")
 
-            # webdriver-manager автоматически скачает и установит подходящий chromedriver
-            self.log("Установка/поиск chromedriver...")
-            service = ChromeService(ChromeDriverManager().install())
             self.log("Запуск webdriver.Chrome...")
             self.driver = webdriver.Chrome(service=service, options=self._options)
+            phase_done("chrome_launch")
             self.log("Применение stealth-патчей...")
 
             # Применяем stealth-патчи для маскировки
@@ -81,10 +303,26 @@ class BrowserManager:
                     fix_hairline=True,
                     )
 
+            if self.performance_profile is not None:
+                self._apply_request_blocking()
+            phase_done("stealth")
+
+            if self.session_store is not None:
+                self._restore_session()
+            phase_done("session_restore")
+
+            self.log(f"Старт браузера: дисплей {timings['display']:.2f} с, "
+                     f"chromedriver {timings['driver_resolve']:.2f} с, Chrome {timings['chrome_launch']:.2f} с, "
+                     f"stealth {timings['stealth']:.2f} с, сессия {timings['session_restore']:.2f} с.")
             self.log("Браузер и selenium-stealth успешно запущены.")
+            DEFAULT_METRICS.observe("browser_start", sum(timings.values()))
+            for phase, seconds in timings.items():
+                DEFAULT_METRICS.observe(f"browser_{phase}", seconds)
             return self.driver
 
         except Exception as e:
+            phase_done("failed")
+            DEFAULT_METRICS.observe("browser_start", sum(timings.values()), failed=True)
             self.log("!!! КРИТИЧЕСКАЯ ОШИБКА при запуске браузера со stealth !!!")
             self.log(f"Ошибка: {e}")
             self.log("Трассировка:")
@@ -93,6 +331,24 @@ class BrowserManager:
                 self.display.stop()
             return None
 
+    def _apply_request_blocking(self) -> None:
+        """Включает блокировку запросов профиля на уровне CDP."""
+
+        blocked_urls = self.performance_profile.blocked_urls()
+        self.driver.execute_cdp_cmd("Network.enable", { })
+        self.driver.execute_cdp_cmd("Network.setBlockedURLs", { "urls": blocked_urls })
+        self.log(f"Облегчённый профиль: блокируется шаблонов URL: {len(blocked_urls)}, "
+                 f"типы ресурсов: {', '.join(self.performance_profile.blocked_resource_types)}.")
+
+    def _restore_session(self) -> None:
+        """Переносит сохранённые cookies и localStorage в браузер. Без сессии браузер просто стартует «холодным»."""
+
+        try:
+            if not self.session_store.restore(self.driver, logger_callback=self.log):
+                self.log("Сохранённой сессии нет или она устарела, браузер стартует без неё.")
+        except Exception as e:
+            self.log(f"Не удалось восстановить сессию: {e}")
+
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         """Метод, вызываемый при выходе из блока 'with' (даже при ошибках)."""
 
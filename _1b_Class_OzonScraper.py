@@ -1,17 +1,21 @@
 # _1b_Class_OzonScraper.py
 
 import time
-import random
 import re
-import os
-from datetime import datetime
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, Callable
 from urllib.parse import quote
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from _1a_Class_BrowserManager import page_traffic
+from _1d_Class_RateLimiter import DEFAULT_RATE_LIMITER, SIGNAL_CAPTCHA, SIGNAL_EMPTY, SIGNAL_ERROR
+from _1h_Class_PageExtractor import FieldSpec, PageSpec, PageExtractor
+from _1i_Class_Metrics import DEFAULT_METRICS
+from _1l_Class_DebugArtifacts import DEFAULT_DEBUG_ARTIFACTS
+
 
 class OzonScraper:
     """
@@ -20,44 +24,401 @@ class OzonScraper:
     """
 
     BASE_DOMAIN = "https://www.ozon.ru"
-    # Папка для отладочных файлов внутри /app/static/
-    DEBUG_FOLDER = "debug"
 
-    def __init__(self, driver, logger_callback=print):
+    # Селекторы полей страницы товара (общие для всех бэкендов загрузки)
+    TITLE_SELECTOR = "h1"
+    PRICE_SELECTOR = "div[data-widget='webPrice'] span.tsHeadline600Large"
+    SCORE_SELECTOR = "div[data-widget='webSingleProductScore'] div"
+    # Признаки страницы блокировки или капчи (в адресе или заголовке страницы)
+    BLOCK_MARKERS = ("captcha", "challenge", "antibot", "доступ ограничен")
+
+    # Плитки поисковой выдачи
+    TILE_GRID_SELECTOR = "div[data-widget='tileGridDesktop']"
+    TILE_LINK_SELECTOR = "a[href*='/product/']"
+    # Сколько ждать новых плиток после прокрутки и сколько прокруток подряд без новых плиток допустимо
+    FIRST_TILES_WAIT_MS = 15000
+    SCROLL_WAIT_MS = 4000
+    IDLE_SCROLLS = 2
+
+    # Окно cookies: короткая проверка вместо долгого ожидания - с восстановленной сессией окна обычно нет
+    COOKIE_BUTTON_SELECTOR = "div[data-widget='cookieBubble'] button"
+    COOKIE_PROBE_MS = 1500
+    # Одна команда: ищет кнопку окна каждые 100 мс (не дольше maxWait) и нажимает её
+    COOKIE_PROBE_JS = """
+        const [selector, maxWait] = arguments;
+        const done = arguments[arguments.length - 1];
+        const started = Date.now();
+        const probe = () => {
+            const button = document.querySelector(selector);
+            if (button) {
+                button.click();
+                done(true);
+            } else if (Date.now() - started >= maxWait) {
+                done(false);
+            } else {
+                setTimeout(probe, 100);
+            }
+        };
+        probe();
+    """
+
+    # Поля товара в плитке выдачи (режимы извлечения "tiles" и "hybrid", см. TILE_SPEC)
+    TILE_ROOT_SELECTOR = "div.tile-root"
+    TILE_TITLE_SELECTOR = "span.tsBody500Medium"
+    TILE_PRICE_SELECTOR = "span.tsHeadline500Medium"
+    TILE_SCORE_SELECTOR = "div.tsBodyMBold"
+
+    # Одна команда на итерацию: прокрутка (если нужна) и ожидание новых плиток через MutationObserver.
+    # Возвращает только ссылки, которых не было в прошлых итерациях (просмотренные помечаются атрибутом).
+    # Если переданы селекторы полей плитки, вместо ссылок возвращаются { href, texts } - тексты полей плитки.
+    COLLECT_NEW_LINKS_JS = """
+        const [selector, scroll, maxWait, tileRoot, fields] = arguments;
+        const done = arguments[arguments.length - 1];
+        const readTile = link => {
+            const root = link.closest(tileRoot) || link.parentElement;
+            const texts = {};
+            for (const [name, fieldSelector] of Object.entries(fields)) {
+                const element = root.querySelector(fieldSelector);
+                const text = element ? (element.innerText || element.textContent || '').trim() : '';
+                texts[name] = text || null;
+            }
+            return { href: link.href, texts: texts };
+        };
+        const collect = () => {
+            const found = [];
+            document.querySelectorAll(selector).forEach(link => {
+                link.setAttribute('data-wp-seen', '1');
+                found.push(fields ? readTile(link) : link.href);
+            });
+            return found;
+        };
+        if (scroll) {
+            window.scrollBy(0, window.innerHeight * 1.5);
+        }
+        const found = collect();
+        if (found.length) {
+            done(found);
+            return;
+        }
+        const observer = new MutationObserver(() => {
+            const appended = collect();
+            if (appended.length) {
+                observer.disconnect();
+                clearTimeout(timer);
+                done(appended);
+            }
+        });
+        observer.observe(document.body, { childList: true, subtree: true });
+        const timer = setTimeout(() => { observer.disconnect(); done([]); }, maxWait);
+    """
+
+    def __init__(self, driver, logger_callback=print, rate_limiter=DEFAULT_RATE_LIMITER, backend=None, cache=None,
+                 link_cache=None, link_collection: str = "incremental", extractor: PageExtractor | None = None,
+                 metrics=DEFAULT_METRICS, session_store=None, debug_artifacts=DEFAULT_DEBUG_ARTIFACTS
+                 ):
+        """
+        :param rate_limiter: Адаптивный бюджет запросов по доменам (RateLimiter), общий для всех скраперов процесса.
+                             Задаёт паузы между загрузками страниц и прокрутками. None - без пауз.
+        :param backend: Лёгкий бэкенд загрузки страниц товара (FetchBackend).
+                        Selenium используется только если бэкенд не смог извлечь данные.
+        :param cache: Кэш разобранных страниц товара (ProductCache).
+        :param link_cache: Кэш ссылок из поисковой выдачи (LinkCache).
+        :param link_collection: "incremental" - за итерацию прокрутки одна команда браузеру, которая возвращает
+                                только новые ссылки, прокрутка прекращается, когда плитки перестают появляться;
+                                "legacy" - перечитывание всех плиток через WebDriver и фиксированное число прокруток.
+        :param extractor: Извлечение полей страницы одной командой браузеру (PageExtractor).
+        :param metrics: Замеры длительности этапов и счётчики (StageMetrics), общие для процесса.
+        :param session_store: Сохранённая сессия сайта (SessionStore): обновляется после успешного сбора выдачи.
+        :param debug_artifacts: Отладочные материалы страниц с ошибками (DebugArtifacts), запись в фоне.
+                                None - не сохранять.
+        """
+
         self.driver = driver
         self.log = logger_callback
+        self.rate_limiter = rate_limiter
+        self.backend = backend
+        self.cache = cache
+        self.link_cache = link_cache
+        self.link_collection = link_collection
+        self.extractor = extractor or PageExtractor()
+        self.metrics = metrics
+        self.session_store = session_store
+        self.debug_artifacts = debug_artifacts
+        # Счётчик загруженных страниц - по нему пул браузеров решает, когда пересоздать драйвер
+        self.pages_loaded = 0
+        # Сетевой трафик страниц браузера (если браузер запущен с облегчённым профилем)
+        self.traffic = { "pages": 0, "requests": 0, "bytes": 0, "blocked": 0 }
+
+    def for_driver(self, driver, **overrides) -> "OzonScraper":
+        """Создаёт scraper для другого драйвера с теми же логгером, бюджетом запросов, бэкендом и кэшем."""
+
+        options = { "logger_callback": self.log, "rate_limiter": self.rate_limiter, "backend": self.backend,
+                    "cache"          : self.cache, "link_cache": self.link_cache,
+                    "link_collection": self.link_collection, "extractor": self.extractor, "metrics": self.metrics,
+                    "session_store"  : self.session_store, "debug_artifacts": self.debug_artifacts }
+        options.update(overrides)
+        scraper = OzonScraper(driver, **options)
+        # Трафик считается на всю сессию, включая параллельных воркеров
+        scraper.traffic = self.traffic
+        return scraper
 
-        # Создаем папку для отладки, если ее нет
-        static_debug_path = os.path.join('static', self.DEBUG_FOLDER)
-        os.makedirs(static_debug_path, exist_ok=True)
+    @staticmethod
+    def normalize_product_url(href: str) -> str:
+        """Убирает параметры запроса из ссылки на товар - так ссылки сравниваются и кэшируются."""
+        return href.split("?")[0]
 
     @staticmethod
-    def _human_delay(min_sec: int = 1, max_sec: int = 3) -> None:
-        time.sleep(random.uniform(min_sec, max_sec))
+    def empty_product_data(url: str) -> dict[str, Any]:
+        """Пустая запись о товаре - та же структура, что возвращает parse_product_page."""
+        return { "title": None, "price": None, "rating": None, "reviews_count": None, "url": url }
 
-    def _handle_popups(self) -> None:
+    @staticmethod
+    def parse_price_text(text: str) -> int:
+        """'1 299 ₽' -> 1299"""
+        return int(re.sub(r'[^0-9]', '', text))
+
+    @staticmethod
+    def parse_tile_score_text(text: str) -> tuple[float | None, int | None]:
+        """'4.8  1 234 отзыва' -> (4.8, 1234): в плитке выдачи рейтинг и отзывы без разделителя '•'."""
+
+        match = re.match(r'\s*(\d+(?:[.,]\d+)?)\s+(\d[\d\s]*)', text)
+
+        if not match:
+            return None, None
+
+        return float(match.group(1).replace(',', '.')), int(re.sub(r'[^0-9]', '', match.group(2)))
+
+    @staticmethod
+    def parse_score_text(text: str) -> tuple[float | None, int | None]:
+        """'4.8 • 1 234 отзыва' -> (4.8, 1234). Если формат не распознан, возвращает (None, None)."""
+
+        parts = text.split('•')
+
+        if len(parts) != 2:
+            return None, None
+
+        return float(parts[0].strip()), int(re.sub(r'[^0-9]', '', parts[1]))
+
+    def _pace(self, url: str) -> None:
+        """Ждёт разрешения бюджета запросов перед загрузкой страницы или прокруткой."""
+
+        if self.rate_limiter:
+            self.rate_limiter.acquire(url)
+
+    def _report(self, url: str, signal: str | None = None, elapsed: float | None = None) -> None:
+        """Сообщает бюджету запросов результат загрузки: успех или сигнал для снижения темпа."""
+
+        if self.rate_limiter:
+            message = self.rate_limiter.report(url, signal, elapsed)
+            if message:
+                self.log(f"  - {message}")
+
+    def _blocked(self) -> bool:
+        """Похожа ли открытая страница на капчу или блокировку."""
 
         try:
-            cookie_button = WebDriverWait(self.driver, 15).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, "div[data-widget='cookieBubble'] button"))
-                    )
-            cookie_button.click()
-            self.log("  - Окно с cookies закрыто.")
-            self._human_delay()
+            text = f"{self.driver.current_url} {self.driver.title}".lower()
+        except Exception:
+            return False
 
+        return any(marker in text for marker in self.BLOCK_MARKERS)
+
+    def _open(self, url: str) -> float:
+        """Открывает страницу и возвращает время загрузки в секундах. Ошибка загрузки снижает темп."""
+
+        started = time.monotonic()
+        try:
+            self.driver.get(url)
+        except Exception:
+            self._report(url, SIGNAL_ERROR)
+            raise
+        finally:
+            self.pages_loaded += 1
+
+        return time.monotonic() - started
+
+    def _record_traffic(self) -> None:
+        """Логирует трафик последней страницы: запросы, переданные байты и запросы, заблокированные профилем."""
+
+        traffic = page_traffic(self.driver)
+        if not traffic or not traffic["requests"]:
+            return
+
+        self.traffic["pages"] += 1
+        for key in ("requests", "bytes", "blocked"):
+            self.traffic[key] += traffic[key]
+
+        self.log(f"  - Трафик: {traffic['requests']} запросов, {traffic['bytes'] / 1024:.0f} КБ, "
+                 f"заблокировано {traffic['blocked']}.")
+
+    def describe_traffic(self) -> str | None:
+        """Строка для лога: средний трафик на страницу за сессию, None - если трафик не измерялся."""
+
+        pages = self.traffic["pages"]
+        if not pages:
+            return None
+
+        return (f"{pages} стр., в среднем {self.traffic['requests'] / pages:.0f} запросов и "
+                f"{self.traffic['bytes'] / 1024 / pages:.0f} КБ на страницу, "
+                f"заблокировано {self.traffic['blocked'] / pages:.0f} запросов на страницу")
+
+    @contextmanager
+    def page_load_timeout(self, seconds: float | None):
+        """Временно ограничивает время загрузки страницы, чтобы зависшая страница не блокировала драйвер."""
+
+        previous = None
+
+        if seconds:
+            try:
+                previous = self.driver.timeouts.page_load
+                self.driver.set_page_load_timeout(seconds)
+            except Exception:
+                previous = None
+
+        try:
+            yield
+        finally:
+            if previous is not None:
+                try:
+                    self.driver.set_page_load_timeout(previous)
+                except Exception:
+                    pass
+
+    def _handle_popups(self) -> None:
+        """Закрывает окно cookies, если оно есть. Проверка занимает не больше COOKIE_PROBE_MS."""
+
+        try:
+            closed = self.driver.execute_async_script(self.COOKIE_PROBE_JS, self.COOKIE_BUTTON_SELECTOR,
+                                                      self.COOKIE_PROBE_MS
+                                                      )
         except Exception:
-            self.log("  - Окно с cookies не найдено.")
+            closed = False
+
+        self.log("  - Окно с cookies закрыто." if closed else "  - Окно с cookies не найдено.")
+
+    def fetch_product_links(self, query: str, pages: int, max_products: int,
+                            tiles: dict[str, dict[str, Any]] | None = None,
+                            on_links: Callable[[list[str]], None] | None = None) -> list[str]:
+        """
+        Собирает ссылки на товары по поисковому запросу.
 
-    def fetch_product_links(self, query: str, pages: int, max_products: int) -> list[str]:
-        """Собирает ссылки на товары по поисковому запросу."""
+        :param pages: Максимальное число итераций прокрутки выдачи.
+        :param tiles: Если передан словарь, в него складываются данные товаров из плиток выдачи (URL -> product_data),
+                      прочитанные той же командой, что и ссылки. Кэш ссылок в этом случае не читается.
+        :param on_links: Получает новые ссылки после каждой итерации прокрутки (только инкрементальный сбор;
+                         ссылки из кэша и прежнего сбора приходят только в возвращаемом списке).
+        """
+
+        if self.link_cache is not None and tiles is None:
+            cached_links = self.link_cache.get(query, pages, max_products)
+            if cached_links is not None:
+                self.log(f"Ссылки по запросу '{query}' взяты из кэша ({len(cached_links)} шт.), прокрутка не нужна.")
+                return cached_links
 
         encoded_query = quote(query)
         search_url = f"{self.BASE_DOMAIN}/search/?text={encoded_query}&from_global=true"
         print(f"Переход на страницу поиска: {search_url}")
         self.log(f"Переход на страницу поиска: {search_url}")
-        self.driver.get(search_url)
+        self._pace(search_url)
+        with self.metrics.span("search_page_load"):
+            elapsed = self._open(search_url)
+        self._report(search_url, SIGNAL_CAPTCHA if self._blocked() else None, elapsed)
         self._handle_popups()
 
+        with self.metrics.span("link_collection"):
+            # Поля плиток читает только инкрементальный сбор
+            if self.link_collection == "legacy" and tiles is None:
+                products_links, collection_failed = self._collect_links_legacy(search_url, pages, max_products)
+            else:
+                products_links, collection_failed = self._collect_links_incremental(search_url, pages, max_products,
+                                                                                    tiles, on_links
+                                                                                    )
+        self.metrics.count("ozon_links_collected", len(products_links))
+        self._record_traffic()
+
+        # Неполную выдачу после ошибки не кэшируем
+        if self.link_cache is not None and products_links and not collection_failed:
+            self.link_cache.put(query, pages, max_products, products_links)
+
+        # Выдача собрана - сессия рабочая: сохраняем её для новых браузеров, если сохранённая устарела
+        if self.session_store is not None and products_links and not collection_failed:
+            self.session_store.refresh(self.driver, logger_callback=self.log)
+
+        return products_links
+
+    def _collect_links_incremental(self, search_url: str, pages: int, max_products: int,
+                                   tiles: dict[str, dict[str, Any]] | None = None,
+                                   on_links: Callable[[list[str]], None] | None = None) -> tuple[list[str], bool]:
+        """
+        Сбор ссылок с инкрементальным обходом DOM: за итерацию одна команда execute_async_script,
+        которая прокручивает страницу, дожидается новых плиток и возвращает только их ссылки.
+        Прокрутка прекращается после IDLE_SCROLLS итераций подряд без новых плиток.
+        Если передан словарь tiles, та же команда читает поля плиток, и в tiles складываются данные товаров.
+        Новые ссылки каждой итерации (в пределах max_products) сразу передаются в on_links.
+
+        :return: (ссылки в порядке выдачи, был ли сбор прерван ошибкой)
+        """
+
+        selector = f"{self.TILE_GRID_SELECTOR} {self.TILE_LINK_SELECTOR}:not([data-wp-seen])"
+        fields = { name: field.selector for name, field in TILE_SPEC.fields.items() } if tiles is not None else None
+        products_links: dict[str, None] = { }  # упорядоченное множество
+        idle_scrolls = 0
+
+        for i in range(pages):
+            self.log(f"--- Сбор ссылок: итерация прокрутки {i + 1}/{pages} ---")
+
+            try:
+                if i > 0:
+                    # Прокрутка подгружает плитки запросами к сайту, поэтому тоже расходует бюджет
+                    self._pace(search_url)
+
+                with self.metrics.span("search_scroll"):
+                    found = self.driver.execute_async_script(self.COLLECT_NEW_LINKS_JS, selector, i > 0,
+                                                             self.SCROLL_WAIT_MS if i > 0 else self.FIRST_TILES_WAIT_MS,
+                                                             self.TILE_ROOT_SELECTOR, fields
+                                                             )
+            except Exception as e:
+                self._report(search_url, SIGNAL_CAPTCHA if self._blocked() else SIGNAL_EMPTY)
+                self._save_debug_artifacts(e)
+                return list(products_links)[:max_products], True
+
+            collected_before = len(products_links)
+            for item in found:
+                link = self.normalize_product_url(item["href"] if fields else item)
+                products_links.setdefault(link, None)
+                if fields and link not in tiles:
+                    tiles[link] = self.tile_product_data(link, item["texts"])
+            new_links = len(products_links) - collected_before
+
+            self.log(f"  - Новых ссылок: {new_links}, всего уникальных: {len(products_links)}")
+
+            if on_links is not None and new_links and collected_before < max_products:
+                on_links(list(products_links)[collected_before:max_products])
+
+            if i == 0 and not products_links:
+                self._report(search_url, SIGNAL_CAPTCHA if self._blocked() else SIGNAL_EMPTY)
+                self._save_debug_artifacts(RuntimeError("плитки товаров не появились"))
+                return [], True
+
+            if len(products_links) >= max_products:
+                self.log(f"Собрано достаточное количество ссылок ({len(products_links)}), прекращаем скроллинг.")
+                break
+
+            idle_scrolls = idle_scrolls + 1 if new_links == 0 else 0
+            if idle_scrolls >= self.IDLE_SCROLLS:
+                self.log("  - Новые товары больше не появляются, прекращаем скроллинг.")
+                break
+
+        return list(products_links)[:max_products], False
+
+    def _collect_links_legacy(self, search_url: str, pages: int, max_products: int) -> tuple[list[str], bool]:
+        """
+        Прежний сбор ссылок: на каждой итерации перечитываются все плитки через WebDriver,
+        прокрутка выполняется фиксированное число раз.
+
+        :return: (ссылки, был ли сбор прерван ошибкой)
+        """
+
         products_links_set = set()
 
         for i in range(pages):
@@ -70,97 +431,219 @@ class OzonScraper:
             self.log(f"--- Сбор ссылок: итерация прокрутки {i + 1}/{pages} ---")
 
             try:
-                WebDriverWait(self.driver, 15).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, "div[data-widget='tileGridDesktop']"))
-                        )
-                tile_grids = self.driver.find_elements(By.CSS_SELECTOR, "div[data-widget='tileGridDesktop']")
+                with self.metrics.span("search_scroll"):
+                    WebDriverWait(self.driver, 15).until(
+                            EC.presence_of_element_located((By.CSS_SELECTOR, self.TILE_GRID_SELECTOR))
+                            )
+                    tile_grids = self.driver.find_elements(By.CSS_SELECTOR, self.TILE_GRID_SELECTOR)
 
-                for grid in tile_grids:
+                    for grid in tile_grids:
 
-                    product_links_elements = grid.find_elements(By.CSS_SELECTOR, "a[href*='/product/']")
+                        product_links_elements = grid.find_elements(By.CSS_SELECTOR, self.TILE_LINK_SELECTOR)
 
-                    for link_element in product_links_elements:
-                        href = link_element.get_attribute('href')
+                        for link_element in product_links_elements:
+                            href = link_element.get_attribute('href')
 
-                        if href:
-                            products_links_set.add(href.split("?")[0])
-                            if len(products_links_set) >= max_products:
-                                break  # Выходим из внутреннего цикла по ссылкам
+                            if href:
+                                products_links_set.add(self.normalize_product_url(href))
+                                if len(products_links_set) >= max_products:
+                                    break  # Выходим из внутреннего цикла по ссылкам
 
-                    if len(products_links_set) >= max_products:
-                        break  # Выходим из среднего цикла по гридам
+                        if len(products_links_set) >= max_products:
+                            break  # Выходим из среднего цикла по гридам
 
-                print(f"  - Собрано уникальных ссылок: {len(products_links_set)}")
-                self.log(f"  - Собрано уникальных ссылок: {len(products_links_set)}")
+                    print(f"  - Собрано уникальных ссылок: {len(products_links_set)}")
+                    self.log(f"  - Собрано уникальных ссылок: {len(products_links_set)}")
 
-                if i < pages - 1:
-                    print("  - Прокрутка вниз...")
-                    self.log("  - Прокрутка вниз...")
-                    self.driver.execute_script("window.scrollBy(0, window.innerHeight * 1.5);")
-                    self._human_delay(3, 5)
+                    if i < pages - 1:
+                        print("  - Прокрутка вниз...")
+                        self.log("  - Прокрутка вниз...")
+                        # Прокрутка подгружает плитки запросами к сайту, поэтому тоже расходует бюджет
+                        self._pace(search_url)
+                        self.driver.execute_script("window.scrollBy(0, window.innerHeight * 1.5);")
 
             except Exception as e:
-                # === БЛОК ОТЛАДКИ ===
-                timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-                screenshot_name = f"error_{timestamp}.png"
-                html_name = f"error_{timestamp}.html"
+                self._report(search_url, SIGNAL_CAPTCHA if self._blocked() else SIGNAL_EMPTY)
+                self._save_debug_artifacts(e)
+                return list(products_links_set), True
 
-                # Пути внутри папки static
-                screenshot_path_rel = os.path.join(self.DEBUG_FOLDER, screenshot_name)
-                html_path_rel = os.path.join(self.DEBUG_FOLDER, html_name)
+        return list(products_links_set), False
 
-                # Абсолютные пути для сохранения
-                screenshot_path_abs = os.path.join('static', screenshot_path_rel)
-                html_path_abs = os.path.join('static', html_path_rel)
+    def tile_product_data(self, url: str, texts: dict[str, str | None]) -> dict[str, Any]:
+        """Данные товара из текстов полей плитки выдачи - та же структура, что возвращает parse_product_page."""
 
-                print(f"!!! КРИТИЧЕСКАЯ ОШИБКА. Сохраняю отладочную информацию... !!!")
-                self.log(f"!!! КРИТИЧЕСКАЯ ОШИБКА. Сохраняю отладочную информацию... !!!")
-                self.driver.save_screenshot(screenshot_path_abs)
+        product_data = self.empty_product_data(url)
+        values, errors = PageExtractor.apply(TILE_SPEC, texts)
+        product_data.update(values)
 
-                with open(html_path_abs, 'w', encoding='utf-8') as f:
-                    f.write(self.driver.page_source)
+        for name, error in errors.items():
+            self.log(f"  - Поле '{name}' плитки {url} не разобрано: {error}")
 
-                self.log(f"  - Скриншот: /static/{screenshot_path_rel}")
-                self.log(f"  - HTML: /static/{html_path_rel}")
-                self.log(f"  - Текст ошибки: {e}. Прерываем сбор.")
-                break
+        return product_data
+
+    @staticmethod
+    def tile_complete(product_data: dict[str, Any]) -> bool:
+        """
+        Удалось ли взять из плитки обязательные поля TILE_SPEC и URL (иначе в режиме "hybrid" открывается
+        страница товара). Рейтинга и отзывов нет у товаров без отзывов - их отсутствие не делает плитку неполной.
+        """
+
+        required = [output for name in TILE_SPEC.required for output in TILE_SPEC.fields[name].outputs]
+        return all(product_data.get(field) is not None for field in ["url"] + required)
 
-        return list(products_links_set)
+    def _save_debug_artifacts(self, error: Exception | str) -> None:
+        """Сохраняет материалы страницы, на которой прервался сбор ссылок."""
+
+        self.log(f"  - Текст ошибки: {error}. Прерываем сбор.")
+        try:
+            url = self.driver.current_url
+        except Exception:
+            url = None
+        self._capture_page("search", url, error)
+
+    def _capture_page(self, kind: str, url: str | None, error: Exception | str) -> None:
+        """Ставит HTML и скриншот страницы с ошибкой в очередь фоновой записи (см. DebugArtifacts)."""
+
+        if self.debug_artifacts is not None:
+            self.debug_artifacts.capture(self.driver, kind, url, error, logger_callback=self.log)
 
     def parse_product_page(self, url: str) -> dict[str, Any]:
-        """Парсит одну страницу товара и возвращает словарь с данными."""
+        """
+        Парсит одну страницу товара и возвращает словарь с данными.
+        Сначала пробует лёгкий бэкенд (если задан), при неудаче - Selenium.
+        """
 
         self.log(f"Парсинг страницы: {url[:60]}...")
-        self.driver.get(url)
-        self._human_delay(2, 4)
 
-        product_data = { "title": None, "price": None, "rating": None, "reviews_count": None, "url": url }
+        with self.metrics.span("parse_product_page"):
+            product_data = self.cached_product(url)
+            if product_data is not None:
+                self.metrics.count("ozon_product_pages", source="cache")
+                return product_data
 
-        try:
-            # Название
-            product_data["title"] = WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "h1"))
-                    ).text
+            product_data = self.fetch_with_backend(url)
+            if product_data is None:
+                product_data = self.parse_product_page_selenium(url)
+                self.metrics.count("ozon_product_pages", source="selenium")
+            else:
+                self.metrics.count("ozon_product_pages", source=self.backend.name)
 
-            # Цена
-            price_element = self.driver.find_element(By.CSS_SELECTOR,
-                                                     "div[data-widget='webPrice'] span.tsHeadline600Large"
-                                                     )
-            product_data["price"] = int(price_element.text.replace(' ', '').replace('₽', '').strip())
+        self.remember_product(url, product_data)
+        return product_data
+
+    def cached_product(self, url: str) -> dict[str, Any] | None:
+        """Возвращает свежие данные товара из кэша (если кэш задан) и сообщает счётчики попаданий."""
+
+        if self.cache is None:
+            return None
+
+        product_data = self.cache.get(self.normalize_product_url(url))
+
+        if product_data is None:
+            self.log(f"  - Кэш: промах ({self.cache.hits} попаданий / {self.cache.misses} промахов)")
+            return None
+
+        self.log(f"  - Кэш: попадание ({self.cache.hits} попаданий / {self.cache.misses} промахов)")
+        product_data["url"] = url
+        return product_data
+
+    def remember_product(self, url: str, product_data: dict[str, Any]) -> None:
+        """Сохраняет успешно разобранную страницу в кэш."""
+
+        if self.cache is not None and product_data.get("title"):
+            self.cache.put(self.normalize_product_url(url), product_data)
+
+    def fetch_with_backend(self, url: str) -> dict[str, Any] | None:
+        """Загружает страницу товара лёгким бэкендом. Возвращает None, если бэкенда нет или он не справился."""
+
+        if self.backend is None:
+            return None
+
+        self._pace(url)
+        started = time.monotonic()
+        with self.metrics.span("product_backend_fetch"):
+            product_data = self.backend.fetch_product(url)
+        elapsed = time.monotonic() - started
 
-            # Рейтинг и отзывы
-            rating_reviews_element = self.driver.find_element(By.CSS_SELECTOR,
-                                                              "div[data-widget='webSingleProductScore'] div"
-                                                              )
-            parts = rating_reviews_element.text.split('•')
+        # Неудача лёгкого бэкенда - обычное дело (страница рендерится скриптами), темп снижает только медленный ответ
+        if product_data is not None or (self.rate_limiter and elapsed > self.rate_limiter.slow_seconds):
+            self._report(url, elapsed=elapsed)
 
-            if len(parts) == 2:
-                product_data["rating"] = float(parts[0].strip())
-                product_data["reviews_count"] = int(re.sub(r'[^0-9]', '', parts[1]))
+        if product_data is not None:
+            self.log(f"  - Успешно ({self.backend.name}): {product_data['title'][:30]}...")
+        else:
+            self.log(f"  - Бэкенд {self.backend.name} не извлёк данные, используем Selenium.")
 
-            self.log(f"  - Успешно: {product_data['title'][:30]}...")
+        return product_data
+
+    def parse_product_page_selenium(self, url: str) -> dict[str, Any]:
+        """Парсит страницу товара в браузере."""
+
+        # Вместо фиксированной паузы - бюджет запросов; готовность страницы ждёт скрипт извлечения
+        self._pace(url)
+        with self.metrics.span("product_page_load"):
+            elapsed = self._open(url)
+
+        product_data = self.empty_product_data(url)
+
+        try:
+            with self.metrics.span("product_extract"):
+                values, errors, _ = self.extractor.extract(self.driver, PRODUCT_PAGE_SPEC)
+            product_data.update(values)
+
+            for name, error in errors.items():
+                self.log(f"  - Поле '{name}' не разобрано на странице {url}: {error}")
+
+            if product_data["title"]:
+                self.log(f"  - Успешно: {product_data['title'][:30]}...")
+            else:
+                self.log(f"  - Название товара не найдено на странице {url}")
+                self._capture_page("product", url, "название товара не найдено")
 
         except Exception as e:
             self.log(f"  - Ошибка парсинга данных на странице {url}: {e}")
+            self._capture_page("product", url, e)
+
+        self._record_traffic()
+
+        if self._blocked():
+            self._report(url, SIGNAL_CAPTCHA)
+        elif not product_data["title"]:
+            self._report(url, SIGNAL_EMPTY)
+        else:
+            self._report(url, elapsed=elapsed)
 
         return product_data
+
+
+# Поля страницы товара: селектор для браузера, XPath для разбора HTML без браузера и обработчик текста.
+# Страница считается готовой, когда появились название и цена.
+PRODUCT_PAGE_SPEC = PageSpec("product", {
+        "title": FieldSpec(OzonScraper.TITLE_SELECTOR, lambda text: { "title": " ".join(text.split()) }, ("title",),
+                           required=True, xpath="//h1"
+                           ),
+        "price": FieldSpec(OzonScraper.PRICE_SELECTOR, lambda text: { "price": OzonScraper.parse_price_text(text) },
+                           ("price",), required=True,
+                           xpath="//div[@data-widget='webPrice']"
+                                 "//span[contains(concat(' ', normalize-space(@class), ' '), ' tsHeadline600Large ')]"
+                           ),
+        "score": FieldSpec(OzonScraper.SCORE_SELECTOR,
+                           lambda text: dict(zip(("rating", "reviews_count"), OzonScraper.parse_score_text(text))),
+                           ("rating", "reviews_count"),
+                           xpath="(//div[@data-widget='webSingleProductScore']//div)[1]"
+                           ),
+        })
+
+# Поля товара в плитке поисковой выдачи: читаются вместе со ссылками, без открытия страницы товара
+TILE_SPEC = PageSpec("tile", {
+        "title": FieldSpec(OzonScraper.TILE_TITLE_SELECTOR, lambda text: { "title": " ".join(text.split()) },
+                           ("title",), required=True
+                           ),
+        "price": FieldSpec(OzonScraper.TILE_PRICE_SELECTOR,
+                           lambda text: { "price": OzonScraper.parse_price_text(text) }, ("price",), required=True
+                           ),
+        "score": FieldSpec(OzonScraper.TILE_SCORE_SELECTOR,
+                           lambda text: dict(zip(("rating", "reviews_count"), OzonScraper.parse_tile_score_text(text))),
+                           ("rating", "reviews_count")
+                           ),
+        })
@@ -0,0 +1,346 @@
+# _1c_Class_BrowserPool.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from pyvirtualdisplay import Display
+
+from _1a_Class_BrowserManager import BrowserManager, PerformanceProfile, APP_DIR, resolve_chromedriver
+
+# Каждый браузер пула получает собственный профиль, иначе Chrome не даст
+# запустить два экземпляра на одной папке --user-data-dir.
+POOL_PROFILES_DIR = os.path.join(APP_DIR, "chrome_profiles_pool")
+
+
+@dataclass
+class PooledDriver:
+    """Драйвер, выданный пулом. Хранит счётчики для решения о пересоздании."""
+
+    slot: int
+    manager: BrowserManager
+    driver: object
+    launch_seconds: float
+    launched_at: float = field(default_factory=time.monotonic)
+    pages: int = 0
+
+
+class BrowserPool:
+    """
+    Пул заранее запущенных браузеров с применёнными stealth-патчами.
+    Задачи берут драйвер (checkout) и возвращают его (checkin), вместо того чтобы
+    каждый раз запускать Xvfb, искать chromedriver и стартовать Chrome заново.
+    Драйверы проверяются при выдаче и пересоздаются после max_pages загруженных страниц.
+    """
+
+    def __init__(self, size: int = 2, max_pages: int = 50, logger_callback=print, use_virtual_display: bool = True,
+                 profiles_dir: str = POOL_PROFILES_DIR, performance_profile: PerformanceProfile | None = None,
+                 driver_path: str | None = None, allow_driver_download: bool = False, session_store=None
+                 ):
+        """
+        :param performance_profile: Облегчённый профиль Chrome для всех браузеров пула (см. BrowserManager).
+                                    Если профиль работает без Xvfb, общий дисплей не запускается.
+        :param driver_path: Закреплённый путь к chromedriver (иначе локальный кэш и PATH, см. resolve_chromedriver).
+        :param allow_driver_download: Разрешить загрузку chromedriver по сети, если локально его нет.
+        :param session_store: Сохранённая сессия сайта (SessionStore): восстанавливается в каждом новом браузере
+                              пула и обновляется скраперами, работающими на браузерах пула.
+        """
+
+        self.size = size
+        self.max_pages = max_pages
+        self.log = logger_callback
+        self.use_virtual_display = use_virtual_display and not (performance_profile and
+                                                                performance_profile.skip_virtual_display)
+        self.profiles_dir = profiles_dir
+        self.performance_profile = performance_profile
+        self.session_store = session_store
+
+        self.display = None
+        self.pinned_driver_path = driver_path
+        self.allow_driver_download = allow_driver_download
+        self.driver_path = None
+
+        self._idle: list[PooledDriver] = []
+        self._live = 0  # Сколько драйверов существует (свободные + выданные)
+        self._free_slots = list(range(size))
+        self._cond = threading.Condition()
+        self._started = False
+        self._closed = False
+
+        # Метрики
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._launches = 0
+        self._launch_total = 0.0
+        self._launch_max = 0.0
+        self._launch_failures = 0
+        self._recycles = 0
+        # Фазы запуска: общий дисплей и поиск драйвера - один раз на пул, остальное - сумма по запускам браузеров
+        self._startup_phases: dict[str, float] = { }
+
+    # --- Жизненный цикл пула ---
+
+    def start(self) -> "BrowserPool":
+        """Запускает общий виртуальный дисплей и заранее поднимает все драйверы пула."""
+
+        with self._cond:
+            if self._started:
+                return self
+            self._started = True
+
+        started = time.monotonic()
+        if self.use_virtual_display:
+            self.log("Пул: запуск общего виртуального дисплея...")
+            self.display = Display(visible=False, size=(1920, 1080))
+            self.display.start()
+            os.environ['DISPLAY'] = f':{self.display.display}'
+        self._startup_phases["display"] = time.monotonic() - started
+
+        # chromedriver ищем один раз на весь пул, без сети, если загрузка не разрешена
+        self.log("Пул: поиск chromedriver...")
+        started = time.monotonic()
+        self.driver_path = resolve_chromedriver(self.pinned_driver_path, self.allow_driver_download,
+                                                logger_callback=self.log
+                                                )
+        self._startup_phases["driver_resolve"] = time.monotonic() - started
+        self.log(f"Пул: дисплей {self._startup_phases['display']:.2f} с, "
+                 f"chromedriver {self._startup_phases['driver_resolve']:.2f} с.")
+
+        self.log(f"Пул: прогрев {self.size} браузеров...")
+        for _ in range(self.size):
+            with self._cond:
+                slot = self._free_slots.pop(0)
+                self._live += 1
+            pooled = self._launch(slot)
+            with self._cond:
+                if pooled:
+                    self._idle.append(pooled)
+                else:
+                    self._release_slot(slot)
+                self._cond.notify()
+
+        self.log(f"Пул: готово браузеров: {len(self._idle)}/{self.size}.")
+        return self
+
+    def close(self) -> None:
+        """Закрывает все свободные драйверы и дисплей. Выданные драйверы закрываются при возврате."""
+
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+
+        for pooled in idle:
+            self._quit(pooled)
+
+        if self.display:
+            self.log("Пул: остановка виртуального дисплея...")
+            self.display.stop()
+            self.display = None
+
+    def __enter__(self) -> "BrowserPool":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    # --- Выдача и возврат драйверов ---
+
+    def checkout(self, timeout: float | None = None) -> PooledDriver | None:
+        """
+        Выдаёт исправный драйвер из пула, при необходимости ожидая освобождения.
+
+        :param timeout: Максимальное время ожидания в секундах (None - без ограничения).
+        :return: PooledDriver или None, если дождаться драйвера не удалось.
+        """
+
+        if not self._started:
+            self.start()
+
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+
+        while True:
+            slot = None
+
+            with self._cond:
+                while not self._idle and not self._free_slots and not self._closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.log("Пул: не удалось дождаться свободного браузера.")
+                        return None
+                    self._cond.wait(remaining)
+
+                if self._closed:
+                    return None
+
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    # Какой-то драйвер ранее не удалось перезапустить - поднимаем его на месте
+                    pooled = None
+                    slot = self._free_slots.pop(0)
+                    self._live += 1
+
+            if pooled is None:
+                pooled = self._launch(slot)
+                if pooled is None:
+                    with self._cond:
+                        self._release_slot(slot)
+                    return None
+
+            elif not self._is_healthy(pooled):
+                self.log(f"Пул: браузер #{pooled.slot} не отвечает, пересоздаём.")
+                pooled = self._recycle(pooled)
+                if pooled is None:
+                    continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+            return pooled
+
+    def checkin(self, pooled: PooledDriver, pages: int = 0, healthy: bool = True) -> None:
+        """
+        Возвращает драйвер в пул.
+
+        :param pages: Сколько страниц было загружено за время аренды.
+        :param healthy: False, если задача завершилась ошибкой браузера - драйвер будет пересоздан.
+        """
+
+        pooled.pages += pages
+
+        if self._closed:
+            self._quit(pooled)
+            with self._cond:
+                self._release_slot(pooled.slot)
+            return
+
+        if not healthy or pooled.pages >= self.max_pages:
+            reason = "ошибка" if not healthy else f"лимит страниц ({pooled.pages})"
+            self.log(f"Пул: пересоздание браузера #{pooled.slot}, причина: {reason}.")
+            pooled = self._recycle(pooled)
+            if pooled is None:
+                return
+
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def lease(self, timeout: float | None = None):
+        """
+        Контекстный менеджер над checkout/checkin.
+        Вызывающий код может увеличить lease.pages, чтобы пул учёл загруженные страницы.
+        """
+
+        pooled = self.checkout(timeout)
+        if pooled is None:
+            yield None
+            return
+
+        healthy = True
+        try:
+            yield pooled
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            self.checkin(pooled, healthy=healthy)
+
+    # --- Метрики ---
+
+    def metrics(self) -> dict:
+        """Возвращает снимок метрик пула: время ожидания выдачи и стоимость холодного старта."""
+
+        with self._cond:
+            # Дисплей и драйвер - разовые фазы пула, запуск Chrome, stealth и сессия - в среднем на браузер
+            startup_phases = dict(self._startup_phases)
+            if self._launches:
+                for phase in ("chrome_launch", "stealth", "session_restore"):
+                    startup_phases[phase] /= self._launches
+            return {
+                    "size"                 : self.size,
+                    "live"                 : self._live,
+                    "idle"                 : len(self._idle),
+                    "in_use"               : self._live - len(self._idle),
+                    "checkouts"            : self._checkouts,
+                    "checkout_wait_avg_s"  : self._wait_total / self._checkouts if self._checkouts else 0.0,
+                    "checkout_wait_max_s"  : self._wait_max,
+                    "cold_starts"          : self._launches,
+                    "cold_start_avg_s"     : self._launch_total / self._launches if self._launches else 0.0,
+                    "cold_start_max_s"     : self._launch_max,
+                    "cold_start_failures"  : self._launch_failures,
+                    "recycles"             : self._recycles,
+                    "startup_phases_s"     : startup_phases,
+                    }
+
+    # --- Внутренние методы ---
+
+    def _launch(self, slot: int) -> PooledDriver | None:
+        """Запускает новый браузер в указанном слоте и замеряет стоимость холодного старта."""
+
+        profile_dir = os.path.join(self.profiles_dir, f"slot_{slot}")
+        os.makedirs(profile_dir, exist_ok=True)
+
+        manager = BrowserManager(logger_callback=self.log, use_virtual_display=False, user_data_dir=profile_dir,
+                                 driver_path=self.driver_path, performance_profile=self.performance_profile,
+                                 session_store=self.session_store
+                                 )
+        started = time.monotonic()
+        driver = manager.__enter__()
+        elapsed = time.monotonic() - started
+
+        with self._cond:
+            if driver is None:
+                self._launch_failures += 1
+                return None
+            self._launches += 1
+            self._launch_total += elapsed
+            for phase in ("chrome_launch", "stealth", "session_restore"):
+                self._startup_phases[phase] = (self._startup_phases.get(phase, 0.0)
+                                               + manager.startup_timings.get(phase, 0.0))
+            self._launch_max = max(self._launch_max, elapsed)
+
+        self.log(f"Пул: браузер #{slot} запущен за {elapsed:.1f} с.")
+        return PooledDriver(slot=slot, manager=manager, driver=driver, launch_seconds=elapsed)
+
+    def _recycle(self, pooled: PooledDriver) -> PooledDriver | None:
+        """Закрывает драйвер и запускает на его месте новый."""
+
+        self._quit(pooled)
+        with self._cond:
+            self._recycles += 1
+
+        fresh = self._launch(pooled.slot)
+        if fresh is None:
+            with self._cond:
+                self._release_slot(pooled.slot)
+        return fresh
+
+    def _release_slot(self, slot: int) -> None:
+        """Освобождает слот драйвера. Вызывается под self._cond."""
+
+        self._live -= 1
+        self._free_slots.append(slot)
+        self._cond.notify()
+
+    @staticmethod
+    def _is_healthy(pooled: PooledDriver) -> bool:
+        try:
+            _ = pooled.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _quit(self, pooled: PooledDriver) -> None:
+        try:
+            pooled.manager.__exit__(None, None, None)
+        except Exception as e:
+            self.log(f"Пул: ошибка при закрытии браузера #{pooled.slot}: {e}")
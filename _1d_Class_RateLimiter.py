@@ -0,0 +1,174 @@
+# _1d_Class_RateLimiter.py
+
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+# Сигналы, по которым темп снижается
+SIGNAL_CAPTCHA = "captcha"  # капча или страница блокировки
+SIGNAL_EMPTY = "empty"      # страница загрузилась, но нужные виджеты пустые
+SIGNAL_SLOW = "slow"        # ответ дольше slow_seconds
+SIGNAL_ERROR = "error"      # ошибка загрузки
+
+
+@dataclass
+class _DomainState:
+    tokens: float
+    last: float
+    rate: float  # текущий темп, запросов в секунду
+    started: float
+    loads: deque = field(default_factory=deque)  # время выданных токенов за последнее окно
+    requests: int = 0
+    penalties: dict = field(default_factory=dict)
+    waited: float = 0.0
+    last_decrease: float = float("-inf")
+
+
+class RateLimiter:
+    """
+    Адаптивный бюджет запросов по доменам: token bucket с паузами со случайным разбросом и AIMD-регулировкой.
+    Каждый успешный ответ немного повышает темп (аддитивно), капча, пустые виджеты или медленный ответ
+    снижают его в decrease_factor раз (мультипликативно). Один экземпляр разделяется всеми потоками
+    и скраперами, которые ходят на один сайт, поэтому параллельные драйверы в сумме не превышают темп.
+    """
+
+    def __init__(self, rate_per_minute: float = 30.0, burst: int = 2, min_rate_per_minute: float | None = None,
+                 max_rate_per_minute: float | None = None, increase_per_minute: float = 1.0,
+                 decrease_factor: float = 0.5, jitter: float = 0.3, slow_seconds: float = 10.0,
+                 decrease_cooldown: float = 5.0
+                 ):
+        """
+        :param rate_per_minute: Начальный темп загрузок страниц в минуту на один домен.
+        :param burst: Сколько запросов можно сделать подряд без ожидания.
+        :param min_rate_per_minute: Нижняя граница темпа (по умолчанию rate_per_minute / 5).
+        :param max_rate_per_minute: Верхняя граница темпа (по умолчанию rate_per_minute * 3).
+        :param increase_per_minute: На сколько запросов в минуту растёт темп после каждого успешного ответа.
+        :param decrease_factor: Во сколько раз умножается темп при сигнале блокировки или перегрузки.
+        :param jitter: Случайная добавка к паузе - доля интервала между запросами.
+        :param slow_seconds: Ответ дольше этого считается сигналом перегрузки.
+        :param decrease_cooldown: Повторные сигналы в течение стольких секунд темп больше не снижают
+                                  (несколько воркеров обычно получают капчу одновременно).
+        """
+
+        self.initial_rate = rate_per_minute / 60.0
+        self.min_rate = (min_rate_per_minute or rate_per_minute / 5) / 60.0
+        self.max_rate = (max_rate_per_minute or rate_per_minute * 3) / 60.0
+        self.increase = increase_per_minute / 60.0
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+        self.jitter = jitter
+        self.slow_seconds = slow_seconds
+        self.decrease_cooldown = decrease_cooldown
+        self.window = 60.0  # окно для расчёта фактического темпа, секунд
+
+        self._domains: dict[str, _DomainState] = { }
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def domain_of(url: str) -> str:
+        return urlparse(url).netloc or url
+
+    def _state(self, domain: str, now: float) -> _DomainState:
+        """Вызывается под self._lock."""
+
+        state = self._domains.get(domain)
+        if state is None:
+            state = _DomainState(tokens=float(self.burst), last=now, rate=self.initial_rate, started=now)
+            self._domains[domain] = state
+        return state
+
+    def acquire(self, url: str) -> float:
+        """
+        Резервирует токен для домена URL и ждёт, пока он станет доступен, плюс случайная добавка.
+
+        :return: Сколько секунд пришлось ждать.
+        """
+
+        domain = self.domain_of(url)
+
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(domain, now)
+            state.tokens = min(float(self.burst), state.tokens + (now - state.last) * state.rate)
+            state.last = now
+            # Токен резервируется сразу: отрицательный баланс означает очередь ожидающих
+            state.tokens -= 1.0
+            wait = -state.tokens / state.rate if state.tokens < 0 else 0.0
+            # Разброс пауз, чтобы запросы не шли с машинной регулярностью
+            wait += random.uniform(0, self.jitter) / state.rate
+
+            state.requests += 1
+            state.waited += wait
+            state.loads.append(now + wait)
+            while state.loads and state.loads[0] < now - self.window:
+                state.loads.popleft()
+
+        time.sleep(wait)
+        return wait
+
+    def report(self, url: str, signal: str | None = None, elapsed: float | None = None) -> str | None:
+        """
+        Сообщает результат запроса. Без сигнала - успех, темп растёт на increase_per_minute.
+        Сигнал (SIGNAL_CAPTCHA, SIGNAL_EMPTY, SIGNAL_ERROR) или elapsed > slow_seconds снижает темп.
+
+        :param elapsed: Время ответа в секундах, если измерялось.
+        :return: Сообщение для лога, если темп был снижен, иначе None.
+        """
+
+        if signal is None and elapsed is not None and elapsed > self.slow_seconds:
+            signal = SIGNAL_SLOW
+
+        domain = self.domain_of(url)
+        message = None
+
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(domain, now)
+
+            if signal is None:
+                state.rate = min(self.max_rate, state.rate + self.increase)
+            else:
+                state.penalties[signal] = state.penalties.get(signal, 0) + 1
+                if now - state.last_decrease >= self.decrease_cooldown:
+                    state.rate = max(self.min_rate, state.rate * self.decrease_factor)
+                    state.last_decrease = now
+                    # Накопленный запас токенов сгорает: после сигнала пачкой не ходим
+                    state.tokens = min(state.tokens, 0.0)
+                    message = f"Темп для {domain} снижен до {state.rate * 60:.1f} стр/мин (сигнал: {signal})."
+
+        return message
+
+    def stats(self) -> dict[str, dict]:
+        """Статистика по доменам: текущий разрешённый и фактический темп (страниц в минуту), ожидание, сигналы."""
+
+        with self._lock:
+            now = time.monotonic()
+            result = { }
+
+            for domain, state in self._domains.items():
+                recent = [moment for moment in state.loads if now - self.window <= moment <= now]
+                span = max(1.0, min(self.window, now - state.started))
+                result[domain] = {
+                        "rate_per_minute"    : round(state.rate * 60, 1),
+                        "achieved_per_minute": round(len(recent) * 60.0 / span, 1),
+                        "requests"           : state.requests,
+                        "waited_s"           : round(state.waited, 1),
+                        "penalties"          : dict(state.penalties),
+                        }
+
+            return result
+
+    def describe(self) -> str:
+        """Строка для лога: темп по каждому домену."""
+
+        return "; ".join(f"{domain}: {domain_stats['achieved_per_minute']} стр/мин "
+                         f"(разрешено {domain_stats['rate_per_minute']}, "
+                         f"сигналов {sum(domain_stats['penalties'].values())})"
+                         for domain, domain_stats in self.stats().items())
+
+
+# Общий бюджет процесса для ozon.ru
+DEFAULT_RATE_LIMITER = RateLimiter()
@@ -0,0 +1,119 @@
+# _1e_Class_FetchBackends.py
+
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import html as lxml_html
+
+from _1b_Class_OzonScraper import OzonScraper, PRODUCT_PAGE_SPEC
+from _1h_Class_PageExtractor import PageExtractor
+
+
+class FetchBackend:
+    """
+    Интерфейс бэкенда загрузки страницы товара.
+    fetch_product возвращает словарь той же структуры, что OzonScraper.parse_product_page,
+    или None, если извлечь данные не удалось (тогда OzonScraper переходит на Selenium).
+    """
+
+    name = "base"
+
+    def fetch_product(self, url: str) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SeleniumFetchBackend(FetchBackend):
+    """Бэкенд поверх браузера. Нужен в первую очередь для сравнения с лёгким бэкендом в бенчмарках."""
+
+    name = "selenium"
+
+    def __init__(self, scraper: OzonScraper):
+        self.scraper = scraper
+
+    def fetch_product(self, url: str) -> dict[str, Any] | None:
+        product_data = self.scraper.parse_product_page_selenium(url)
+        return product_data if product_data["title"] else None
+
+
+class HttpFetchBackend(FetchBackend):
+    """
+    Лёгкий бэкенд: пул keep-alive HTTP-соединений (requests.Session) и разбор HTML через lxml.
+    Не исполняет JavaScript, поэтому работает только там, где нужные виджеты есть в исходном HTML.
+    Поля берутся из той же спецификации PRODUCT_PAGE_SPEC, что и в браузере (по XPath).
+    Экземпляр можно разделять между потоками.
+    """
+
+    name = "http"
+
+    DEFAULT_HEADERS = {
+            "User-Agent"     : "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                               "(KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
+            "Accept"         : "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "ru-RU,ru;q=0.9",
+            }
+
+    def __init__(self, timeout: float = 10.0, pool_size: int = 10, logger_callback=print):
+        """
+        :param timeout: Таймаут одного HTTP-запроса в секундах.
+        :param pool_size: Максимум keep-alive соединений на хост.
+        """
+
+        self.timeout = timeout
+        self.log = logger_callback
+
+        self.session = requests.Session()
+        self.session.headers.update(self.DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch_product(self, url: str) -> dict[str, Any] | None:
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.log(f"  - HTTP-запрос не удался {url}: {e}")
+            return None
+
+        if response.status_code != 200:
+            self.log(f"  - HTTP {response.status_code} для {url}")
+            return None
+
+        return self.parse_product_html(response.content, url)
+
+    def parse_product_html(self, content: bytes | str, url: str) -> dict[str, Any] | None:
+        """Извлекает product_data из HTML. Без названия или цены страница считается неразобранной."""
+
+        product_data = OzonScraper.empty_product_data(url)
+
+        try:
+            tree = lxml_html.fromstring(content)
+        except Exception as e:
+            self.log(f"  - Ошибка разбора HTML {url}: {e}")
+            return None
+
+        texts = { name: self._first_text(tree, field.xpath) for name, field in PRODUCT_PAGE_SPEC.fields.items() }
+        values, errors = PageExtractor.apply(PRODUCT_PAGE_SPEC, texts)
+        product_data.update(values)
+
+        for name, error in errors.items():
+            self.log(f"  - Поле '{name}' не разобрано в HTML {url}: {error}")
+
+        if not product_data["title"] or product_data["price"] is None:
+            return None
+
+        return product_data
+
+    @staticmethod
+    def _first_text(tree, xpath: str) -> str | None:
+        nodes = tree.xpath(xpath)
+        if not nodes:
+            return None
+        # Схлопываем пробелы так же, как их отображает браузер в element.text
+        return " ".join(nodes[0].text_content().split()) or None
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,174 @@
+# _1f_Class_ProductCache.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.path.join(APP_DIR, "cache", "products.sqlite3")
+
+# Время жизни полей в секундах: цена устаревает быстрее названия
+DEFAULT_FIELD_TTL = {
+        "title"        : 7 * 24 * 3600,
+        "price"        : 30 * 60,
+        "rating"       : 24 * 3600,
+        "reviews_count": 6 * 3600,
+        }
+DEFAULT_TTL = 3600  # для полей, которых нет в таблице TTL
+
+
+class ProductCache:
+    """
+    Кэш разобранных страниц товара на диске (SQLite), ключ - нормализованный URL товара.
+    У каждого поля своё время записи и свой TTL. Запись считается попаданием, только если
+    все поля свежие. При превышении max_entries вытесняются давно не читавшиеся записи (LRU).
+    Экземпляр можно разделять между потоками, файл - между процессами (режим WAL).
+    """
+
+    def __init__(self, path: str = CACHE_PATH, field_ttl: dict[str, float] | None = None, max_entries: int = 20000):
+        self.path = path
+        self.field_ttl = { **DEFAULT_FIELD_TTL, **(field_ttl or { }) }
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS product_cache (
+                url         TEXT PRIMARY KEY,
+                data        TEXT NOT NULL,
+                field_times TEXT NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_product_cache_access ON product_cache (last_access)")
+        self._conn.commit()
+
+    def _ttl(self, field: str) -> float:
+        return self.field_ttl.get(field, DEFAULT_TTL)
+
+    def get(self, url: str) -> dict[str, Any] | None:
+        """Возвращает product_data из кэша или None, если записи нет или хотя бы одно поле устарело."""
+
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute("SELECT data, field_times FROM product_cache WHERE url = ?", (url,)).fetchone()
+
+            fresh = False
+            if row:
+                data, field_times = json.loads(row[0]), json.loads(row[1])
+                fresh = all(now - field_times.get(field, 0) < self._ttl(field) for field in data if field != "url")
+
+            if fresh:
+                self.hits += 1
+                self._conn.execute("UPDATE product_cache SET last_access = ? WHERE url = ?", (now, url))
+                self._conn.commit()
+                return data
+
+            self.misses += 1
+            return None
+
+    def put(self, url: str, product_data: dict[str, Any]) -> None:
+        """
+        Сохраняет product_data. Непустые значения перезаписывают старые; пустое значение (None)
+        не затирает ещё свежее значение из кэша - частичная ошибка парсинга не портит кэш.
+        """
+
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute("SELECT data, field_times FROM product_cache WHERE url = ?", (url,)).fetchone()
+            old_data, old_times = (json.loads(row[0]), json.loads(row[1])) if row else ({ }, { })
+
+            data, field_times = { }, { }
+            for field, value in product_data.items():
+                old_fresh = now - old_times.get(field, 0) < self._ttl(field)
+                if value is None and old_data.get(field) is not None and old_fresh:
+                    data[field], field_times[field] = old_data[field], old_times[field]
+                else:
+                    data[field], field_times[field] = value, now
+
+            self._conn.execute(
+                    "INSERT OR REPLACE INTO product_cache (url, data, field_times, last_access) VALUES (?, ?, ?, ?)",
+                    (url, json.dumps(data, ensure_ascii=False), json.dumps(field_times), now)
+                    )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Удаляет давно не читавшиеся записи сверх max_entries. Вызывается под self._lock."""
+
+        count = self._conn.execute("SELECT COUNT(*) FROM product_cache").fetchone()[0]
+        excess = count - self.max_entries
+
+        if excess > 0:
+            self._conn.execute(
+                    "DELETE FROM product_cache WHERE url IN "
+                    "(SELECT url FROM product_cache ORDER BY last_access LIMIT ?)", (excess,)
+                    )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM product_cache").fetchone()[0]
+            return { "hits": self.hits, "misses": self.misses, "entries": entries }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LinkCache:
+    """
+    Короткоживущий кэш результатов поиска в памяти: нормализованный запрос -> собранные ссылки.
+    Повторный поиск в пределах TTL не запускает прокрутку выдачи.
+    Запись подходит, если в ней не меньше ссылок, чем просят, или она собрана с не меньшими параметрами.
+    """
+
+    def __init__(self, ttl: float = 10 * 60, max_entries: int = 500):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[str, tuple[float, int, int, list[str]]] = { }  # запрос -> (время, pages, max, ссылки)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.casefold().split())
+
+    def get(self, query: str, pages: int, max_products: int) -> list[str] | None:
+        key = self.normalize_query(query)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry:
+                stored_at, stored_pages, stored_max, links = entry
+                fresh = time.time() - stored_at < self.ttl
+                enough = len(links) >= max_products or (stored_pages >= pages and stored_max >= max_products)
+                if fresh and enough:
+                    self.hits += 1
+                    return links[:max_products]
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, pages: int, max_products: int, links: list[str]) -> None:
+        key = self.normalize_query(query)
+
+        with self._lock:
+            self._entries[key] = (time.time(), pages, max_products, list(links))
+
+            if len(self._entries) > self.max_entries:
+                # Вытесняем самые старые записи
+                for old_key, _ in sorted(self._entries.items(), key=lambda item: item[1][0])[:-self.max_entries]:
+                    del self._entries[old_key]
@@ -0,0 +1,148 @@
+# _1g_Class_CheckpointStore.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINTS_DIR = os.path.join(APP_DIR, "cache", "checkpoints")
+
+
+class Checkpoint:
+    """
+    Контрольная точка одного сценария: собранные ссылки (фронтир), уже разобранные товары
+    и служебные данные сценария (meta, например оценки похожести аналогов).
+    Файл - журнал JSON-строк, который только дописывается: одна короткая строка на товар,
+    без перезаписи файла и fsync на каждой странице. Недописанная последняя строка
+    (аварийное завершение) при чтении пропускается.
+    Методы можно вызывать из нескольких потоков.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.links: list[str] | None = None
+        self.results: dict[str, dict[str, Any]] = { }
+        self.meta: dict[str, Any] = { }
+        self._lock = threading.Lock()
+
+        torn = False
+        if os.path.exists(path):
+            torn = self._load()
+
+        self._file = open(path, 'a', encoding='utf-8')
+        if torn:
+            # Недописанную строку закрываем, чтобы следующая запись начиналась с новой строки
+            self._file.write("\n")
+
+    def _load(self) -> bool:
+        """Читает журнал. Возвращает True, если последняя строка недописана."""
+
+        line = "\n"
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if record["t"] == "links":
+                    self.links = record["links"]
+                elif record["t"] == "result":
+                    self.results[record["data"]["url"]] = record["data"]
+                elif record["t"] == "meta":
+                    self.meta[record["key"]] = record["value"]
+
+        return not line.endswith("\n")
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def save_links(self, links: list[str]) -> None:
+        self.links = list(links)
+        self._append({ "t": "links", "links": self.links })
+
+    def save_meta(self, key: str, value: Any) -> None:
+        """Запоминает служебное значение сценария (последняя запись с тем же ключом побеждает)."""
+
+        self.meta[key] = value
+        self._append({ "t": "meta", "key": key, "value": value })
+
+    def save_result(self, product_data: dict[str, Any]) -> None:
+        """Запоминает разобранный товар. Страницы без названия не сохраняются - при возобновлении их парсят заново."""
+
+        if not product_data.get("title"):
+            return
+
+        self.results[product_data["url"]] = product_data
+        self._append({ "t": "result", "data": product_data })
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def complete(self) -> None:
+        """Сценарий завершён - контрольная точка больше не нужна."""
+
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CheckpointStore:
+    """
+    Каталог контрольных точек сценариев. Ключ - тип сценария, нормализованный вход и параметры,
+    поэтому перезапущенная после сбоя задача с теми же параметрами продолжает с места остановки.
+    scope - пространство ключей владельца (пакета, задачи): одинаковые входы разных владельцев
+    получают разные файлы и не продолжают и не перезаписывают чужой прогресс.
+    Контрольные точки старше max_age секунд не используются: выдача и цены за это время устаревают.
+    """
+
+    def __init__(self, directory: str = CHECKPOINTS_DIR, max_age: float = 24 * 3600):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        self.cleanup()
+
+    def path_for(self, *key: Any, scope: str | None = None) -> str:
+        if scope is not None:
+            key = (scope, *key)
+        digest = hashlib.sha1(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.directory, f"{digest}.jsonl")
+
+    def open(self, *key: Any, scope: str | None = None) -> Checkpoint:
+        """
+        Открывает контрольную точку по ключу, например open("query", запрос, pages, max_products).
+        Устаревшая контрольная точка удаляется, и сценарий начинается заново.
+
+        :param scope: Пространство ключей владельца, например имя пакета. None - общее пространство (CLI).
+        """
+
+        path = self.path_for(*key, scope=scope)
+
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) > self.max_age:
+            os.remove(path)
+
+        return Checkpoint(path)
+
+    def cleanup(self) -> int:
+        """Удаляет устаревшие контрольные точки и возвращает их количество."""
+
+        removed = 0
+        now = time.time()
+
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(".jsonl") and now - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                removed += 1
+
+        return removed
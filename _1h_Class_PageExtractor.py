@@ -0,0 +1,120 @@
+# _1h_Class_PageExtractor.py
+
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from _1i_Class_Metrics import DEFAULT_METRICS
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """
+    Поле страницы: где взять текст и как превратить его в значения результата.
+
+    :param selector: CSS-селектор для браузера.
+    :param parse: Текст элемента -> словарь значений, например { "price": 1299 }.
+    :param outputs: Ключи результата, которые заполняет parse (при ошибке они остаются None).
+    :param required: Страница готова к извлечению, когда все обязательные поля на ней появились.
+    :param xpath: Тот же элемент в виде XPath - для разбора HTML без браузера (lxml без cssselect).
+    """
+
+    selector: str
+    parse: Callable[[str], dict[str, Any]]
+    outputs: tuple[str, ...]
+    required: bool = False
+    xpath: str | None = None
+
+
+@dataclass(frozen=True)
+class PageSpec:
+    """Декларативное описание типа страницы: набор полей по именам."""
+
+    name: str
+    fields: dict[str, FieldSpec]
+
+    @property
+    def required(self) -> list[str]:
+        return [name for name, field in self.fields.items() if field.required]
+
+
+class PageExtractor:
+    """
+    Извлекает все поля страницы одной командой браузеру: скрипт ждёт, пока появятся обязательные поля
+    (но не дольше timeout), и возвращает тексты всех полей в JSON. Тексты разбираются обработчиками полей,
+    ошибка в одном поле даёт None только в нём и не мешает остальным.
+    """
+
+    # Ожидание готовности и чтение всех полей за один вызов execute_async_script
+    EXTRACT_JS = """
+        const [selectors, required, timeoutMs] = arguments;
+        const done = arguments[arguments.length - 1];
+        const started = Date.now();
+        const read = () => {
+            const values = {};
+            for (const [name, selector] of Object.entries(selectors)) {
+                const element = document.querySelector(selector);
+                const text = element ? (element.innerText || element.textContent || '').trim() : '';
+                values[name] = text || null;
+            }
+            return values;
+        };
+        const tick = () => {
+            const values = read();
+            const ready = required.every(name => values[name] !== null);
+            if (ready || Date.now() - started >= timeoutMs) {
+                done({ ready: ready, values: values });
+            } else {
+                setTimeout(tick, 100);
+            }
+        };
+        tick();
+    """
+
+    def __init__(self, timeout: float = 5.0):
+        """
+        :param timeout: Сколько секунд ждать обязательных полей.
+        """
+
+        self.timeout = timeout
+
+    def extract(self, driver, spec: PageSpec) -> tuple[dict[str, Any], dict[str, str], bool]:
+        """
+        Извлекает поля открытой в браузере страницы.
+
+        :return: (значения, ошибки по полям, появились ли все обязательные поля)
+        """
+
+        selectors = { name: field.selector for name, field in spec.fields.items() }
+        result = driver.execute_async_script(self.EXTRACT_JS, selectors, spec.required, int(self.timeout * 1000))
+        values, errors = self.apply(spec, result["values"])
+        return values, errors, result["ready"]
+
+    @staticmethod
+    def apply(spec: PageSpec, texts: dict[str, str | None]) -> tuple[dict[str, Any], dict[str, str]]:
+        """
+        Разбирает тексты полей обработчиками спецификации и считает результат по каждому полю
+        (счётчик ozon_field_extractions: ok, missing, error).
+
+        :return: (значения по ключам результата, ошибки по полям). Отсутствующие и неразобранные поля - None.
+        """
+
+        values = { }
+        errors = { }
+
+        for name, field in spec.fields.items():
+            for output in field.outputs:
+                values[output] = None
+
+            text = texts.get(name)
+            if text is None:
+                DEFAULT_METRICS.count("ozon_field_extractions", page=spec.name, field=name, outcome="missing")
+                continue
+
+            try:
+                values.update(field.parse(text))
+                DEFAULT_METRICS.count("ozon_field_extractions", page=spec.name, field=name, outcome="ok")
+            except Exception as e:
+                errors[name] = f"{type(e).__name__}: {e}"
+                DEFAULT_METRICS.count("ozon_field_extractions", page=spec.name, field=name, outcome="error")
+
+        return values, errors
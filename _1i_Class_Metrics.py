@@ -0,0 +1,180 @@
+# _1i_Class_Metrics.py
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограммы длительности этапов, секунд
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Описания счётчиков для /metrics
+COUNTER_DESCRIPTIONS = {
+        "ozon_field_extractions": "Результат извлечения полей страницы: ok, missing, error",
+        "ozon_product_pages"    : "Разобранные страницы товара по источнику данных",
+        "ozon_links_collected"  : "Ссылки, собранные из поисковой выдачи",
+        }
+
+
+class _NullSpan:
+    """Замер-пустышка для отключённых метрик: ни вызовов time, ни блокировок."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class StageMetrics:
+    """
+    Метрики этапов парсинга в одном процессе: гистограммы длительности (запуск браузера, прокрутка выдачи,
+    загрузка и разбор страницы, сохранение файлов) и счётчики (например, результат извлечения каждого поля).
+    Снимок snapshot() - обычный словарь: рабочие процессы отправляют его в главный, где снимки
+    складываются и отдаются в формате Prometheus (см. render_prometheus).
+    Отключённые метрики (enabled=False) сводятся к одной проверке флага на вызов.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: tuple[float, ...] = DURATION_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        # этап -> [счётчики по корзинам (+ корзина +Inf), сумма, количество, ошибок]
+        self._histograms: dict[str, list] = { }
+        # (имя, метки) -> значение
+        self._counters: dict[tuple, float] = { }
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, failed: bool = False) -> None:
+        """Записывает длительность этапа."""
+
+        if not self.enabled:
+            return
+
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0]
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            histogram[3] += failed
+
+    def span(self, stage: str):
+        """Контекстный менеджер замера этапа; исключение внутри блока считается ошибкой этапа."""
+
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(stage)
+
+    @contextmanager
+    def _span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - started, failed=True)
+            raise
+        self.observe(stage, time.perf_counter() - started)
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        """Увеличивает счётчик name с метками labels."""
+
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self) -> dict:
+        """Накопленные значения в виде словаря, пригодного для передачи между процессами и сложения."""
+
+        with self._lock:
+            return {
+                    "buckets"   : list(self.buckets),
+                    "histograms": { stage: { "buckets": list(histogram[0]), "sum": histogram[1],
+                                             "count"  : histogram[2], "failed": histogram[3] }
+                                    for stage, histogram in self._histograms.items() },
+                    "counters"  : [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                    }
+
+
+def merge_snapshots(snapshots: list[dict]) -> dict:
+    """Складывает снимки нескольких процессов (границы корзин у всех одинаковые)."""
+
+    merged = { "buckets": list(DURATION_BUCKETS), "histograms": { }, "counters": [] }
+    counters = { }
+
+    for snapshot in snapshots:
+        if not snapshot:
+            continue
+        merged["buckets"] = snapshot["buckets"]
+
+        for stage, histogram in snapshot["histograms"].items():
+            total = merged["histograms"].setdefault(stage, { "buckets": [0] * len(histogram["buckets"]), "sum": 0.0,
+                                                             "count"  : 0, "failed": 0 })
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+            for key in ("sum", "count", "failed"):
+                total[key] += histogram[key]
+
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+
+    merged["counters"] = [[name, dict(labels), value] for (name, labels), value in counters.items()]
+    return merged
+
+
+def render_prometheus(snapshot: dict, gauges: dict[str, tuple[str, float]]) -> bytes:
+    """
+    Текст для /metrics в формате Prometheus.
+
+    :param snapshot: Сложенный снимок метрик этапов (merge_snapshots).
+    :param gauges: Имя -> (описание, значение), например { "ozon_jobs_active": ("Задачи в работе", 2) }.
+    """
+
+    from prometheus_client import CollectorRegistry, generate_latest
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+
+    class _SnapshotCollector:
+        def collect(self):
+            durations = HistogramMetricFamily("ozon_stage_duration_seconds", "Длительность этапов парсинга",
+                                              labels=["stage"]
+                                              )
+            failures = CounterMetricFamily("ozon_stage_failures", "Этапы, завершившиеся ошибкой", labels=["stage"])
+
+            for stage, histogram in sorted(snapshot["histograms"].items()):
+                cumulative = 0
+                buckets = []
+                for bound, bucket_count in zip(list(snapshot["buckets"]) + [float("inf")], histogram["buckets"]):
+                    cumulative += bucket_count
+                    buckets.append(("+Inf" if bound == float("inf") else str(bound), cumulative))
+                durations.add_metric([stage], buckets, histogram["sum"])
+                failures.add_metric([stage], histogram["failed"])
+
+            yield durations
+            yield failures
+
+            counters = { }
+            for name, labels, value in snapshot["counters"]:
+                family = counters.get(name)
+                if family is None:
+                    documentation = COUNTER_DESCRIPTIONS.get(name, name)
+                    family = counters[name] = CounterMetricFamily(name, documentation, labels=sorted(labels))
+                family.add_metric([labels[label] for label in sorted(labels)], value)
+            yield from counters.values()
+
+            for name, (documentation, value) in gauges.items():
+                yield GaugeMetricFamily(name, documentation, value=value)
+
+    registry = CollectorRegistry()
+    registry.register(_SnapshotCollector())
+    return generate_latest(registry)
+
+
+# Метрики процесса. METRICS_ENABLED=0 отключает замеры (рабочие процессы наследуют переменную окружения).
+DEFAULT_METRICS = StageMetrics(enabled=os.getenv("METRICS_ENABLED", "1") == "1")
@@ -0,0 +1,250 @@
+# _1j_Class_PriceHistory.py
+"""
+История цен товаров в локальной базе SQLite: каждый результат сценария дописывается в неё,
+а изменения цены, рейтинга и числа отзывов сохраняются как временной ряд по URL товара.
+
+Запросы из командной строки (из корня проекта):
+    python -m _1j_Class_PriceHistory history https://www.ozon.ru/product/...-123456/
+    python -m _1j_Class_PriceHistory drops --percent 15 --since-hours 48
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PRICE_HISTORY_PATH = os.path.join(APP_DIR, "cache", "price_history.sqlite3")
+
+# Отслеживаемые поля и их типы в базе
+TRACKED_FIELDS = {
+        "price"        : int,
+        "rating"       : float,
+        "reviews_count": int,
+        }
+# Размер порции URL в одном запросе текущих значений (лимит параметров SQLite)
+_LOOKUP_CHUNK = 500
+
+
+class PriceHistory:
+    """
+    Хранилище истории цен (SQLite), ключ - нормализованный URL товара.
+
+    products - текущее состояние товара и предыдущая цена (для быстрого поиска подешевевших товаров),
+    observations - только изменившиеся значения: строка пишется, если цена, рейтинг или число отзывов
+    отличаются от последних известных. Каждый вызов record() - отдельный запуск (таблица runs).
+    Пустое значение (None) не считается изменением и не затирает известное - ошибка парсинга не портит историю.
+    Экземпляр можно разделять между потоками, файл - между процессами (режим WAL).
+    """
+
+    def __init__(self, path: str = PRICE_HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL,
+                source     TEXT,
+                products   INTEGER NOT NULL DEFAULT 0,
+                changed    INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS products (
+                url               TEXT PRIMARY KEY,
+                title             TEXT,
+                price             INTEGER,
+                rating            REAL,
+                reviews_count     INTEGER,
+                previous_price    INTEGER,
+                price_changed_at  REAL,
+                price_changed_run INTEGER,
+                first_seen        REAL NOT NULL,
+                last_seen         REAL NOT NULL,
+                last_run          INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS observations (
+                url           TEXT NOT NULL,
+                run_id        INTEGER NOT NULL,
+                observed_at   REAL NOT NULL,
+                price         INTEGER,
+                rating        REAL,
+                reviews_count INTEGER,
+                PRIMARY KEY (url, run_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_products_price_changed ON products (price_changed_at);
+            CREATE INDEX IF NOT EXISTS idx_observations_run ON observations (run_id);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        """Как OzonScraper.normalize_product_url: без параметров запроса."""
+        return url.split("?")[0]
+
+    @staticmethod
+    def _tracked_values(product_data: dict[str, Any]) -> dict[str, Any]:
+        values = { }
+        for field, cast in TRACKED_FIELDS.items():
+            value = product_data.get(field)
+            # NaN из DataFrame - тоже пустое значение
+            values[field] = None if value is None or value != value else cast(value)
+        return values
+
+    def _current(self, urls: list[str]) -> dict[str, sqlite3.Row]:
+        """Текущие значения товаров по списку URL. Вызывается под self._lock."""
+
+        current = { }
+        for start in range(0, len(urls), _LOOKUP_CHUNK):
+            chunk = urls[start:start + _LOOKUP_CHUNK]
+            rows = self._conn.execute(
+                    f"SELECT * FROM products WHERE url IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+            current.update((row["url"], row) for row in rows)
+        return current
+
+    def record(self, results: Iterable[dict[str, Any]], source: str | None = None) -> dict:
+        """
+        Дописывает результаты одного запуска сценария (список product_data или строки DataFrame).
+
+        :param source: Описание запуска (запрос или URL) для таблицы runs.
+        :return: { 'run_id', 'products' (товаров в запуске), 'changed' (записано изменений) }.
+        """
+
+        products = { }
+        for product_data in results:
+            if product_data.get("url") and product_data.get("title"):
+                products[self.normalize_url(product_data["url"])] = product_data
+
+        now = time.time()
+
+        with self._lock:
+            run_id = self._conn.execute("INSERT INTO runs (started_at, source) VALUES (?, ?)", (now, source)).lastrowid
+            current = self._current(list(products))
+
+            upserts, observations = [], []
+            for url, product_data in products.items():
+                values = self._tracked_values(product_data)
+                old = current.get(url)
+
+                if old is not None:
+                    # Пустое значение не затирает известное
+                    values = { field: old[field] if value is None else value for field, value in values.items() }
+                changed = old is None or any(values[field] != old[field] for field in TRACKED_FIELDS)
+
+                previous_price = old["previous_price"] if old is not None else None
+                price_changed_at = old["price_changed_at"] if old is not None else None
+                price_changed_run = old["price_changed_run"] if old is not None else None
+                if old is not None and old["price"] is not None and values["price"] != old["price"]:
+                    previous_price, price_changed_at, price_changed_run = old["price"], now, run_id
+
+                upserts.append((url, product_data["title"], values["price"], values["rating"],
+                                values["reviews_count"], previous_price, price_changed_at, price_changed_run, now, now,
+                                run_id))
+                if changed and any(value is not None for value in values.values()):
+                    observations.append((url, run_id, now, values["price"], values["rating"],
+                                         values["reviews_count"]))
+
+            self._conn.executemany("""
+                INSERT INTO products (url, title, price, rating, reviews_count, previous_price, price_changed_at,
+                                      price_changed_run, first_seen, last_seen, last_run)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    title = excluded.title, price = excluded.price, rating = excluded.rating,
+                    reviews_count = excluded.reviews_count, previous_price = excluded.previous_price,
+                    price_changed_at = excluded.price_changed_at, price_changed_run = excluded.price_changed_run,
+                    last_seen = excluded.last_seen, last_run = excluded.last_run
+            """, upserts)
+            self._conn.executemany(
+                    "INSERT INTO observations (url, run_id, observed_at, price, rating, reviews_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", observations
+                    )
+            self._conn.execute("UPDATE runs SET products = ?, changed = ? WHERE id = ?",
+                               (len(upserts), len(observations), run_id)
+                               )
+            self._conn.commit()
+
+        return { "run_id": run_id, "products": len(upserts), "changed": len(observations) }
+
+    def history(self, url: str) -> list[dict[str, Any]]:
+        """Изменения цены, рейтинга и числа отзывов товара по времени (от старых к новым)."""
+
+        with self._lock:
+            rows = self._conn.execute(
+                    "SELECT observed_at, run_id, price, rating, reviews_count FROM observations "
+                    "WHERE url = ? ORDER BY run_id", (self.normalize_url(url),)
+                    ).fetchall()
+        return [dict(row) for row in rows]
+
+    def price_drops(self, min_percent: float = 10.0, since: float | None = None,
+                    limit: int = 100) -> list[dict[str, Any]]:
+        """
+        Товары, подешевевшие с прошлого запуска не меньше чем на min_percent процентов: цена изменилась
+        в последнем запуске, где встречался товар, и стала ниже прежней. Самые сильные снижения - первыми.
+
+        :param since: Вместо последнего запуска - последние снижения цены не раньше этого времени (timestamp),
+                      даже если в следующих запусках цена не менялась.
+        """
+
+        changed = "price_changed_run = last_run" if since is None else "price_changed_at >= :since"
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT url, title, previous_price, price, price_changed_at,
+                       ROUND(100.0 * (previous_price - price) / previous_price, 1) AS drop_percent
+                FROM products
+                WHERE {changed} AND previous_price > 0
+                  AND price <= previous_price * (1 - :percent / 100.0)
+                ORDER BY drop_percent DESC
+                LIMIT :limit
+            """, { "since": since, "percent": min_percent, "limit": limit }).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            products = self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            observations = self._conn.execute("SELECT COUNT(*) FROM observations").fetchone()[0]
+            runs = self._conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+            return { "products": products, "observations": observations, "runs": runs }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="История цен товаров Ozon")
+    parser.add_argument("--db", default=PRICE_HISTORY_PATH, help="Файл базы истории цен")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    history_parser = commands.add_parser("history", help="Изменения цены товара по URL")
+    history_parser.add_argument("url")
+
+    drops_parser = commands.add_parser("drops", help="Товары, подешевевшие с прошлого запуска")
+    drops_parser.add_argument("--percent", type=float, default=10.0, help="Минимальное снижение цены, %%")
+    drops_parser.add_argument("--since-hours", type=float, default=None,
+                              help="Вместо прошлого запуска - снижения за последние столько часов")
+    drops_parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    price_history = PriceHistory(args.db)
+    try:
+        if args.command == "history":
+            rows = price_history.history(args.url)
+        else:
+            since = time.time() - args.since_hours * 3600 if args.since_hours is not None else None
+            rows = price_history.price_drops(args.percent, since, args.limit)
+    finally:
+        price_history.close()
+
+    print(json.dumps(rows, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
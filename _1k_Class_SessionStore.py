@@ -0,0 +1,179 @@
+# _1k_Class_SessionStore.py
+
+import json
+import os
+import threading
+import time
+from typing import Any
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSION_PATH = os.path.join(APP_DIR, "cache", "session_state.json")
+
+# Переносит localStorage сессии в страницу до выполнения её скриптов (только для сохранённого origin и только
+# ключи, которых ещё нет - свежие значения сайта не затираются)
+RESTORE_STORAGE_JS = """
+    (() => {
+        const origin = %s;
+        const items = %s;
+        if (location.origin !== origin) {
+            return;
+        }
+        try {
+            for (const [key, value] of Object.entries(items)) {
+                if (localStorage.getItem(key) === null) {
+                    localStorage.setItem(key, value);
+                }
+            }
+        } catch (e) {}
+    })();
+"""
+
+# Снимок состояния открытой страницы: origin и содержимое localStorage
+CAPTURE_STORAGE_JS = """
+    const items = {};
+    for (let i = 0; i < localStorage.length; i++) {
+        const key = localStorage.key(i);
+        items[key] = localStorage.getItem(key);
+    }
+    return { origin: location.origin, items: items };
+"""
+
+
+class SessionStore:
+    """
+    Состояние сессии сайта (cookies и localStorage) на диске: после успешного сбора выдачи оно сохраняется,
+    а новый браузер получает его до первой загрузки страницы - без окна cookies и с «прогретой» сессией.
+
+    Сессия старше max_age не восстанавливается. Сессия старше refresh_after обновляется из работающего
+    браузера: снимок берётся за две быстрые команды, запись на диск идёт в фоновом потоке.
+    Файл можно разделять между процессами (запись через временный файл и os.replace).
+    """
+
+    def __init__(self, path: str = SESSION_PATH, max_age: float = 12 * 3600, refresh_after: float = 3600):
+        self.path = path
+        self.max_age = max_age
+        self.refresh_after = refresh_after
+
+        self._state: dict[str, Any] | None = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._writing = False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def load(self) -> dict[str, Any] | None:
+        """Сохранённое состояние или None, если его нет или оно старше max_age. Файл перечитывается при изменении."""
+
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime != self._mtime:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._state = json.load(f)
+                    self._mtime = mtime
+            except (OSError, ValueError):
+                self._state, self._mtime = None, None
+
+            state = self._state
+
+        if state is None or time.time() - state.get("saved_at", 0) > self.max_age:
+            return None
+        return state
+
+    def age(self) -> float | None:
+        """Возраст сохранённой сессии в секундах (None - сессии нет или она устарела)."""
+
+        state = self.load()
+        return time.time() - state["saved_at"] if state else None
+
+    def needs_refresh(self) -> bool:
+        age = self.age()
+        return age is None or age > self.refresh_after
+
+    def restore(self, driver, logger_callback=print) -> bool:
+        """
+        Переносит сохранённую сессию в новый браузер до первой загрузки страницы (через CDP:
+        cookies - Network.setCookies, localStorage - скрипт, выполняемый до скриптов страницы).
+
+        :return: True, если сессия восстановлена.
+        """
+
+        state = self.load()
+        if state is None:
+            return False
+
+        now = time.time()
+        cookies = []
+        for cookie in state["cookies"]:
+            if cookie.get("expiry") and cookie["expiry"] <= now:
+                continue
+            params = { key: cookie[key] for key in ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite")
+                       if key in cookie }
+            if "expiry" in cookie:
+                params["expires"] = cookie["expiry"]
+            cookies.append(params)
+
+        driver.execute_cdp_cmd("Network.enable", { })
+        driver.execute_cdp_cmd("Network.setCookies", { "cookies": cookies })
+
+        if state.get("origin") and state.get("local_storage"):
+            source = RESTORE_STORAGE_JS % (json.dumps(state["origin"]), json.dumps(state["local_storage"]))
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", { "source": source })
+
+        logger_callback(f"Сессия восстановлена: cookies {len(cookies)}, ключей localStorage "
+                        f"{len(state.get('local_storage') or { })}, возраст {(now - state['saved_at']) / 60:.0f} мин.")
+        return True
+
+    def capture(self, driver) -> dict[str, Any]:
+        """Снимок сессии открытой в браузере страницы."""
+
+        storage = driver.execute_script(CAPTURE_STORAGE_JS)
+        return {
+                "saved_at"     : time.time(),
+                "origin"       : storage["origin"],
+                "cookies"      : driver.get_cookies(),
+                "local_storage": storage["items"],
+                }
+
+    def refresh(self, driver, logger_callback=print) -> bool:
+        """
+        Обновляет сохранённую сессию из браузера, если её нет или она старше refresh_after.
+        Запись файла выполняется в фоновом потоке и не задерживает парсинг.
+
+        :return: True, если обновление запущено.
+        """
+
+        if not self.needs_refresh():
+            return False
+
+        with self._lock:
+            if self._writing:
+                return False
+            self._writing = True
+
+        try:
+            state = self.capture(driver)
+        except Exception as e:
+            with self._lock:
+                self._writing = False
+            logger_callback(f"  - Не удалось сохранить сессию: {e}")
+            return False
+
+        logger_callback(f"  - Сохранение сессии: cookies {len(state['cookies'])}, "
+                        f"ключей localStorage {len(state['local_storage'])}.")
+        threading.Thread(target=self._write, args=(state,), daemon=True).start()
+        return True
+
+    def _write(self, state: dict[str, Any]) -> None:
+        # Фоновый поток не пишет в лог задачи: логгер задачи может бросить исключение отмены
+        temp_path = f"{self.path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Не удалось сохранить сессию в {self.path}: {e}")
+        finally:
+            with self._lock:
+                self._writing = False
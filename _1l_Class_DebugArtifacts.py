@@ -0,0 +1,226 @@
+# _1l_Class_DebugArtifacts.py
+
+import fcntl
+import gzip
+import hashlib
+import html
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Папка внутри static: страницы доступны по /static/debug/, оглавление - /debug/ (см. app.py)
+DEBUG_DIR = os.path.join(APP_DIR, "static", "debug")
+INDEX_JSON = "index.json"
+INDEX_HTML = "index.html"
+INDEX_LOCK = "index.lock"
+
+
+class DebugArtifacts:
+    """
+    Отладочные материалы страниц, на которых парсинг не удался: HTML (gzip) и скриншот.
+
+    В рабочем потоке снимаются только HTML страницы и, для новой страницы, скриншот - сжатие, запись на диск,
+    чистка и оглавление выполняются фоновым потоком. Одинаковые страницы ошибок (по хешу HTML) хранятся один раз,
+    у записи растёт счётчик повторов. Хранится не больше max_entries страниц и не больше max_bytes на диске:
+    старые записи вытесняются (кольцевой буфер). Очередь записи ограничена: при переполнении материалы
+    отбрасываются, а не задерживают парсинг.
+    Оглавление - index.json и index.html в той же папке. Несколько процессов могут писать в одну папку:
+    обновление оглавления (чтение, запись файлов, вытеснение, замена) выполняется под блокировкой файла
+    index.lock, а сами файлы заменяются атомарно - читатели без блокировки не видят недописанных файлов.
+    """
+
+    def __init__(self, directory: str = DEBUG_DIR, max_entries: int = 50, max_bytes: int = 50 * 2 ** 20,
+                 queue_size: int = 8, enabled: bool = True):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        self.captured = 0
+        self.dropped = 0
+        self._keys: set[str] | None = None  # хеши сохранённых страниц
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._lock = threading.Lock()
+
+    # --- Рабочий поток парсинга ---
+
+    def capture(self, driver, kind: str, url: str | None, error: Exception | str, logger_callback=print) -> str | None:
+        """
+        Ставит материалы открытой в браузере страницы в очередь записи.
+
+        :param kind: Этап, на котором произошла ошибка: "search" или "product".
+        :return: Ключ записи (хеш HTML) или None, если материалы не сняты.
+        """
+
+        if not self.enabled:
+            return None
+
+        try:
+            page_source = driver.page_source
+        except Exception as e:
+            logger_callback(f"  - Отладка: не удалось получить HTML страницы: {e}")
+            return None
+
+        page_bytes = page_source.encode("utf-8", "replace")
+        key = hashlib.sha1(page_bytes).hexdigest()[:16]
+
+        # Скриншот повторяющейся страницы ошибки не нужен
+        screenshot = None
+        if key not in self._known_keys():
+            try:
+                screenshot = driver.get_screenshot_as_png()
+            except Exception:
+                pass
+
+        item = {
+                "key"       : key,
+                "kind"      : kind,
+                "url"       : url,
+                "error"     : error if isinstance(error, str) else f"{type(error).__name__}: {error}",
+                "time"      : time.time(),
+                "html"      : page_bytes,
+                "screenshot": screenshot,
+                }
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            logger_callback("  - Отладка: очередь записи переполнена, материалы страницы пропущены.")
+            return None
+
+        self._ensure_writer()
+        self.captured += 1
+        logger_callback(f"  - Отладка: страница {key} сохраняется, оглавление: /debug/")
+        return key
+
+    def flush(self) -> None:
+        """Ждёт, пока фоновый поток запишет всё из очереди."""
+        self._queue.join()
+
+    def _known_keys(self) -> set[str]:
+        with self._lock:
+            if self._keys is None:
+                self._keys = set(self._read_index())
+            return self._keys
+
+    def _ensure_writer(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="debug-artifacts", daemon=True)
+                self._writer.start()
+
+    # --- Фоновый поток записи ---
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(item)
+            except Exception as e:
+                # Фоновый поток не пишет в лог задачи: логгер задачи может бросить исключение отмены
+                print(f"Отладка: не удалось записать материалы страницы {item['key']}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, item: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Сжатие - вне межпроцессной блокировки, чтобы не задерживать другие процессы
+        html_gz = gzip.compress(item["html"], compresslevel=6)
+
+        with self._index_lock():
+            entries = self._read_index()
+            key = item["key"]
+            entry = entries.get(key)
+
+            if entry is not None:
+                entry["count"] += 1
+            else:
+                entry = entries[key] = { "key": key, "first_seen": item["time"], "count": 1, "files": { }, "bytes": 0 }
+                entry["files"]["html"] = self._store(f"{key}.html.gz", html_gz)
+                if item["screenshot"]:
+                    entry["files"]["screenshot"] = self._store(f"{key}.png", item["screenshot"])
+                entry["bytes"] = sum(os.path.getsize(os.path.join(self.directory, name))
+                                     for name in entry["files"].values())
+
+            entry.update(kind=item["kind"], url=item["url"], error=item["error"], last_seen=item["time"])
+
+            self._evict(entries)
+            self._store(INDEX_JSON, json.dumps(entries, ensure_ascii=False, indent=1).encode("utf-8"))
+            self._store(INDEX_HTML, self._render_index(entries).encode("utf-8"))
+
+        with self._lock:
+            self._keys = set(entries)
+
+    @contextmanager
+    def _index_lock(self):
+        """Межпроцессная блокировка оглавления: обновления из разных процессов не теряют записи друг друга."""
+
+        with open(os.path.join(self.directory, INDEX_LOCK), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _evict(self, entries: dict[str, dict]) -> None:
+        """Оставляет самые свежие записи в пределах max_entries и max_bytes, файлы остальных удаляет."""
+
+        total = 0
+        for number, entry in enumerate(sorted(entries.values(), key=lambda e: e["last_seen"], reverse=True)):
+            total += entry["bytes"]
+            if number < self.max_entries and total <= self.max_bytes:
+                continue
+
+            for name in entry["files"].values():
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+            del entries[entry["key"]]
+
+    def _store(self, name: str, data: bytes) -> str:
+        """Атомарно записывает файл в папку отладки и возвращает его имя."""
+
+        path = os.path.join(self.directory, name)
+        temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return name
+
+    def _read_index(self) -> dict[str, dict]:
+        try:
+            with open(os.path.join(self.directory, INDEX_JSON), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return { }
+
+    @staticmethod
+    def _render_index(entries: dict[str, dict]) -> str:
+        rows = []
+        for entry in sorted(entries.values(), key=lambda e: e["last_seen"], reverse=True):
+            links = " ".join(f'<a href="{html.escape(name)}">{label}</a>'
+                             for label, name in entry["files"].items())
+            url = html.escape(entry["url"] or "")
+            rows.append(f"<tr><td>{datetime.fromtimestamp(entry['last_seen']):%Y-%m-%d %H:%M:%S}</td>"
+                        f"<td>{html.escape(entry['kind'])}</td><td>{entry['count']}</td>"
+                        f'<td><a href="{url}">{url}</a></td><td>{html.escape(entry["error"])}</td>'
+                        f"<td>{links}</td></tr>")
+
+        return ("<!DOCTYPE html>\n<html lang=\"ru\"><head><meta charset=\"UTF-8\"><title>Ошибки парсинга</title>"
+                "</head><body><h1>Последние ошибки парсинга</h1><table border=\"1\" cellpadding=\"4\">"
+                "<tr><th>Последний раз</th><th>Этап</th><th>Повторов</th><th>URL</th><th>Ошибка</th>"
+                "<th>Материалы</th></tr>" + "".join(rows) + "</table></body></html>\n")
+
+
+# Отладочные материалы процесса. DEBUG_ARTIFACTS=0 отключает съёмку, DEBUG_ARTIFACTS_MAX - лимит страниц.
+DEFAULT_DEBUG_ARTIFACTS = DebugArtifacts(max_entries=int(os.getenv("DEBUG_ARTIFACTS_MAX", 50)),
+                                         enabled=os.getenv("DEBUG_ARTIFACTS", "1") == "1"
+                                         )
@@ -0,0 +1,98 @@
+# _1m_Class_AnalogRanker.py
+
+import re
+from typing import Any
+
+import numpy as np
+
+# Всё, кроме букв и цифр, при сравнении названий считается пробелом
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+class AnalogRanker:
+    """
+    Отбор аналогов по названиям из плиток выдачи - до открытия страниц товаров.
+
+    Названия переводятся в TF-IDF-векторы символьных n-грамм (матрица NumPy, строки нормированы), похожесть -
+    косинусная: одно матричное умножение для исходного товара и одно для попарных сравнений кандидатов.
+    Кандидаты перебираются по убыванию похожести на исходный товар; почти одинаковые названия (разные продавцы
+    одного товара, похожесть не ниже duplicate_threshold) схлопываются в одну запись. Страницы открываются
+    только для top_k лучших.
+    """
+
+    def __init__(self, candidate_factor: int = 4, max_candidates: int = 200, duplicate_threshold: float = 0.9,
+                 min_similarity: float = 0.1, ngram_range: tuple[int, int] = (2, 4)):
+        """
+        :param candidate_factor: Во сколько раз больше кандидатов собирать из выдачи, чем нужно аналогов.
+        :param max_candidates: Верхняя граница числа кандидатов.
+        :param duplicate_threshold: Похожесть названий, начиная с которой кандидаты считаются одним товаром.
+        :param min_similarity: Кандидаты с меньшей похожестью на исходный товар отбрасываются.
+        :param ngram_range: Длины символьных n-грамм (от и до включительно).
+        """
+
+        self.candidate_factor = candidate_factor
+        self.max_candidates = max_candidates
+        self.duplicate_threshold = duplicate_threshold
+        self.min_similarity = min_similarity
+        self.ngram_range = ngram_range
+
+    def candidates_for(self, top_k: int) -> int:
+        """Сколько ссылок собирать из выдачи, чтобы выбрать top_k аналогов."""
+        return max(top_k, min(self.max_candidates, top_k * self.candidate_factor))
+
+    def _ngrams(self, title: str) -> list[str]:
+        text = f" {' '.join(_NON_WORD.sub(' ', title.casefold().replace('ё', 'е')).split())} "
+        low, high = self.ngram_range
+        return [text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1)]
+
+    def vectorize(self, titles: list[str]) -> np.ndarray:
+        """Матрица TF-IDF (строка на название, L2-норма строки - 1)."""
+
+        vocabulary: dict[str, int] = { }
+        rows, columns = [], []
+        for row, title in enumerate(titles):
+            for ngram in self._ngrams(title):
+                columns.append(vocabulary.setdefault(ngram, len(vocabulary)))
+                rows.append(row)
+
+        counts = np.zeros((len(titles), len(vocabulary)), dtype=np.float32)
+        np.add.at(counts, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)), 1.0)
+
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = np.log((1.0 + len(titles)) / (1.0 + document_frequency)) + 1.0
+        matrix = np.log1p(counts) * idf.astype(np.float32)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def rank(self, source_title: str, candidates: list[dict[str, Any]],
+             top_k: int) -> tuple[list[tuple[dict[str, Any], float]], int]:
+        """
+        Выбирает top_k аналогов среди кандидатов (product_data из плиток выдачи).
+
+        :return: ([(кандидат, похожесть), ...] по убыванию похожести, число схлопнутых дублей).
+                 Кандидаты без названия не участвуют.
+        """
+
+        titled = [candidate for candidate in candidates if candidate.get("title")]
+        if not titled or top_k <= 0:
+            return [], 0
+
+        matrix = self.vectorize([source_title] + [candidate["title"] for candidate in titled])
+        similarity = matrix[1:] @ matrix[0]
+        pairwise = matrix[1:] @ matrix[1:].T
+
+        kept: list[int] = []
+        duplicates = 0
+        for index in np.argsort(-similarity, kind="stable"):
+            if similarity[index] < self.min_similarity:
+                break
+            if kept and pairwise[index, kept].max() >= self.duplicate_threshold:
+                duplicates += 1
+                continue
+            kept.append(int(index))
+            if len(kept) == top_k:
+                break
+
+        return [(titled[index], round(float(similarity[index]), 4)) for index in kept], duplicates
@@ -0,0 +1,374 @@
+# _1n_Class_ResultStore.py
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_INDEX_PATH = os.path.join(APP_DIR, "cache", "results.sqlite3")
+
+# Сжатые копии файлов: Content-Encoding и расширение, в порядке предпочтения при отдаче
+ENCODINGS = {
+        "zstd": ".zst",
+        "gzip": ".gz",
+        }
+# Сжимаются только текстовые форматы: Parquet уже сжат zstd, XLSX - zip-архив
+COMPRESSIBLE_EXTENSIONS = (".csv", ".jsonl")
+# Файлы меньше этого размера не сжимаются
+MIN_COMPRESS_BYTES = 1024
+_CHUNK = 2 ** 20
+
+
+class ResultStore:
+    """
+    Хранилище файлов результатов в папке скачивания.
+
+    Файлы одного результата (CSV, Parquet, сводка пакета) переименовываются по хешу содержимого основного файла:
+    <хеш>.csv, <хеш>.parquet и т.д. Одинаковый результат хранится один раз, повторная публикация только
+    продлевает ему жизнь. Имя файла при скачивании - исходное (query_..._2025-01-01_12-00.csv), оно хранится
+    в индексе (SQLite) вместе с размером, ETag и сжатыми копиями. Содержимое по имени никогда не меняется,
+    поэтому ответы кэшируются клиентом бессрочно и проверяются по ETag.
+
+    Для текстовых форматов фоновый поток заранее готовит копии .gz и .zst (zstd - кодеком pyarrow),
+    клиенту отдаётся лучшая из поддерживаемых им (Accept-Encoding).
+
+    Удержание: результаты, которые не публиковались и не скачивались дольше max_age, удаляются; если папка
+    больше max_bytes, удаляются давно не использовавшиеся. Файлы папки вне индекса (незавершённые пакеты,
+    файлы до появления хранилища) удаляются, если не менялись дольше max_age.
+    Экземпляр можно разделять между потоками, индекс - между процессами (режим WAL).
+    """
+
+    def __init__(self, directory: str = "downloads", index_path: str = RESULTS_INDEX_PATH,
+                 max_age: float = 7 * 24 * 3600, max_bytes: int = 2 * 2 ** 30):
+        """
+        :param directory: Папка скачивания (её отдаёт маршрут /downloads/ в app.py).
+        :param max_age: Сколько секунд хранить неиспользуемый результат.
+        :param max_bytes: Предельный размер файлов результатов вместе со сжатыми копиями.
+        """
+
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._retention = None
+        self._compressors: list[threading.Thread] = []
+        self._stop = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self._conn = sqlite3.connect(index_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS result_files (
+                name          TEXT PRIMARY KEY,
+                result_id     TEXT NOT NULL,
+                download_name TEXT NOT NULL,
+                bytes         INTEGER NOT NULL,
+                etag          TEXT NOT NULL,
+                variants      TEXT NOT NULL DEFAULT '{}',
+                created_at    REAL NOT NULL,
+                last_used     REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_result_files_result ON result_files (result_id);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _file_digest(filepath: str) -> str:
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            while chunk := f.read(_CHUNK):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    # --- Публикация (рабочие процессы) ---
+
+    def publish(self, filepaths: list[str], logger_callback=print) -> dict[str, str]:
+        """
+        Переносит файлы одного результата в хранилище. Первый файл - основной: по его хешу называются все файлы,
+        имена остальных должны начинаться с его имени без расширения (query_x.csv, query_x.parquet,
+        batch_x.summary.jsonl).
+
+        :return: { исходный путь: имя файла в хранилище }.
+        """
+
+        stem = os.path.splitext(os.path.basename(filepaths[0]))[0]
+        result_id = self._file_digest(filepaths[0])[:24]
+        now = time.time()
+
+        stored, rows, new_files = { }, [], []
+        for filepath in filepaths:
+            download_name = os.path.basename(filepath)
+            if not download_name.startswith(stem):
+                raise ValueError(f"Файл {download_name} не относится к результату {stem}")
+
+            name = f"{result_id}{download_name[len(stem):]}"
+            target = os.path.join(self.directory, name)
+            etag = self._file_digest(filepath)[:32]
+
+            if os.path.exists(target):
+                os.remove(filepath)
+            else:
+                os.replace(filepath, target)
+                new_files.append(name)
+
+            stored[filepath] = name
+            rows.append((name, result_id, download_name, os.path.getsize(target), etag, now, now))
+
+        with self._lock:
+            # У уже опубликованного результата остаётся первое имя для скачивания
+            self._conn.executemany("""
+                INSERT INTO result_files (name, result_id, download_name, bytes, etag, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET last_used = excluded.last_used
+            """, rows)
+            self._conn.commit()
+
+        if new_files:
+            logger_callback(f"Результат {result_id} сохранён: {', '.join(new_files)}")
+        else:
+            logger_callback(f"Такой же результат уже сохранён ({result_id}), используется он.")
+
+        compressible = [name for name in new_files if name.endswith(COMPRESSIBLE_EXTENSIONS)]
+        if compressible:
+            compressor = threading.Thread(target=self._compress_all, args=(compressible,), name="result-compress",
+                                          daemon=True)
+            with self._lock:
+                self._compressors = [thread for thread in self._compressors if thread.is_alive()] + [compressor]
+            compressor.start()
+
+        return stored
+
+    def register(self, name: str) -> dict[str, Any] | None:
+        """
+        Добавляет в индекс файл, построенный из результата уже после публикации (XLSX при первом скачивании).
+        Имя для скачивания берётся у основного файла того же результата.
+        """
+
+        filepath = os.path.join(self.directory, name)
+        result_id = name.split(".", 1)[0]
+
+        with self._lock:
+            sibling = self._conn.execute("SELECT name, download_name FROM result_files WHERE result_id = ? LIMIT 1",
+                                         (result_id,)).fetchone()
+        if sibling is None or not os.path.isfile(filepath):
+            return None
+
+        # Исходное имя без расширения: у соседнего файла отрезается то же, что у него идёт после хеша
+        stem = sibling["download_name"][:len(sibling["download_name"]) - len(sibling["name"]) + len(result_id)]
+        download_name = f"{stem}{name[len(result_id):]}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR IGNORE INTO result_files (name, result_id, download_name, bytes, etag, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (name, result_id, download_name, os.path.getsize(filepath), self._file_digest(filepath)[:32], now,
+                  now))
+            self._conn.commit()
+
+        return self.lookup(name)
+
+    # --- Сжатые копии (фоновый поток) ---
+
+    def _compress_all(self, names: list[str]) -> None:
+        # Фоновый поток не пишет в лог задачи: логгер задачи может бросить исключение отмены
+        for name in names:
+            try:
+                self._compress(name)
+            except Exception as e:
+                print(f"Не удалось сжать файл результата {name}: {e}")
+
+    def _compress(self, name: str) -> None:
+        filepath = os.path.join(self.directory, name)
+        size = os.path.getsize(filepath)
+        if size < MIN_COMPRESS_BYTES:
+            return
+
+        variants = { }
+        for encoding, extension in ENCODINGS.items():
+            target = f"{filepath}{extension}"
+            temp_path = f"{target}.{os.getpid()}-{threading.get_ident()}.tmp"
+            try:
+                if not self._write_variant(encoding, filepath, temp_path):
+                    continue
+                # Сжатая копия, которая не меньше исходного файла, не нужна
+                if os.path.getsize(temp_path) >= size:
+                    continue
+                os.replace(temp_path, target)
+                variants[encoding] = os.path.getsize(target)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        with self._lock:
+            self._conn.execute("UPDATE result_files SET variants = ? WHERE name = ?", (json.dumps(variants), name))
+            self._conn.commit()
+
+    def _write_variant(self, encoding: str, source_path: str, target_path: str) -> bool:
+        """Пишет сжатую копию файла. False - кодек недоступен."""
+
+        if encoding == "gzip":
+            # mtime=0: одинаковое содержимое даёт одинаковый архив
+            with open(source_path, 'rb') as source, open(target_path, 'wb') as target, \
+                    gzip.GzipFile(filename="", mode='wb', fileobj=target, compresslevel=6, mtime=0) as archive:
+                shutil.copyfileobj(source, archive, _CHUNK)
+            return True
+
+        import pyarrow as pa
+
+        if not pa.Codec.is_available(encoding):
+            return False
+        with open(source_path, 'rb') as source, pa.CompressedOutputStream(target_path, encoding) as target:
+            while chunk := source.read(_CHUNK):
+                target.write(chunk)
+        return True
+
+    # --- Отдача (app.py) ---
+
+    def lookup(self, name: str) -> dict[str, Any] | None:
+        """Запись индекса по имени файла в хранилище или None, если файла нет."""
+
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM result_files WHERE name = ?", (name,)).fetchone()
+
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["variants"] = json.loads(entry["variants"])
+        return entry
+
+    def representation(self, entry: dict[str, Any], accepted_encodings: list[str]) -> tuple[str, str | None, str]:
+        """
+        Что отдать клиенту: лучшая сжатая копия из поддерживаемых им или сам файл.
+
+        :param accepted_encodings: Кодировки из Accept-Encoding запроса.
+        :return: (имя файла в папке, Content-Encoding или None, ETag). У каждой копии свой ETag.
+        """
+
+        for encoding, extension in ENCODINGS.items():
+            if encoding in entry["variants"] and encoding in accepted_encodings:
+                name = f"{entry['name']}{extension}"
+                if os.path.isfile(os.path.join(self.directory, name)):
+                    return name, encoding, f"{entry['etag']}-{encoding}"
+        return entry["name"], None, entry["etag"]
+
+    def touch(self, name: str) -> None:
+        """Отмечает скачивание: результат живёт ещё max_age."""
+
+        with self._lock:
+            self._conn.execute("UPDATE result_files SET last_used = ? WHERE result_id = ?",
+                               (time.time(), name.split(".", 1)[0]))
+            self._conn.commit()
+
+    def list_results(self) -> list[dict[str, Any]]:
+        """Результаты в хранилище (свежие первыми) с файлами, размерами и сжатыми копиями."""
+
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM result_files ORDER BY created_at").fetchall()
+
+        results = { }
+        for row in rows:
+            result = results.setdefault(row["result_id"], {
+                    "id"        : row["result_id"],
+                    "name"      : row["download_name"],
+                    "created_at": row["created_at"],
+                    "last_used" : row["last_used"],
+                    "bytes"     : 0,
+                    "files"     : [],
+                    })
+            variants = json.loads(row["variants"])
+            result["last_used"] = max(result["last_used"], row["last_used"])
+            result["bytes"] += row["bytes"] + sum(variants.values())
+            result["files"].append({ "name": row["name"], "download_name": row["download_name"],
+                                     "bytes": row["bytes"], "variants": variants })
+
+        return sorted(results.values(), key=lambda result: result["last_used"], reverse=True)
+
+    # --- Удержание ---
+
+    def enforce_retention(self, logger_callback=print) -> dict:
+        """
+        Удаляет устаревшие результаты и давно не использовавшиеся сверх max_bytes, а также старые файлы вне индекса.
+
+        :return: { 'removed' (результатов), 'orphans' (файлов вне индекса), 'freed' (байт) }.
+        """
+
+        now = time.time()
+        results = self.list_results()
+
+        expired, total = [], 0
+        for result in results:
+            total += result["bytes"]
+            if now - result["last_used"] > self.max_age or total > self.max_bytes:
+                expired.append(result)
+
+        freed = 0
+        for result in expired:
+            for file in result["files"]:
+                names = [file["name"]] + [f"{file['name']}{ENCODINGS[encoding]}" for encoding in file["variants"]]
+                freed += sum(self._remove(name) for name in names)
+            with self._lock:
+                self._conn.execute("DELETE FROM result_files WHERE result_id = ?", (result["id"],))
+                self._conn.commit()
+
+        orphans = 0
+        kept = { result["id"] for result in results if result not in expired }
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.split(".", 1)[0] in kept:
+                continue
+            if now - entry.stat().st_mtime > self.max_age:
+                freed += self._remove(entry.name)
+                orphans += 1
+
+        if expired or orphans:
+            logger_callback(f"Хранилище результатов: удалено результатов {len(expired)}, файлов вне индекса "
+                            f"{orphans}, освобождено {freed / 2 ** 20:.1f} МБ.")
+        return { "removed": len(expired), "orphans": orphans, "freed": freed }
+
+    def _remove(self, name: str) -> int:
+        """Удаляет файл из папки и возвращает его размер (0, если файла уже нет)."""
+
+        filepath = os.path.join(self.directory, name)
+        try:
+            size = os.path.getsize(filepath)
+            os.remove(filepath)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def start_retention(self, interval: float = 600, logger_callback=print) -> None:
+        """Запускает фоновую очистку каждые interval секунд (первая - сразу)."""
+
+        def run():
+            while True:
+                try:
+                    self.enforce_retention(logger_callback)
+                except Exception as e:
+                    logger_callback(f"Ошибка очистки хранилища результатов: {e}")
+                if self._stop.wait(interval):
+                    return
+
+        with self._lock:
+            if self._retention is None:
+                self._retention = threading.Thread(target=run, name="result-retention", daemon=True)
+                self._retention.start()
+
+    def close(self) -> None:
+        """Дожидается сжатия опубликованных файлов и очистки, затем закрывает индекс."""
+
+        self._stop.set()
+        with self._lock:
+            threads = self._compressors + ([self._retention] if self._retention is not None else [])
+        for thread in threads:
+            thread.join()
+        with self._lock:
+            self._conn.close()
@@ -1,54 +1,379 @@
 # _2_scenarios.py
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable
+
 import pandas as pd
 from _1a_Class_BrowserManager import BrowserManager
 from _1b_Class_OzonScraper import OzonScraper
+from _1c_Class_BrowserPool import BrowserPool
+from _1d_Class_RateLimiter import RateLimiter, DEFAULT_RATE_LIMITER
+from _1e_Class_FetchBackends import FetchBackend
+from _1f_Class_ProductCache import ProductCache, LinkCache
+from _1g_Class_CheckpointStore import Checkpoint, CheckpointStore
+from _1j_Class_PriceHistory import PriceHistory
+from _1m_Class_AnalogRanker import AnalogRanker
+from _2b_async_pipeline import run_pipeline
+
+
+def _log_pace(scraper: OzonScraper | None) -> None:
+    """Сообщает фактический темп загрузки страниц по данным общего бюджета запросов и трафик браузера."""
+
+    if scraper is not None and scraper.rate_limiter and scraper.pages_loaded:
+        scraper.log(f"Темп загрузки: {scraper.rate_limiter.describe()}")
+
+    traffic = scraper.describe_traffic() if scraper is not None else None
+    if traffic:
+        scraper.log(f"Трафик: {traffic}")
+
+
+@contextmanager
+def scraper_session(logger_callback=print, pool: BrowserPool | None = None, lease_timeout: float | None = None,
+                    **scraper_options
+                    ):
+    """
+    Выдаёт OzonScraper поверх браузера: из пула, если он передан, иначе через отдельный BrowserManager.
+    Если браузер запустить не удалось, выдаёт None.
+    scraper_options (rate_limiter, backend, cache) передаются в OzonScraper.
+    """
 
+    if pool is None:
+        with BrowserManager(logger_callback=logger_callback) as driver:
+            scraper = OzonScraper(driver, logger_callback=logger_callback, **scraper_options) if driver else None
+            try:
+                yield scraper
+            finally:
+                _log_pace(scraper)
+        return
 
-def process_query(scraper: OzonScraper, query: str, pages: int, max_products: int) -> pd.DataFrame:
+    with pool.lease(lease_timeout) as lease:
+        if lease is None:
+            logger_callback("Не удалось получить браузер из пула.")
+            yield None
+            return
+
+        # Сессию сайта обновляет скрапер, работающий на браузере пула
+        scraper = OzonScraper(lease.driver, logger_callback=logger_callback, session_store=pool.session_store,
+                              **scraper_options
+                              )
+        try:
+            yield scraper
+        finally:
+            lease.pages += scraper.pages_loaded
+            _log_pace(scraper)
+
+
+def parse_links_parallel(scraper: OzonScraper, links: list[str], pool: BrowserPool, workers: int,
+                         link_timeout: float | None = 30.0, rate_limiter: RateLimiter | None = None,
+                         lease_timeout: float = 5.0, on_result: Callable[[dict], None] | None = None
+                         ) -> list[dict]:
+    """
+    Парсит страницы товаров параллельно в нескольких браузерах и возвращает результаты в исходном порядке ссылок.
+
+    Первый воркер использует браузер переданного scraper, остальные берут драйверы из пула.
+    Если свободного драйвера нет за lease_timeout секунд, воркер не запускается, а ссылки достаются остальным.
+    Вместо фиксированных пауз все воркеры делят общий бюджет запросов rate_limiter.
+
+    :param workers: Максимальное число одновременно работающих браузеров.
+    :param link_timeout: Таймаут загрузки одной страницы в секундах, чтобы зависшая страница не держала весь пакет.
+    :param rate_limiter: Общий бюджет запросов воркеров. По умолчанию - бюджет scraper (или общий бюджет процесса,
+                         если у scraper его нет), как и в асинхронном конвейере.
+    :param on_result: Вызывается из потока воркера для каждого результата сразу после парсинга.
+    """
+
+    if rate_limiter is None:
+        rate_limiter = scraper.rate_limiter or DEFAULT_RATE_LIMITER
+
+    results: list[dict | None] = [None] * len(links)
+    pending = iter(range(len(links)))
+    pending_lock = threading.Lock()
+
+    def take_next() -> int | None:
+        with pending_lock:
+            return next(pending, None)
+
+    def drain(worker_scraper: OzonScraper) -> None:
+        with worker_scraper.page_load_timeout(link_timeout):
+            while (index := take_next()) is not None:
+                link = links[index]
+                try:
+                    results[index] = worker_scraper.parse_product_page(link)
+                except Exception as e:
+                    worker_scraper.log(f"  - Страница не загрузилась за отведённое время {link}: {e}")
+                    results[index] = OzonScraper.empty_product_data(link)
+
+                if on_result:
+                    on_result(results[index])
+
+    def pooled_worker() -> None:
+        with pool.lease(lease_timeout) as lease:
+            if lease is None:
+                return
+            worker_scraper = scraper.for_driver(lease.driver, rate_limiter=rate_limiter)
+            try:
+                drain(worker_scraper)
+            finally:
+                lease.pages += worker_scraper.pages_loaded
+
+    own_scraper = scraper.for_driver(scraper.driver, rate_limiter=rate_limiter)
+    workers = max(1, min(workers, len(links)))
+    scraper.log(f"Параллельный парсинг {len(links)} страниц, воркеров: до {workers}.")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(pooled_worker) for _ in range(workers - 1)]
+        drain(own_scraper)
+        for future in futures:
+            future.result()
+
+    scraper.pages_loaded += own_scraper.pages_loaded
+
+    return [data if data is not None else OzonScraper.empty_product_data(link) for data, link in zip(results, links)]
+
+
+def process_query(scraper: OzonScraper, query: str, pages: int, max_products: int, pool: BrowserPool | None = None,
+                  workers: int = 1, link_timeout: float | None = 30.0, engine: str = "sync", concurrency: int = 16,
+                  on_result: Callable[[dict], None] | None = None, checkpoint: Checkpoint | None = None,
+                  extraction: str = "pages", select: Callable[[list[str], dict[str, dict]], list[str]] | None = None
+                  ) -> pd.DataFrame:
     """
     Общая логика: получает scraper и поисковый запрос, возвращает DataFrame.
     Эта функция НЕ управляет браузером.
+    При workers > 1 и переданном pool страницы товаров парсятся параллельно (см. parse_links_parallel).
+    При engine="async" сбор ссылок и загрузка страниц идут через асинхронный конвейер
+    с concurrency одновременными загрузками (см. _2b_async_pipeline.run_pipeline).
+    on_result вызывается для каждого товара сразу после парсинга (например, ResultStreamWriter.write).
+    checkpoint - контрольная точка: собранные ссылки и разобранные товары сохраняются по ходу работы,
+    при возобновлении прокрутка выдачи и уже разобранные страницы пропускаются.
+    extraction - откуда брать данные товаров: "pages" - со страницы каждого товара, "tiles" - только из плиток
+    выдачи (поля читаются вместе со ссылками, страницы товаров не открываются), "hybrid" - из плиток,
+    а страница открывается только для товаров с неполными данными плитки.
+    select(ссылки, данные плиток) - отбор ссылок до открытия страниц товаров (например, ранжирование аналогов):
+    возвращает ссылки, которые нужно разобрать, в нужном порядке.
     """
 
-    links = scraper.fetch_product_links(query, pages, max_products)
+    done = checkpoint.results if checkpoint is not None else { }
+    # Данные товаров из плиток выдачи (URL -> product_data), если они нужны
+    tiles = { } if extraction in ("tiles", "hybrid") or select is not None else None
+
+    def discover(on_links: Callable[[list[str]], None] | None = None) -> list[str]:
+        if checkpoint is not None and checkpoint.links is not None:
+            scraper.log(f"Продолжение с контрольной точки: ссылок {len(checkpoint.links)}, "
+                        f"уже разобрано {len(done)}.")
+            # Товары из контрольной точки отдаются заново, чтобы итоговые файлы были полными
+            if on_result:
+                for link in checkpoint.links:
+                    if link in done:
+                        on_result(done[link])
+            return checkpoint.links
+
+        # Ссылки по мере прокрутки выдачи нужны только без отбора: select и плитки требуют всей выдачи
+        stream = on_links if extraction == "pages" and select is None else None
+        found = scraper.fetch_product_links(query, pages, max_products, tiles=tiles, on_links=stream)
+        if select is not None and found:
+            found = select(found, tiles)
+        if checkpoint is not None and found:
+            checkpoint.save_links(found)
+        if extraction in ("tiles", "hybrid"):
+            take_tiles(found)
+        return found
+
+    def take_tiles(links: list[str]) -> None:
+        # Товары из плиток считаются разобранными; в режиме "hybrid" неполные плитки уходят на страницы товаров
+        taken = 0
+        for link in links:
+            product_data = tiles.get(link)
+            if product_data is None or (extraction == "hybrid" and not scraper.tile_complete(product_data)):
+                continue
+            done[link] = product_data
+            record(product_data)
+            taken += 1
+        scraper.metrics.count("ozon_product_pages", taken, source="tile")
+        scraper.log(f"Из плиток выдачи: {taken} из {len(links)} товаров, "
+                    f"страниц товара к загрузке: {0 if extraction == 'tiles' else len(links) - taken}.")
+
+    def record(product_data: dict) -> None:
+        if checkpoint is not None:
+            checkpoint.save_result(product_data)
+        if on_result:
+            on_result(product_data)
+
+    def merge(links: list[str], parsed: list[dict]) -> pd.DataFrame:
+        # Результаты в исходном порядке ссылок: из контрольной точки или только что разобранные
+        parsed_by_url = { product_data["url"]: product_data for product_data in parsed }
+        return pd.DataFrame([done.get(link) or parsed_by_url.get(link) or OzonScraper.empty_product_data(link)
+                             for link in links])
+
+    if engine == "async":
+        pipeline_scraper = scraper.for_driver(scraper.driver, rate_limiter=scraper.rate_limiter or DEFAULT_RATE_LIMITER)
+        links, parsed = [], []
+
+        def discover_pending(emit: Callable[[list[str]], None]) -> list[str]:
+            links.extend(discover(on_links=lambda found: emit([link for link in found if link not in done])))
+            return [link for link in links if link not in done] if extraction != "tiles" else []
+
+        def on_pipeline_result(index: int, product_data: dict) -> None:
+            # Конвейер результаты не хранит: здесь остаётся только то, что нужно для итогового DataFrame
+            parsed.append(product_data)
+            record(product_data)
+
+        run_pipeline(pipeline_scraper, discover_pending, on_pipeline_result, pool=pool, workers=workers,
+                     concurrency=concurrency, link_timeout=link_timeout
+                     )
+        scraper.pages_loaded += pipeline_scraper.pages_loaded
+
+        if not links:
+            scraper.log("Ссылки на товары не найдены.")
+            return pd.DataFrame()
+
+        return merge(links, parsed)
+
+    links = discover()
 
     if not links:
         scraper.log("Ссылки на товары не найдены.")
         return pd.DataFrame()
 
-    all_products = []
+    # В режиме "tiles" страницы товаров не открываются, даже если плитка неполная
+    pending = [link for link in links if link not in done] if extraction != "tiles" else []
+
+    if pool is not None and workers > 1 and pending:
+        parsed = parse_links_parallel(scraper, pending, pool, workers, link_timeout, on_result=record)
+        return merge(links, parsed)
 
-    for i, link in enumerate(links):
+    parsed = []
+
+    for i, link in enumerate(pending):
         product_data = scraper.parse_product_page(link)
-        all_products.append(product_data)
+        parsed.append(product_data)
+        record(product_data)
 
-    return pd.DataFrame(all_products)
+    return merge(links, parsed)
 
 
-def run_scenario_by_query(query: str, pages: int, max_products: int, logger_callback=print) -> pd.DataFrame:
-    """Сценарий: поиск по запросу. Управляет жизненным циклом браузера."""
+def run_scenario_by_query(query: str, pages: int, max_products: int, logger_callback=print,
+                          pool: BrowserPool | None = None, backend: FetchBackend | None = None,
+                          cache: ProductCache | None = None, link_cache: LinkCache | None = None,
+                          checkpoints: CheckpointStore | None = None, checkpoint_scope: str | None = None,
+                          price_history: PriceHistory | None = None, **query_options
+                          ) -> pd.DataFrame:
+    """
+    Сценарий: поиск по запросу. Управляет жизненным циклом браузера.
+    Если передан pool, браузер берётся из пула вместо холодного запуска.
+    backend - лёгкий бэкенд загрузки страниц товара, Selenium остаётся запасным вариантом.
+    cache - кэш разобранных страниц товара, link_cache - кэш ссылок поисковой выдачи.
+    checkpoints - хранилище контрольных точек: прерванный сценарий с теми же параметрами продолжится с места остановки.
+    checkpoint_scope - пространство ключей контрольных точек владельца (пакета, задачи), см. CheckpointStore.open.
+    price_history - история цен: результат дописывается в неё одним запуском (только изменившиеся значения).
+    query_options (workers, link_timeout, engine, concurrency, extraction, on_result) передаются в process_query.
+    """
 
     print(f"--- ЗАПУСК СЦЕНАРИЯ: Поиск по запросу '{query}' ---")
+    checkpoint = None
+    if checkpoints:
+        checkpoint = checkpoints.open("query", LinkCache.normalize_query(query), pages, max_products,
+                                      scope=checkpoint_scope
+                                      )
+
+    try:
+        with scraper_session(logger_callback, pool, backend=backend, cache=cache, link_cache=link_cache) as scraper:
+            if scraper is None:
+                return pd.DataFrame()
+            results_df = process_query(scraper, query, pages, max_products, pool=pool, checkpoint=checkpoint,
+                                       **query_options
+                                       )
 
-    with BrowserManager(logger_callback=logger_callback) as driver:
-        scraper = OzonScraper(driver, logger_callback=logger_callback)
-        results_df = process_query(scraper, query, pages, max_products)
+        if checkpoint is not None:
+            checkpoint.complete()
 
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+    _record_prices(price_history, results_df, query, logger_callback)
     return results_df
 
 
-def run_scenario_by_url(url: str, pages: int, max_analogs: int, logger_callback=print) -> pd.DataFrame:
-    """Сценарий: поиск аналогов по URL. Управляет жизненным циклом браузера."""
+def run_scenario_by_url(url: str, pages: int, max_analogs: int, logger_callback=print,
+                        pool: BrowserPool | None = None, backend: FetchBackend | None = None,
+                        cache: ProductCache | None = None, link_cache: LinkCache | None = None,
+                        on_result: Callable[[dict], None] | None = None, checkpoints: CheckpointStore | None = None,
+                        checkpoint_scope: str | None = None, price_history: PriceHistory | None = None,
+                        ranker: AnalogRanker | None = None, **query_options
+                        ) -> pd.DataFrame:
+    """
+    Сценарий: поиск аналогов по URL. Управляет жизненным циклом браузера.
+    Если передан pool, браузер берётся из пула вместо холодного запуска.
+    backend - лёгкий бэкенд загрузки страниц товара, Selenium остаётся запасным вариантом.
+    cache - кэш разобранных страниц товара (исходный товар и аналоги), link_cache - кэш ссылок поисковой выдачи.
+    on_result получает исходный товар и каждый аналог (с полем is_initial) сразу после парсинга.
+    checkpoints - хранилище контрольных точек: прерванный сценарий с теми же параметрами продолжится с места остановки.
+    checkpoint_scope - пространство ключей контрольных точек владельца (пакета, задачи), см. CheckpointStore.open.
+    price_history - история цен: исходный товар и аналоги дописываются в неё одним запуском.
+    ranker - отбор аналогов по названиям из плиток выдачи: из выдачи берётся больше кандидатов, дубли схлопываются,
+    страницы открываются только для max_analogs самых похожих (колонка similarity). None (по умолчанию) - аналоги
+    в порядке выдачи.
+    query_options (workers, link_timeout, engine, concurrency, extraction) передаются в process_query.
+    """
 
     print(f"--- ЗАПУСК СЦЕНАРИЯ: Поиск аналогов для URL '{url[:50]}...' ---")
+    checkpoint = None
+    if checkpoints:
+        checkpoint = checkpoints.open("url", OzonScraper.normalize_product_url(url), pages, max_analogs,
+                                      scope=checkpoint_scope
+                                      )
+
+    try:
+        results_df = _scenario_by_url(url, pages, max_analogs, logger_callback, pool, backend, cache, link_cache,
+                                      on_result, checkpoint, ranker, **query_options
+                                      )
+
+        if checkpoint is not None and not results_df.empty:
+            checkpoint.complete()
+
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+    _record_prices(price_history, results_df, url, logger_callback)
+    return results_df
+
+
+def _record_prices(price_history: PriceHistory | None, results_df: pd.DataFrame, source: str,
+                   logger_callback) -> None:
+    """Дописывает результат сценария в историю цен. Ошибка базы не должна терять уже собранный результат."""
+
+    if price_history is None or results_df.empty:
+        return
+
+    try:
+        run = price_history.record(results_df.to_dict('records'), source=source)
+    except Exception as e:
+        logger_callback(f"Не удалось записать историю цен: {e}")
+        return
+
+    logger_callback(f"История цен: товаров {run['products']}, изменений {run['changed']}.")
+
+
+def _scenario_by_url(url: str, pages: int, max_analogs: int, logger_callback, pool: BrowserPool | None,
+                     backend: FetchBackend | None, cache: ProductCache | None, link_cache: LinkCache | None,
+                     on_result: Callable[[dict], None] | None, checkpoint: Checkpoint | None,
+                     ranker: AnalogRanker | None, **query_options
+                     ) -> pd.DataFrame:
     all_results = []
 
-    with BrowserManager(logger_callback=logger_callback) as driver:
-        scraper = OzonScraper(driver, logger_callback=logger_callback)
+    with scraper_session(logger_callback, pool, backend=backend, cache=cache, link_cache=link_cache) as scraper:
+        if scraper is None:
+            return pd.DataFrame()
+
+        # 1. Парсинг исходного товара (или берём его из контрольной точки)
+        initial_data = checkpoint.results.get(url) if checkpoint is not None else None
 
-        # 1. Парсинг исходного товара
-        initial_data = scraper.parse_product_page(url)
+        if initial_data is None:
+            initial_data = scraper.parse_product_page(url)
+            if checkpoint is not None and initial_data:
+                checkpoint.save_result(initial_data)
 
         if not initial_data or not initial_data["title"]:
             print("Не удалось спарсить исходный товар. Завершение.")
@@ -57,19 +382,60 @@ def run_scenario_by_url(url: str, pages: int, max_analogs: int, logger_callback=
         initial_data["is_initial"] = True
         all_results.append(initial_data)
 
-        # 2. Поиск аналогов по названию
+        # Похожесть отобранных аналогов на исходный товар (при возобновлении - из контрольной точки)
+        scores: dict[str, float] = dict(checkpoint.meta.get("similarity", { })) if checkpoint is not None else { }
+        source_url = OzonScraper.normalize_product_url(url)
+
+        def select_analogs(links: list[str], tiles: dict[str, dict]) -> list[str]:
+            # Ранжирование по названиям из плиток выдачи - до открытия страниц товаров
+            candidates = [tiles.get(link) or OzonScraper.empty_product_data(link) for link in links
+                          if link != source_url]
+            ranked, duplicates = ranker.rank(initial_data["title"], candidates, max_analogs)
+
+            if not ranked:
+                scraper.log("Названий в плитках выдачи нет - аналоги берутся в порядке выдачи, без ранжирования.")
+                return [candidate["url"] for candidate in candidates[:max_analogs]]
+
+            scores.update((candidate["url"], score) for candidate, score in ranked)
+            if checkpoint is not None:
+                checkpoint.save_meta("similarity", scores)
+            scraper.log(f"Отбор аналогов: кандидатов {len(candidates)}, дублей схлопнуто {duplicates}, "
+                        f"к разбору {len(ranked)} (похожесть {ranked[-1][1]:.2f}-{ranked[0][1]:.2f}).")
+            return [candidate["url"] for candidate, _ in ranked]
+
+        def on_analog(product_data: dict) -> None:
+            # Исходный товар в выдаче аналогов не дублируем
+            if on_result and product_data["url"] != url:
+                analog = { **product_data, "is_initial": False }
+                if ranker is not None:
+                    analog["similarity"] = scores.get(product_data["url"])
+                on_result(analog)
+
+        # Колонка similarity - при ранжировании, одинаково в потоковых строках и в итоговой таблице
+        # (без названий в плитках аналоги берутся в порядке выдачи и похожести у них нет)
+        initial_row = { **initial_data, "similarity": 1.0 } if ranker is not None else initial_data
+        if on_result:
+            on_result(initial_row)
+
+        # 2. Поиск аналогов по названию: при ранжировании из выдачи собирается больше кандидатов
         search_query = initial_data["title"]
-        analogs_df = process_query(scraper, search_query, pages, max_analogs)
+        analogs_df = process_query(scraper, search_query, pages,
+                                   ranker.candidates_for(max_analogs) if ranker is not None else max_analogs,
+                                   pool=pool, on_result=on_analog, checkpoint=checkpoint,
+                                   select=select_analogs if ranker is not None else None, **query_options
+                                   )
 
         # 3. Объединение результатов
         if not analogs_df.empty:
             analogs_df["is_initial"] = False
+            if ranker is not None:
+                analogs_df["similarity"] = analogs_df["url"].map(scores)
             # Убираем исходный товар из аналогов, если он там есть
             analogs_df = analogs_df[analogs_df['url'] != url]
 
-            initial_df = pd.DataFrame([initial_data])
+            initial_df = pd.DataFrame([initial_row])
             final_df = pd.concat([initial_df, analogs_df], ignore_index=True)
             return final_df
 
         else:
-            return pd.DataFrame([initial_data])
+            return pd.DataFrame([initial_row])
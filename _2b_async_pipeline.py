@@ -0,0 +1,203 @@
+# _2b_async_pipeline.py
+
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from _1b_Class_OzonScraper import OzonScraper
+from _1c_Class_BrowserPool import BrowserPool
+
+# Маркер завершения потока данных в очереди
+_DONE = object()
+
+
+async def _produce_links(discover: Callable[[Callable[[list[str]], None]], list[str]], links_queue: asyncio.Queue,
+                         fetchers: int, executor: ThreadPoolExecutor, discovered: asyncio.Event
+                         ) -> list[str]:
+    """
+    Производитель: собирает ссылки (блокирующий Selenium - в пуле потоков) и кладёт их в очередь по мере сбора.
+    Ссылки, которые discover не передал через emit (кэш ссылок, контрольная точка), ставятся в очередь в конце.
+    """
+
+    loop = asyncio.get_running_loop()
+    emitted: set[str] = set()
+    counter = itertools.count()
+
+    def enqueue(links: list[str]) -> None:
+        for link in links:
+            if link not in emitted:
+                emitted.add(link)
+                links_queue.put_nowait((next(counter), link))
+
+    def emit(links: list[str]) -> None:
+        # Вызывается из потока сбора: ссылки передаются в цикл событий, сбор не ждёт загрузчиков
+        loop.call_soon_threadsafe(enqueue, list(links))
+
+    try:
+        links = await loop.run_in_executor(executor, discover, emit)
+    finally:
+        # Собственный драйвер освободился - браузерный загрузчик на нём может начинать
+        discovered.set()
+
+    enqueue(links)
+    for _ in range(fetchers):
+        links_queue.put_nowait(_DONE)
+
+    return links
+
+
+async def _fetch_worker(scraper: OzonScraper, links_queue: asyncio.Queue, fallback_queue: asyncio.Queue,
+                        results_queue: asyncio.Queue, executor: ThreadPoolExecutor
+                        ) -> None:
+    """Потребитель: берёт страницы из кэша или загружает лёгким бэкендом, неудачные ссылки передаёт браузерам."""
+
+    loop = asyncio.get_running_loop()
+
+    while (item := await links_queue.get()) is not _DONE:
+        index, link = item
+        product_data = None
+
+        if scraper.cache is not None:
+            product_data = await loop.run_in_executor(executor, scraper.cached_product, link)
+
+        if product_data is None and scraper.backend is not None:
+            try:
+                product_data = await loop.run_in_executor(executor, scraper.fetch_with_backend, link)
+            except Exception as e:
+                scraper.log(f"  - Ошибка лёгкой загрузки {link}: {e}")
+
+            if product_data is not None:
+                await loop.run_in_executor(executor, scraper.remember_product, link, product_data)
+
+        if product_data is None:
+            await fallback_queue.put(item)
+        else:
+            await results_queue.put((index, product_data))
+
+
+async def _browser_worker(scraper: OzonScraper, fallback_queue: asyncio.Queue, results_queue: asyncio.Queue,
+                          executor: ThreadPoolExecutor, link_timeout: float | None, ready: asyncio.Event | None = None
+                          ) -> None:
+    """
+    Потребитель: парсит страницы в своём браузере. Один драйвер - одна страница за раз.
+
+    :param ready: Начинать только после этого события (драйвер, на котором идёт сбор ссылок).
+    """
+
+    loop = asyncio.get_running_loop()
+
+    if ready is not None:
+        await ready.wait()
+
+    with scraper.page_load_timeout(link_timeout):
+        while (item := await fallback_queue.get()) is not _DONE:
+            index, link = item
+            try:
+                product_data = await loop.run_in_executor(executor, scraper.parse_product_page_selenium, link)
+                await loop.run_in_executor(executor, scraper.remember_product, link, product_data)
+            except Exception as e:
+                scraper.log(f"  - Страница не загрузилась за отведённое время {link}: {e}")
+                product_data = OzonScraper.empty_product_data(link)
+
+            await results_queue.put((index, product_data))
+
+
+async def _sink(results_queue: asyncio.Queue, on_result: Callable[[int, dict], None]) -> None:
+    """Приёмник: передаёт результаты наружу по мере готовности, сам их не хранит."""
+
+    while (item := await results_queue.get()) is not _DONE:
+        on_result(*item)
+
+
+async def _run_pipeline(scraper: OzonScraper, discover: Callable[[Callable[[list[str]], None]], list[str]],
+                        pool: BrowserPool | None, workers: int, concurrency: int, link_timeout: float | None,
+                        lease_timeout: float, on_result: Callable[[int, dict], None]
+                        ) -> list[str]:
+    loop = asyncio.get_running_loop()
+    # Ссылки - короткие строки, их не больше max_products: очередь ссылок не ограничена, чтобы сбор выдачи
+    # никогда не ждал загрузчиков (собственный драйвер занят сбором, пока тот не закончится).
+    # Очереди страниц и результатов ограничены, чтобы при медленных потребителях не копить результаты в памяти.
+    links_queue = asyncio.Queue()
+    fallback_queue = asyncio.Queue(maxsize=max(workers, 1) * 2)
+    results_queue = asyncio.Queue(maxsize=concurrency * 2)
+    discovered = asyncio.Event()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency + workers + 1, thread_name_prefix="pipeline")
+    leases = []
+    browser_scrapers = [scraper]
+    tasks: list[asyncio.Task] = []
+
+    try:
+        # Браузеры: собственный драйвер scraper (после сбора ссылок) плюс до workers - 1 драйверов из пула
+        if pool is not None:
+            for _ in range(workers - 1):
+                lease = await loop.run_in_executor(executor, pool.checkout, lease_timeout)
+                if lease is None:
+                    break
+                leases.append(lease)
+                browser_scrapers.append(scraper.for_driver(lease.driver))
+
+        producer = asyncio.create_task(_produce_links(discover, links_queue, concurrency, executor, discovered))
+        fetchers = [asyncio.create_task(_fetch_worker(scraper, links_queue, fallback_queue, results_queue, executor))
+                    for _ in range(concurrency)]
+        browsers = [asyncio.create_task(_browser_worker(browser_scraper, fallback_queue, results_queue, executor,
+                                                        link_timeout, discovered if browser_scraper is scraper else None
+                                                        ))
+                    for browser_scraper in browser_scrapers]
+        sink = asyncio.create_task(_sink(results_queue, on_result))
+
+        async def finish_stages() -> None:
+            # Завершение стадий по порядку: маркер следующей стадии - когда все потребители предыдущей закончили
+            await asyncio.gather(producer, *fetchers)
+            for _ in browsers:
+                await fallback_queue.put(_DONE)
+            await asyncio.gather(*browsers)
+            await results_queue.put(_DONE)
+            await sink
+
+        tasks = [producer, *fetchers, *browsers, sink, asyncio.create_task(finish_stages())]
+        # Ошибка любой задачи (в том числе приёмника) останавливает остальные, а не оставляет их ждать в очередях
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+        return producer.result()
+
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Отмена задач не останавливает уже запущенные в пуле потоков вызовы: драйверы возвращаются в пул
+        # только после их завершения, иначе драйвер достанется другой задаче, пока поток ещё им управляет
+        executor.shutdown(wait=True, cancel_futures=True)
+        for lease, browser_scraper in zip(leases, browser_scrapers[1:]):
+            pool.checkin(lease, pages=browser_scraper.pages_loaded)
+
+
+def run_pipeline(scraper: OzonScraper, discover: Callable[[Callable[[list[str]], None]], list[str]],
+                 on_result: Callable[[int, dict], None], pool: BrowserPool | None = None, workers: int = 1,
+                 concurrency: int = 16, link_timeout: float | None = 30.0, lease_timeout: float = 5.0
+                 ) -> list[str]:
+    """
+    Асинхронный конвейер парсинга: сбор ссылок -> загрузка страниц -> приёмник результатов.
+    Ссылки уходят на загрузку по мере прокрутки выдачи, результаты - в on_result по мере готовности;
+    конвейер их не накапливает. Стадии связаны ограниченными очередями (backpressure).
+    Ошибка любой стадии отменяет остальные и пробрасывается наружу.
+
+    Загрузка лёгким бэкендом scraper.backend идёт в concurrency параллельных запросах.
+    Страницы, которые бэкенд не разобрал (или все страницы, если бэкенда нет), парсятся в браузерах:
+    драйверах из pool (до workers - 1) сразу, собственном драйвере scraper - после сбора ссылок.
+
+    :param discover: discover(emit) - сбор ссылок; новые ссылки можно сразу передавать в emit(links),
+                     возвращает все ссылки к загрузке (не переданные через emit ставятся в очередь в конце).
+                     Например, lambda emit: scraper.fetch_product_links(query, pages, max_products, on_links=emit).
+    :param on_result: Вызывается для каждого готового результата (index, product_data) в порядке готовности;
+                      index - номер ссылки в порядке постановки в очередь.
+    :return: Ссылки, возвращённые discover.
+    """
+
+    return asyncio.run(_run_pipeline(scraper, discover, pool, workers, concurrency, link_timeout, lease_timeout,
+                                     on_result
+                                     ))
@@ -0,0 +1,47 @@
+# _2c_event_channel.py
+
+import threading
+from typing import Any, Callable
+
+# Подписчик получает события задачи: (имя события, данные)
+Subscriber = Callable[[str, Any], None]
+
+
+class EventChannel:
+    """
+    Канал событий одной задачи: рассылает события всем подписчикам и хранит историю,
+    чтобы подписавшийся позже получил всё, что было отправлено до него.
+    """
+
+    def __init__(self):
+        self.history: list[tuple[str, Any]] = []
+        self.subscribers: list[Subscriber] = []
+        self.lock = threading.Lock()
+
+    def publish(self, event: str, payload: Any) -> None:
+        """Сохраняет событие и рассылает его всем подписчикам."""
+
+        # Рассылка под блокировкой, чтобы новый подписчик не получил события не по порядку
+        with self.lock:
+            self.history.append((event, payload))
+            for subscriber in self.subscribers:
+                try:
+                    subscriber(event, payload)
+                except Exception:
+                    pass
+
+    def subscribe(self, subscriber: Subscriber, replay: bool = True) -> None:
+        """Добавляет подписчика, предварительно отправив ему историю событий."""
+
+        with self.lock:
+            if replay:
+                for event, payload in self.history:
+                    subscriber(event, payload)
+            self.subscribers.append(subscriber)
+
+    def close(self) -> None:
+        """Освобождает историю и подписчиков после завершения задачи."""
+
+        with self.lock:
+            self.history = []
+            self.subscribers = []
@@ -0,0 +1,248 @@
+# _2d_batch.py
+
+import csv
+import io
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import pandas as pd
+from _1c_Class_BrowserPool import BrowserPool
+from _1e_Class_FetchBackends import FetchBackend
+from _1f_Class_ProductCache import ProductCache, LinkCache
+from _1g_Class_CheckpointStore import CheckpointStore
+from _1m_Class_AnalogRanker import AnalogRanker
+from _2_scenarios import run_scenario_by_query, run_scenario_by_url
+from _3_save_files import RESULT_COLUMNS, ResultStreamWriter, export_results
+
+# Колонки сводного файла пакета: к результату добавляется исходный запрос/URL
+BATCH_COLUMNS = RESULT_COLUMNS + ["is_initial", "similarity", "input"]
+
+
+def is_product_url(input_data: str) -> bool:
+    """Отличает URL товара Ozon от поискового запроса."""
+
+    return input_data.startswith('http') and 'ozon.ru' in input_data
+
+
+@dataclass
+class BatchItem:
+    """Один вход пакета: поисковый запрос или URL товара со своими параметрами."""
+
+    input_data: str
+    pages: int
+    max_items: int
+
+    @property
+    def is_url(self) -> bool:
+        return is_product_url(self.input_data)
+
+    @property
+    def key(self) -> str:
+        """Ключ входа в файле прогресса пакета."""
+
+        return f"{self.input_data}|{self.pages}|{self.max_items}"
+
+
+def parse_batch_text(text: str, fmt: str, pages: int = 1, max_items: int = 5) -> list[BatchItem]:
+    """
+    Разбирает список входов пакета.
+
+    :param fmt: "jsonl" - строки вида {"input": "...", "pages": 2, "max_items": 10};
+                "csv" - колонки input (или query/url), необязательные pages и max_items, разделитель , или ;
+                иначе - по одному запросу или URL в строке.
+    :param pages: Значение по умолчанию для входов без pages.
+    :param max_items: Значение по умолчанию для входов без max_items.
+    """
+
+    if fmt == "jsonl":
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    elif fmt == "csv":
+        header = text.split("\n", 1)[0]
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        records = list(csv.DictReader(io.StringIO(text), delimiter=delimiter))
+    else:
+        records = [{ "input": line } for line in text.splitlines()]
+
+    items = []
+    seen = set()
+
+    for record in records:
+        input_data = (record.get("input") or record.get("query") or record.get("url") or "").strip()
+        if not input_data:
+            continue
+
+        item = BatchItem(input_data, int(record.get("pages") or pages), int(record.get("max_items") or max_items))
+        # Повторы одного и того же входа выполняются один раз
+        if item.key not in seen:
+            seen.add(item.key)
+            items.append(item)
+
+    return items
+
+
+def load_batch_file(filepath: str, pages: int = 1, max_items: int = 5) -> list[BatchItem]:
+    """Читает файл входов пакета; формат определяется по расширению (.jsonl, .csv, иначе построчно)."""
+
+    extension = os.path.splitext(filepath)[1].lower().lstrip(".")
+
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        return parse_batch_text(f.read(), extension, pages, max_items)
+
+
+def _summarize(item: BatchItem, df: pd.DataFrame, status: str, started: float, error: str | None = None) -> dict:
+    """Сводка по одному входу для файла прогресса пакета."""
+
+    prices = df["price"].dropna() if "price" in df else pd.Series(dtype=float)
+    ratings = df["rating"].dropna() if "rating" in df else pd.Series(dtype=float)
+
+    return {
+            "key"        : item.key,
+            "input"      : item.input_data,
+            "kind"       : "url" if item.is_url else "query",
+            "status"     : status,
+            "rows"       : len(df),
+            "with_price" : len(prices),
+            "price_min"  : float(prices.min()) if len(prices) else None,
+            "price_max"  : float(prices.max()) if len(prices) else None,
+            "price_avg"  : round(float(prices.mean()), 2) if len(prices) else None,
+            "rating_avg" : round(float(ratings.mean()), 2) if len(ratings) else None,
+            "duration_s" : round(time.monotonic() - started, 1),
+            "error"      : error,
+            "finished_at": time.time(),
+            }
+
+
+def _read_progress(filepath: str) -> dict[str, dict]:
+    """Читает файл прогресса пакета: ключ входа -> последняя сводка по нему."""
+
+    progress = { }
+
+    if os.path.exists(filepath):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    summary = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # недописанная строка после аварийного завершения
+                progress[summary["key"]] = summary
+
+    return progress
+
+
+def _read_written_rows(filepath: str) -> set[tuple[str, str]]:
+    """Пары (вход, url) строк, уже записанных в сводный файл при прошлом запуске."""
+
+    if not os.path.exists(filepath):
+        return set()
+
+    with open(filepath, 'r', encoding='utf-8', newline='') as f:
+        return { (row.get("input"), row.get("url")) for row in csv.DictReader(f, delimiter=';') }
+
+
+def run_batch(items: list[BatchItem], directory: str, batch_name: str, logger_callback=print,
+              pool: BrowserPool | None = None, backend: FetchBackend | None = None,
+              cache: ProductCache | None = None, link_cache: LinkCache | None = None,
+              on_result: Callable[[dict], None] | None = None,
+              on_summary: Callable[[dict], None] | None = None, resume: bool = True,
+              checkpoints: CheckpointStore | None = None, write_parquet: bool = True,
+              ranker: AnalogRanker | None = None, **query_options
+              ) -> dict:
+    """
+    Пакетный режим: выполняет сценарии для списка запросов и URL на одном наборе браузеров
+    и общих кэшах, без холодного старта Chrome на каждый вход.
+
+    Все товары дописываются в один сводный CSV <batch_name>.csv (колонка input - исходный вход),
+    сводка по каждому входу - строкой в <batch_name>.summary.jsonl. Этот же файл служит контрольной точкой:
+    при resume=True входы со статусом done пропускаются, а уже записанные строки не дублируются.
+    Вход без результатов (браузер не запустился, страница не загрузилась) получает статус empty,
+    вход с ошибкой - failed; такие входы при возобновлении выполняются заново.
+
+    :param pool: Пул браузеров. Если не передан, создаётся на время пакета (workers браузеров).
+    :param on_result: Вызывается для каждого товара (с полем input) сразу после парсинга.
+    :param on_summary: Вызывается со сводкой по каждому завершённому входу.
+    :param checkpoints: Контрольные точки сценариев: прерванный вход продолжится со следующей непройденной ссылки.
+                        Ключи контрольных точек пакета отделены его именем от отдельных задач с теми же входами.
+    :param write_parquet: После пакета сохранить сводный файл и в Parquet (CSV дописывается при возобновлении,
+                          Parquet строится из него заново).
+    :param ranker: Отбор аналогов для входов-URL (см. run_scenario_by_url). None - аналоги в порядке выдачи.
+    :return: { 'csv_filepath' (если есть строки), 'parquet_filepath', 'summary_filepath', 'summaries' } - пути
+             к файлам и сводки по всем входам.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    summary_filepath = os.path.join(directory, f"{batch_name}.summary.jsonl")
+    own_pool = pool is None
+    if own_pool:
+        pool = BrowserPool(size=max(1, query_options.get("workers", 1)), logger_callback=logger_callback)
+
+    writer = ResultStreamWriter(directory, batch_name, False, columns=BATCH_COLUMNS, write_xlsx=False,
+                                keep_csv_content=False, logger_callback=logger_callback, base_filename=batch_name,
+                                append=resume
+                                )
+
+    progress = _read_progress(summary_filepath) if resume else { }
+    written = _read_written_rows(writer.csv_filepath) if resume else set()
+    pending = [item for item in items if progress.get(item.key, { }).get("status") != "done"]
+
+    if len(pending) < len(items):
+        logger_callback(f"Пакет '{batch_name}': {len(items) - len(pending)} из {len(items)} входов уже выполнены.")
+
+    summaries = [progress[item.key] for item in items if item not in pending]
+
+    try:
+        with writer, open(summary_filepath, 'a' if resume else 'w', encoding='utf-8') as summary_file:
+            for number, item in enumerate(pending, 1):
+                logger_callback(f"--- Пакет '{batch_name}': вход {number}/{len(pending)}: {item.input_data} ---")
+                started = time.monotonic()
+
+                def write_row(product_data: dict, item=item) -> None:
+                    row = { **product_data, "input": item.input_data }
+                    if (row["input"], row.get("url")) in written:
+                        return
+                    writer.write(row)
+                    if on_result:
+                        on_result(row)
+
+                scenario_options = { "logger_callback": logger_callback, "pool": pool, "backend": backend,
+                                     "cache"          : cache, "link_cache": link_cache,
+                                     "checkpoints"    : checkpoints, "checkpoint_scope": batch_name, **query_options }
+
+                try:
+                    if item.is_url:
+                        df = run_scenario_by_url(item.input_data, item.pages, item.max_items, on_result=write_row,
+                                                 ranker=ranker, **scenario_options
+                                                 )
+                    else:
+                        df = run_scenario_by_query(item.input_data, item.pages, item.max_items,
+                                                   on_result=write_row, **scenario_options
+                                                   )
+                    # Пустой результат - тоже неудача: при возобновлении вход выполнится заново
+                    summary = _summarize(item, df, "done" if not df.empty else "empty", started)
+                except Exception as e:
+                    logger_callback(f"Ошибка при обработке '{item.input_data}': {e}")
+                    summary = _summarize(item, pd.DataFrame(), "failed", started, error=str(e))
+
+                summary_file.write(json.dumps(summary, ensure_ascii=False) + "\n")
+                summary_file.flush()
+                summaries.append(summary)
+
+                if on_summary:
+                    on_summary(summary)
+
+    finally:
+        if own_pool:
+            pool.close()
+
+    failed = sum(1 for summary in summaries if summary["status"] == "failed")
+    empty = sum(1 for summary in summaries if summary["status"] == "empty")
+    logger_callback(f"Пакет '{batch_name}' завершён: входов {len(summaries)}, с ошибками {failed}, "
+                    f"без результатов {empty}.")
+
+    saved_info = writer.saved_info()
+    if write_parquet and 'csv_filepath' in saved_info:
+        saved_info['parquet_filepath'] = export_results(writer.csv_filepath, writer.parquet_filepath)
+
+    return { **saved_info, 'summary_filepath': summary_filepath, 'summaries': summaries }
@@ -1,22 +1,446 @@
 # _3_save_files.py
 
+import csv
+import io
 import os
+import threading
+import time
+import uuid
 from datetime import datetime
+from typing import Any
 
 import pandas as pd
+from openpyxl import Workbook
 
+from _1i_Class_Metrics import DEFAULT_METRICS
 
-def save_parsing_results(df: pd.DataFrame, input_data: str, is_url: bool, directory: str, logger_callback=print
+# Колонки результата в порядке записи в файлы
+RESULT_COLUMNS = ["title", "price", "rating", "reviews_count", "url"]
+
+# Типы колонок результата (nullable-типы pandas): одинаковые в Parquet, при чтении CSV и в XLSX.
+# query - исходный запрос или URL задачи, input - вход пакета; повторяющиеся строки хранятся словарём.
+RESULT_SCHEMA = {
+        "title"        : "string",
+        "price"        : "Int32",
+        "rating"       : "Float32",
+        "reviews_count": "Int32",
+        "url"          : "string",
+        "is_initial"   : "boolean",
+        "similarity"   : "Float32",
+        "query"        : "category",
+        "input"        : "category",
+        }
+# Сжатие Parquet: zstd заметно компактнее snappy при сопоставимой скорости чтения
+PARQUET_COMPRESSION = "zstd"
+
+
+def typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит колонки результата к типам RESULT_SCHEMA; остальные колонки не меняются."""
+
+    return df.astype({ column: dtype for column, dtype in RESULT_SCHEMA.items() if column in df.columns })
+
+
+def arrow_schema(columns: list[str]):
+    """Схема Arrow для колонок результата. Колонки вне RESULT_SCHEMA записываются строками."""
+
+    import pyarrow as pa
+
+    arrow_types = {
+            "string"  : pa.string(),
+            "Int32"   : pa.int32(),
+            "Float32" : pa.float32(),
+            "boolean" : pa.bool_(),
+            "category": pa.dictionary(pa.int32(), pa.string()),
+            }
+    return pa.schema([(column, arrow_types[RESULT_SCHEMA.get(column, "string")]) for column in columns])
+
+
+def read_results(filepath: str) -> pd.DataFrame:
+    """Читает сохранённый результат (Parquet или CSV с разделителем ;) с типами RESULT_SCHEMA."""
+
+    if filepath.endswith(".parquet"):
+        return typed_frame(pd.read_parquet(filepath))
+
+    with open(filepath, 'r', encoding='utf-8', newline='') as f:
+        columns = next(csv.reader(f, delimiter=';'), [])
+
+    return pd.read_csv(filepath, sep=';', encoding='utf-8',
+                       dtype={ column: RESULT_SCHEMA[column] for column in columns if column in RESULT_SCHEMA })
+
+
+def export_results(source_filepath: str, target_filepath: str) -> str:
+    """
+    Конвертирует сохранённый результат в другой формат по расширению target_filepath (.parquet или .xlsx).
+    Файл пишется во временный и переименовывается - параллельные запросы не увидят недописанный файл.
+    """
+
+    df = read_results(source_filepath)
+    # Расширение сохраняется: по нему pandas выбирает формат файла
+    root, extension = os.path.splitext(target_filepath)
+    temp_filepath = f"{root}.{os.getpid()}-{threading.get_ident()}.tmp{extension}"
+
+    try:
+        if target_filepath.endswith(".parquet"):
+            df.to_parquet(temp_filepath, index=False, compression=PARQUET_COMPRESSION)
+        else:
+            df.to_excel(temp_filepath, index=False, engine="openpyxl")
+        os.replace(temp_filepath, target_filepath)
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+    return target_filepath
+
+
+def ensure_xlsx(xlsx_filepath: str) -> bool:
+    """
+    XLSX по требованию: если файла ещё нет, строит его из Parquet или CSV того же результата.
+
+    :return: Есть ли XLSX после вызова.
+    """
+
+    if os.path.exists(xlsx_filepath):
+        return True
+
+    stem = xlsx_filepath[:-len(".xlsx")]
+    for source_filepath in (f"{stem}.parquet", f"{stem}.csv"):
+        if os.path.exists(source_filepath):
+            export_results(source_filepath, xlsx_filepath)
+            return True
+
+    return False
+
+
+def build_base_filename(input_data: str, is_url: bool, run_id: str | None = None) -> str:
+    """
+    Имя файла результатов без расширения: префикс по типу входных данных, отметка времени и идентификатор запуска.
+    Идентификатор нужен, чтобы одновременные запуски в одну минуту не писали в один файл.
+
+    :param run_id: Идентификатор запуска (например задачи). По умолчанию - случайный.
+    """
+
+    filename_prefix = "analogs" if is_url else f"query_{input_data.replace(' ', '_')[:20]}"
+    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M')
+    return f"{filename_prefix}_{timestamp}_{run_id or uuid.uuid4().hex[:8]}"
+
+
+class ResultStreamWriter:
+    """
+    Потоковая запись результатов: каждая строка дописывается в CSV сразу после парсинга товара.
+    CSV сбрасывается на диск каждые flush_every строк или flush_interval секунд,
+    поэтому при падении на середине уже разобранные товары остаются в файле.
+    Parquet (типы RESULT_SCHEMA, сжатие zstd) пишется группами по parquet_row_group строк.
+    XLSX по умолчанию не пишется: его строит ensure_xlsx при первом скачивании.
+    Метод write можно вызывать из нескольких потоков.
+    """
+
+    def __init__(self, directory: str, input_data: str, is_url: bool, columns: list[str] | None = None,
+                 write_xlsx: bool = False, keep_csv_content: bool = True, flush_every: int = 10,
+                 flush_interval: float = 5.0, logger_callback=print, base_filename: str | None = None,
+                 append: bool = False, write_parquet: bool = False, parquet_row_group: int = 1000
+                 ):
+        """
+        :param columns: Колонки файла. По умолчанию RESULT_COLUMNS (+ is_initial для сценария по URL;
+                        similarity - только если её передать явно, при ранжировании аналогов).
+        :param write_xlsx: Сразу писать XLSX (write-only openpyxl). Медленно и расходует память на больших выгрузках.
+        :param keep_csv_content: Накапливать текст CSV для ответа клиенту (без повторного чтения файла).
+        :param base_filename: Имя файлов без расширения вместо build_base_filename.
+        :param append: Дописывать в существующий CSV (без повторного заголовка), например при возобновлении пакета.
+                       Parquet дописать нельзя, поэтому в этом режиме он не пишется (см. export_results).
+        :param write_parquet: Писать Parquet рядом с CSV; к колонкам добавляется query (input_data).
+        """
+
+        self.directory = directory
+        self.columns = columns or (RESULT_COLUMNS + ["is_initial"] if is_url else RESULT_COLUMNS)
+        self.write_xlsx = write_xlsx
+        self.keep_csv_content = keep_csv_content
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.log = logger_callback
+
+        base_filename = base_filename or build_base_filename(input_data, is_url)
+        self.csv_filepath = os.path.join(directory, f"{base_filename}.csv")
+        self.xlsx_filepath = os.path.join(directory, f"{base_filename}.xlsx")
+        self.parquet_filepath = os.path.join(directory, f"{base_filename}.parquet")
+        self.write_parquet = write_parquet and not append
+        self.parquet_row_group = parquet_row_group
+        self.input_data = input_data
+
+        self.rows_written = 0
+        self.appending = append
+        self._started = time.monotonic()
+        # Агрегаты для сводки: [количество, сумма, минимум, максимум]
+        self._price_stats = [0, 0.0, None, None]
+        self._rating_stats = [0, 0.0, None, None]
+        self._csv_file = None
+        self._csv_writer = None
+        self._csv_content = io.StringIO() if keep_csv_content else None
+        self._content_writer = None
+        self._workbook = None
+        self._sheet = None
+        self._parquet_writer = None
+        self._parquet_columns = self.columns if "input" in self.columns else self.columns + ["query"]
+        self._parquet_rows: list[list] = []
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "ResultStreamWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def open(self) -> "ResultStreamWriter":
+        os.makedirs(self.directory, exist_ok=True)
+
+        # В режиме дописывания заголовок пишется, только если файла ещё нет
+        self.appending = self.appending and os.path.exists(self.csv_filepath) and os.path.getsize(self.csv_filepath) > 0
+        self._csv_file = open(self.csv_filepath, 'a' if self.appending else 'w', encoding='utf-8', newline='')
+        self._csv_writer = csv.writer(self._csv_file, delimiter=';')
+        if not self.appending:
+            self._csv_writer.writerow(self.columns)
+
+        if self._csv_content is not None:
+            self._content_writer = csv.writer(self._csv_content, delimiter=';')
+            self._content_writer.writerow(self.columns)
+
+        if self.write_xlsx:
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet()
+            self._sheet.append(self.columns)
+
+        if self.write_parquet:
+            import pyarrow.parquet as pq
+
+            self._parquet_writer = pq.ParquetWriter(self.parquet_filepath, arrow_schema(self._parquet_columns),
+                                                    compression=PARQUET_COMPRESSION
+                                                    )
+
+        return self
+
+    @staticmethod
+    def _cell(value: Any) -> Any:
+        # NaN из pandas и None записываются пустой ячейкой, как в DataFrame.to_csv
+        if value is None or (isinstance(value, float) and value != value):
+            return None
+        return value
+
+    def write(self, product_data: dict[str, Any]) -> None:
+        """Дописывает одну строку результата."""
+
+        row = [self._cell(product_data.get(column)) for column in self.columns]
+
+        with self._lock:
+            self._csv_writer.writerow(row)
+            if self._content_writer is not None:
+                self._content_writer.writerow(row)
+            if self._sheet is not None:
+                self._sheet.append(row)
+            if self._parquet_writer is not None:
+                self._parquet_rows.append(row if len(row) == len(self._parquet_columns) else row + [self.input_data])
+                if len(self._parquet_rows) >= self.parquet_row_group:
+                    self._write_row_group()
+
+            self.rows_written += 1
+            self._unflushed += 1
+
+            self._accumulate(self._price_stats, self._cell(product_data.get("price")))
+            self._accumulate(self._rating_stats, self._cell(product_data.get("rating")))
+
+            if self._unflushed >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._csv_file.flush()
+                self._unflushed = 0
+                self._last_flush = time.monotonic()
+
+    def _write_row_group(self) -> None:
+        """Записывает накопленные строки группой Parquet. Вызывается под self._lock."""
+
+        import pyarrow as pa
+
+        if not self._parquet_rows:
+            return
+
+        schema = self._parquet_writer.schema
+        columns = list(zip(*self._parquet_rows))
+        arrays = [pa.array(self._arrow_values(values, field.type), type=field.type)
+                  for values, field in zip(columns, schema)]
+        self._parquet_writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        self._parquet_rows = []
+
+    @staticmethod
+    def _arrow_values(values: tuple, arrow_type) -> list:
+        """Значения колонки для pa.array: числа приводятся к типу колонки, строки - к str."""
+
+        import pyarrow as pa
+
+        if pa.types.is_integer(arrow_type):
+            return [None if value is None else int(value) for value in values]
+        if pa.types.is_floating(arrow_type):
+            return [None if value is None else float(value) for value in values]
+        if pa.types.is_boolean(arrow_type):
+            return [None if value is None else bool(value) for value in values]
+        return [None if value is None else str(value) for value in values]
+
+    def close(self) -> None:
+        # Закрытие - основная стоимость сохранения: остаток CSV и запись XLSX
+        with DEFAULT_METRICS.span("save_results"), self._lock:
+            if self._csv_file is None:
+                return
+
+            self._csv_file.close()
+            self._csv_file = None
+
+            if self._parquet_writer is not None:
+                self._write_row_group()
+                self._parquet_writer.close()
+                if self.rows_written == 0:
+                    os.remove(self.parquet_filepath)
+                    self._parquet_writer = None
+
+            if self.rows_written == 0:
+                if not self.appending:
+                    os.remove(self.csv_filepath)
+                return
+
+            self.log(f"Результаты сохранены в CSV: {self.csv_filepath}")
+            if self._parquet_writer is not None:
+                self.log(f"Результаты сохранены в Parquet: {self.parquet_filepath}")
+
+            if self._workbook is not None:
+                try:
+                    self._workbook.save(self.xlsx_filepath)
+                    self.log(f"Результаты сохранены в XLSX: {self.xlsx_filepath}")
+                except Exception as e:
+                    self.log(f"Ошибка сохранения XLSX файла {self.xlsx_filepath}: {e}")
+                    self._workbook = None
+
+    def saved_info(self) -> dict:
+        """
+        Возвращает словарь того же вида, что save_parsing_results: 'csv_filepath', 'csv_content'
+        (если накапливался), 'parquet_filepath' и 'xlsx_filepath' (если записаны)
+        или пустой словарь, если строк не было.
+        """
+
+        if self.rows_written == 0 and not self.appending:
+            return { }
+
+        saved_info = { 'csv_filepath': self.csv_filepath }
+
+        if self._csv_content is not None:
+            saved_info['csv_content'] = self._csv_content.getvalue()
+
+        if self._parquet_writer is not None:
+            saved_info['parquet_filepath'] = self.parquet_filepath
+
+        if self._workbook is not None:
+            saved_info['xlsx_filepath'] = self.xlsx_filepath
+
+        return saved_info
+
+    @staticmethod
+    def _accumulate(stats: list, value: Any) -> None:
+        if value is None:
+            return
+        stats[0] += 1
+        stats[1] += value
+        stats[2] = value if stats[2] is None else min(stats[2], value)
+        stats[3] = value if stats[3] is None else max(stats[3], value)
+
+    def summary(self) -> dict:
+        """Сводка по записанным строкам для ответа клиенту."""
+
+        with self._lock:
+            price_count, price_sum, price_min, price_max = self._price_stats
+            rating_count, rating_sum, _, _ = self._rating_stats
+            return {
+                    "rows"      : self.rows_written,
+                    "with_price": price_count,
+                    "price_min" : price_min,
+                    "price_max" : price_max,
+                    "price_avg" : round(price_sum / price_count, 2) if price_count else None,
+                    "rating_avg": round(rating_sum / rating_count, 2) if rating_count else None,
+                    "duration_s": round(time.monotonic() - self._started, 1),
+                    }
+
+
+class RowBatcher:
+    """
+    Собирает строки результата в компактные пакеты { columns, rows } и отдаёт их emit_batch
+    каждые max_rows строк или не позже чем через max_delay секунд после первой строки пакета.
+    Метод add можно вызывать из нескольких потоков.
+    """
+
+    def __init__(self, emit_batch, columns: list[str], max_rows: int = 20, max_delay: float = 0.5):
+        """
+        :param emit_batch: Функция, получающая пакет { 'columns': [...], 'rows': [[...], ...] }.
+        """
+
+        self.emit_batch = emit_batch
+        self.columns = columns
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+
+        self._rows: list[list] = []
+        self._timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+
+    def add(self, product_data: dict[str, Any]) -> None:
+        row = [ResultStreamWriter._cell(product_data.get(column)) for column in self.columns]
+
+        with self._lock:
+            self._rows.append(row)
+
+            if len(self._rows) >= self.max_rows:
+                batch = self._take_batch()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if batch:
+            self.emit_batch(batch)
+
+    def flush(self) -> None:
+        """Немедленно отправляет накопленные строки."""
+
+        with self._lock:
+            batch = self._take_batch()
+
+        if batch:
+            self.emit_batch(batch)
+
+    def _take_batch(self) -> dict | None:
+        """Забирает накопленные строки. Вызывается под self._lock."""
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._rows:
+            return None
+
+        batch = { "columns": self.columns, "rows": self._rows }
+        self._rows = []
+        return batch
+
+
+def save_parsing_results(df: pd.DataFrame, input_data: str, is_url: bool, directory: str, logger_callback=print,
+                         write_parquet: bool = True, write_xlsx: bool = False
                          ) -> dict:
     """
-    Сохраняет DataFrame в CSV и XLSX файлы и возвращает пути к файлам и содержимое CSV.
+    Сохраняет DataFrame в CSV и Parquet файлы и возвращает пути к файлам и содержимое CSV.
 
     :param df: DataFrame для сохранения.
     :param input_data: Исходные данные (URL или поисковый запрос).
     :param is_url: Флаг, указывающий, является ли input_data URL.
     :param directory: Директория для сохранения файлов.
     :param logger_callback: Функция для логирования сообщений.
-    :return: Словарь с 'csv_filepath', 'csv_content', 'xlsx_filepath' (опционально)
+    :param write_parquet: Писать Parquet с типами RESULT_SCHEMA.
+    :param write_xlsx: Сразу писать XLSX (иначе его построит ensure_xlsx при скачивании).
+    :return: Словарь с 'csv_filepath', 'csv_content', 'parquet_filepath', 'xlsx_filepath' (опционально)
              или пустой словарь в случае ошибки/отсутствия данных.
     """
 
@@ -24,42 +448,20 @@ def save_parsing_results(df: pd.DataFrame, input_data: str, is_url: bool, direct
         logger_callback("Нет данных для сохранения.")
         return { }
 
-    os.makedirs(directory, exist_ok=True)
-
-    filename_prefix = "analogs" if is_url else f"query_{input_data.replace(' ', '_')[:20]}"
-    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M')
-    full_base_filename = f"{filename_prefix}_{timestamp}"
-
-    saved_info = { }
+    writer = ResultStreamWriter(directory, input_data, is_url, columns=list(df.columns), write_xlsx=write_xlsx,
+                                logger_callback=logger_callback, write_parquet=write_parquet
+                                )
 
-    # --- Сохранение в CSV ---
     try:
-        csv_filename = f"{full_base_filename}.csv"
-        csv_filepath = os.path.join(directory, csv_filename)
-        df.to_csv(csv_filepath, sep=';', index=False, encoding='utf-8')
-        saved_info['csv_filepath'] = csv_filepath
-        logger_callback(f"Результаты сохранены в CSV: {csv_filepath}")
-
-        # Читаем содержимое CSV для возврата
-        with open(csv_filepath, 'r', encoding='utf-8') as f:
-            csv_content = f.read()
-        saved_info['csv_content'] = csv_content
+        with DEFAULT_METRICS.span("save_parsing_results"), writer:
+            for product_data in df.to_dict('records'):
+                writer.write(product_data)
 
     except IOError as e:
-        logger_callback(f"Ошибка сохранения CSV файла {csv_filepath}: {e}")
-    except Exception as e:
-        logger_callback(f"Неизвестная ошибка при сохранении CSV: {e}")
-
-    # --- Сохранение в XLSX ---
-    try:
-        xlsx_filename = f"{full_base_filename}.xlsx"
-        xlsx_filepath = os.path.join(directory, xlsx_filename)
-        df.to_excel(xlsx_filepath, index=False, engine='openpyxl')
-        saved_info['xlsx_filepath'] = xlsx_filepath
-        logger_callback(f"Результаты сохранены в XLSX: {xlsx_filepath}")
-    except IOError as e:
-        logger_callback(f"Ошибка сохранения XLSX файла {xlsx_filepath}: {e}")
+        logger_callback(f"Ошибка сохранения файла {writer.csv_filepath}: {e}")
+        return { }
     except Exception as e:
-        logger_callback(f"Неизвестная ошибка при сохранении XLSX: {e}")
+        logger_callback(f"Неизвестная ошибка при сохранении результатов: {e}")
+        return { }
 
-    return saved_info
+    return writer.saved_info()
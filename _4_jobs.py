@@ -0,0 +1,673 @@
+# _4_jobs.py
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable
+
+from _2c_event_channel import EventChannel, Subscriber
+
+
+class QueueFullError(Exception):
+    """Очередь задач заполнена - новая задача не принята."""
+
+
+class JobCancelled(BaseException):
+    """
+    Задача отменена пользователем. Наследуется от BaseException, чтобы её не перехватывали
+    блоки `except Exception` внутри скрапера.
+    """
+
+
+# Значения по умолчанию для рабочих процессов (см. JobManager.worker_config)
+DEFAULT_WORKER_CONFIG = {
+        "download_folder"  : "downloads",
+        "browsers"         : 2,       # размер пула браузеров в каждом процессе
+        "max_pages"        : 50,      # пересоздание браузера после стольких страниц
+        "lean_browser"     : False,   # облегчённый профиль Chrome (см. PerformanceProfile)
+        "driver_path"      : None,    # закреплённый путь к chromedriver (см. resolve_chromedriver)
+        "driver_download"  : False,   # разрешить загрузку chromedriver по сети
+        "session_state"    : True,    # перенос cookies и localStorage в новые браузеры (см. SessionStore)
+        "fetch_backend"    : "selenium",
+        "product_cache"    : True,
+        "cache_max_entries": 20000,
+        "link_cache_ttl"   : 600,
+        "checkpoints"      : True,    # контрольные точки сценариев (см. _1g_Class_CheckpointStore)
+        "price_history"    : True,    # история цен товаров (см. _1j_Class_PriceHistory)
+        "parquet"          : True,    # Parquet рядом с CSV; XLSX строится при первом скачивании
+        "analog_ranking"   : True,    # отбор аналогов по названиям из плиток (см. _1m_Class_AnalogRanker)
+        "result_store"     : True,    # файлы результатов по хешу содержимого (см. _1n_Class_ResultStore)
+        "row_batch_size"   : 20,
+        "row_batch_delay"  : 0.5,
+        "metrics_interval" : 5.0,     # как часто процесс отправляет метрики пула и этапов главному процессу
+        "query_options"    : { },
+        }
+
+# Как часто главный процесс проверяет, живы ли рабочие процессы (секунды)
+WORKER_CHECK_INTERVAL = 1.0
+
+
+@dataclass
+class Job:
+    """Задача парсинга и её состояние в главном процессе."""
+
+    id: str
+    key: Hashable
+    params: dict
+    status: str = "queued"  # queued -> running -> done | failed | cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    worker: int | None = None
+    rows: int = 0
+    result: dict | None = None
+    error: str | None = None
+    cancel_requested: bool = False
+    attempts: int = 0
+    channel: EventChannel = field(default_factory=EventChannel)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> dict:
+        return {
+                "id"         : self.id,
+                "status"     : self.status,
+                "input_data" : self.params.get("input_data"),
+                "created_at" : self.created_at,
+                "started_at" : self.started_at,
+                "finished_at": self.finished_at,
+                "wait_s"     : round((self.started_at or time.time()) - self.created_at, 2),
+                "worker"     : self.worker,
+                "attempts"   : self.attempts,
+                "progress"   : { "rows": self.rows },
+                "result"     : self.result,
+                "error"      : self.error,
+                }
+
+
+# --- Код рабочего процесса ---
+
+class _WorkerResources:
+    """Ресурсы рабочего процесса: пул браузеров, бэкенд и кэши. Живут между задачами."""
+
+    def __init__(self, config: dict):
+        from _1a_Class_BrowserManager import PerformanceProfile
+        from _1c_Class_BrowserPool import BrowserPool
+        from _1e_Class_FetchBackends import HttpFetchBackend
+        from _1f_Class_ProductCache import ProductCache, LinkCache
+        from _1g_Class_CheckpointStore import CheckpointStore
+        from _1j_Class_PriceHistory import PriceHistory
+        from _1k_Class_SessionStore import SessionStore
+        from _1n_Class_ResultStore import ResultStore
+
+        self.config = config
+        self.pool = BrowserPool(size=config["browsers"], max_pages=config["max_pages"],
+                                performance_profile=PerformanceProfile() if config["lean_browser"] else None,
+                                driver_path=config["driver_path"], allow_driver_download=config["driver_download"],
+                                session_store=SessionStore() if config["session_state"] else None
+                                )
+        self.backend = HttpFetchBackend() if config["fetch_backend"] == "http" else None
+        self.cache = ProductCache(max_entries=config["cache_max_entries"]) if config["product_cache"] else None
+        self.link_cache = LinkCache(ttl=config["link_cache_ttl"])
+        self.checkpoints = CheckpointStore() if config["checkpoints"] else None
+        self.price_history = PriceHistory() if config["price_history"] else None
+        self.results = ResultStore(config["download_folder"]) if config["result_store"] else None
+
+    def close(self) -> None:
+        self.pool.close()
+        if self.backend:
+            self.backend.close()
+        if self.cache:
+            self.cache.close()
+        if self.price_history:
+            self.price_history.close()
+        if self.results:
+            self.results.close()
+
+
+def _publish_results(resources: _WorkerResources, files: dict[str, str], logger_callback) -> dict[str, str]:
+    """
+    Переносит файлы результата в хранилище (если оно включено) и возвращает ссылки для скачивания.
+
+    :param files: { ключ: путь к файлу }; первый файл - основной (по его содержимому называется результат).
+    :return: { ключ: '/downloads/<имя>' }.
+    """
+
+    names = { key: os.path.basename(filepath) for key, filepath in files.items() }
+    if resources.results is not None and files:
+        stored = resources.results.publish(list(files.values()), logger_callback)
+        names = { key: stored[filepath] for key, filepath in files.items() }
+
+    return { key: f'/{resources.config["download_folder"]}/{name}' for key, name in names.items() }
+
+
+def run_parsing_job(params: dict, publish: Subscriber, resources: _WorkerResources,
+                    check_cancelled: Callable[[], None]
+                    ) -> dict:
+    """
+    Выполняет задачу парсинга в рабочем процессе и возвращает данные для события parsing_finished:
+    ссылки на файлы и сводку (пустой словарь, если результатов нет). Каждый товар дописывается в файлы
+    сразу после парсинга и отправляется пакетами событий product_row.
+
+    :param params: { job_id, input_data, is_url, pages, max_items }.
+    :param publish: publish(event, payload) - отправка события подписчикам задачи.
+    :param check_cancelled: Бросает JobCancelled, если задачу отменили.
+    """
+
+    from _1m_Class_AnalogRanker import AnalogRanker
+    from _2_scenarios import run_scenario_by_query, run_scenario_by_url
+    from _3_save_files import RESULT_COLUMNS, ResultStreamWriter, RowBatcher, build_base_filename
+
+    config = resources.config
+    input_data, is_url = params["input_data"], params["is_url"]
+    pages, max_items = params["pages"], params["max_items"]
+
+    def logger_callback(message):
+        check_cancelled()
+        publish('log_message', { 'data': str(message) })
+
+    ranker = AnalogRanker() if is_url and config["analog_ranking"] else None
+    # Колонка similarity - только когда аналоги ранжируются
+    columns = RESULT_COLUMNS + ["is_initial", "similarity"] if ranker is not None else None
+    # Идентификатор задачи в имени: задачи, запущенные в одну минуту в разных процессах, не пишут в один файл
+    writer = ResultStreamWriter(config["download_folder"], input_data, is_url, columns=columns, keep_csv_content=False,
+                                logger_callback=logger_callback, write_parquet=config["parquet"],
+                                base_filename=build_base_filename(input_data, is_url, params["job_id"])
+                                )
+    batcher = RowBatcher(lambda batch: publish('product_row', batch), writer.columns,
+                         max_rows=config["row_batch_size"], max_delay=config["row_batch_delay"]
+                         )
+
+    def on_result(product_data: dict) -> None:
+        writer.write(product_data)
+        batcher.add(product_data)
+        check_cancelled()
+
+    # Контрольные точки задачи отделены от пакетов и других задач; перезапущенная после падения процесса
+    # задача сохраняет идентификатор и продолжает свою контрольную точку
+    checkpoint_scope = f"job_{params['job_id']}"
+    scenario_options = { "logger_callback": logger_callback, "pool": resources.pool, "backend": resources.backend,
+                         "cache"          : resources.cache, "link_cache": resources.link_cache,
+                         "checkpoints"    : resources.checkpoints, "checkpoint_scope": checkpoint_scope,
+                         "price_history"  : resources.price_history, "on_result": on_result, **config["query_options"] }
+
+    with writer:
+        try:
+            if is_url:
+                run_scenario_by_url(input_data, pages, max_items, ranker=ranker, **scenario_options)
+            else:
+                run_scenario_by_query(input_data, pages, max_items, **scenario_options)
+        finally:
+            batcher.flush()
+
+    saved_info = writer.saved_info()
+
+    if not saved_info:
+        logger_callback("Парсинг завершился безрезультатно.")
+        return { }
+
+    response_data = { 'summary': writer.summary() }
+    urls = _publish_results(resources, { key: saved_info[key] for key in ('csv_filepath', 'parquet_filepath')
+                                         if key in saved_info }, logger_callback)
+
+    if 'csv_filepath' in urls:
+        response_data['result_url'] = urls['csv_filepath']
+        # XLSX строится из результата при первом скачивании (см. _3_save_files.ensure_xlsx)
+        response_data['xlsx_url'] = f"{os.path.splitext(urls['csv_filepath'])[0]}.xlsx"
+
+    if 'parquet_filepath' in urls:
+        response_data['parquet_url'] = urls['parquet_filepath']
+
+    return response_data
+
+
+def run_batch_job(params: dict, publish: Subscriber, resources: _WorkerResources,
+                  check_cancelled: Callable[[], None]
+                  ) -> dict:
+    """
+    Выполняет пакетную задачу (см. _2d_batch.run_batch): товары всех входов отправляются событиями product_row
+    и пишутся в один сводный CSV, по каждому входу в лог уходит краткая сводка.
+
+    :param params: { job_id, input_data (описание пакета), batch: [{ input_data, pages, max_items }, ...] }.
+    """
+
+    from _1m_Class_AnalogRanker import AnalogRanker
+    from _2d_batch import BatchItem, BATCH_COLUMNS, run_batch
+    from _3_save_files import RowBatcher
+
+    config = resources.config
+
+    def logger_callback(message):
+        check_cancelled()
+        publish('log_message', { 'data': str(message) })
+
+    batcher = RowBatcher(lambda batch: publish('product_row', batch), BATCH_COLUMNS,
+                         max_rows=config["row_batch_size"], max_delay=config["row_batch_delay"]
+                         )
+
+    def on_result(product_data: dict) -> None:
+        batcher.add(product_data)
+        check_cancelled()
+
+    def on_summary(summary: dict) -> None:
+        logger_callback(f"Вход '{summary['input']}': {summary['status']}, товаров {summary['rows']}, "
+                        f"{summary['duration_s']} с.")
+
+    items = [BatchItem(**item) for item in params["batch"]]
+    # Имя по идентификатору задачи: перезапущенная после сбоя задача продолжит тот же пакет
+    batch_name = f"batch_{params['job_id']}"
+
+    try:
+        batch_info = run_batch(items, config["download_folder"], batch_name, logger_callback=logger_callback,
+                               pool=resources.pool, backend=resources.backend, cache=resources.cache,
+                               link_cache=resources.link_cache, on_result=on_result, on_summary=on_summary,
+                               resume=True, checkpoints=resources.checkpoints, write_parquet=config["parquet"],
+                               price_history=resources.price_history,
+                               ranker=AnalogRanker() if config["analog_ranking"] else None, **config["query_options"]
+                               )
+    finally:
+        batcher.flush()
+
+    # Основной файл результата - сводный CSV, а если строк нет - сводка по входам
+    urls = _publish_results(resources, { key: batch_info[key] for key in ('csv_filepath', 'parquet_filepath',
+                                                                          'summary_filepath') if key in batch_info },
+                            logger_callback)
+    response_data = { 'summary_url': urls['summary_filepath'] }
+
+    if 'csv_filepath' in urls:
+        response_data['result_url'] = urls['csv_filepath']
+        response_data['xlsx_url'] = f"{os.path.splitext(urls['csv_filepath'])[0]}.xlsx"
+
+    if 'parquet_filepath' in urls:
+        response_data['parquet_url'] = urls['parquet_filepath']
+
+    return response_data
+
+
+def _worker_main(index: int, config: dict, inbox, events, cancel_event) -> None:
+    """Цикл рабочего процесса: получает задачи из inbox, события отправляет в общую очередь events."""
+
+    from _1d_Class_RateLimiter import DEFAULT_RATE_LIMITER
+    from _1i_Class_Metrics import DEFAULT_METRICS
+
+    resources = _WorkerResources(config)
+    stopped = threading.Event()
+
+    def check_cancelled() -> None:
+        if cancel_event.is_set():
+            raise JobCancelled()
+
+    def publish_metrics() -> None:
+        events.put((None, "_pool_metrics", (index, resources.pool.metrics(), DEFAULT_RATE_LIMITER.stats(),
+                                            DEFAULT_METRICS.snapshot())))
+
+    def publish_metrics_periodically() -> None:
+        # Во время задачи /metrics видит живые браузеры и этапы, а не состояние после прошлой задачи
+        while not stopped.wait(config["metrics_interval"]):
+            try:
+                publish_metrics()
+            except Exception as e:
+                print(f"Процесс {index}: не удалось отправить метрики: {e}")
+
+    threading.Thread(target=publish_metrics_periodically, name="worker-metrics", daemon=True).start()
+
+    try:
+        while (job := inbox.get()) is not None:
+            job_id = job["id"]
+            cancel_event.clear()
+            events.put((job_id, "_started", index))
+            publish_metrics()
+
+            def publish(event, payload, job_id=job_id):
+                events.put((job_id, event, payload))
+
+            try:
+                runner = run_batch_job if "batch" in job["params"] else run_parsing_job
+                response_data = runner({ **job["params"], "job_id": job_id }, publish, resources, check_cancelled)
+                events.put((job_id, "_finished", response_data))
+            except JobCancelled:
+                events.put((job_id, "_cancelled", None))
+            except Exception as e:
+                events.put((job_id, "_failed", f"{e}\n{traceback.format_exc()}"))
+
+            publish_metrics()
+    finally:
+        stopped.set()
+        resources.close()
+
+
+# --- Главный процесс ---
+
+@dataclass
+class _Worker:
+    index: int
+    process: Any
+    inbox: Any
+    cancel_event: Any
+    job_id: str | None = None
+
+
+class JobManager:
+    """
+    Очередь задач парсинга с ограничением размера и пул рабочих процессов, которым принадлежат браузеры.
+    Одинаковые активные задачи (по ключу) не дублируются: новый подписчик подключается к существующей.
+    События задачи (log_message, product_row, parsing_finished) рассылаются подписчикам через EventChannel.
+    Процессы запускаются лениво, при первой задаче.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 20, worker_config: dict | None = None,
+                 keep_finished: int = 200, max_attempts: int = 2
+                 ):
+        """
+        :param workers: Количество рабочих процессов.
+        :param max_queue: Сколько задач может ждать в очереди; сверх этого submit бросает QueueFullError.
+        :param worker_config: Настройки рабочих процессов (см. DEFAULT_WORKER_CONFIG).
+        :param keep_finished: Сколько завершённых задач хранить для запросов статуса.
+        :param max_attempts: Сколько раз запускать задачу, если рабочий процесс упал во время её выполнения.
+                             Повторный запуск продолжает сценарий с контрольной точки.
+        """
+
+        self.workers_count = workers
+        self.max_queue = max_queue
+        self.worker_config = { **DEFAULT_WORKER_CONFIG, **(worker_config or { }) }
+        self.keep_finished = keep_finished
+        self.max_attempts = max_attempts
+
+        self._jobs: dict[str, Job] = { }
+        self._active_keys: dict[Hashable, str] = { }
+        self._queue: deque[str] = deque()
+        self._finished: deque[str] = deque()
+        self._workers: list[_Worker] = []
+        self._pool_metrics: dict[int, dict] = { }
+        self._rate_limits: dict[int, dict] = { }
+        self._stage_metrics: dict[int, dict] = { }
+        self._lock = threading.RLock()
+        self._started = False
+        self._stopping = False
+        self._ctx = mp.get_context("spawn")
+        self._events = None
+
+        # Метрики
+        self._submitted = 0
+        self._rejected = 0
+        self._retried = 0
+        self._deduplicated = 0
+        self._started_jobs = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._completed = 0
+
+    # --- Запуск и остановка ---
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._events = self._ctx.Queue()
+            for index in range(self.workers_count):
+                self._workers.append(self._spawn_worker(index))
+
+        threading.Thread(target=self._dispatch_events, name="job-events", daemon=True).start()
+
+    def _spawn_worker(self, index: int) -> _Worker:
+        inbox = self._ctx.Queue()
+        cancel_event = self._ctx.Event()
+        process = self._ctx.Process(target=_worker_main, name=f"parser-worker-{index}",
+                                    args=(index, self.worker_config, inbox, self._events, cancel_event),
+                                    daemon=True
+                                    )
+        process.start()
+        return _Worker(index=index, process=process, inbox=inbox, cancel_event=cancel_event)
+
+    def shutdown(self, timeout: float = 30.0) -> None:
+        with self._lock:
+            self._stopping = True
+            workers = list(self._workers)
+
+        for worker in workers:
+            worker.cancel_event.set()
+            worker.inbox.put(None)
+        for worker in workers:
+            worker.process.join(timeout)
+
+    # --- API для обработчиков ---
+
+    def submit(self, params: dict, key: Hashable, subscriber: Subscriber,
+               on_join: Callable[[], None] | None = None
+               ) -> Job:
+        """
+        Ставит задачу в очередь или подключает подписчика к такой же активной задаче.
+
+        :raises QueueFullError: Если очередь заполнена.
+        """
+
+        self.start()
+
+        with self._lock:
+            job_id = self._active_keys.get(key)
+
+            if job_id is not None:
+                job = self._jobs[job_id]
+                self._deduplicated += 1
+                if on_join:
+                    on_join()
+                job.channel.subscribe(subscriber)
+                return job
+
+            if len(self._queue) >= self.max_queue:
+                self._rejected += 1
+                raise QueueFullError(f"В очереди уже {len(self._queue)} задач, попробуйте позже.")
+
+            job = Job(id=uuid.uuid4().hex[:12], key=key, params=params)
+            job.channel.subscribe(subscriber)
+            self._jobs[job.id] = job
+            self._active_keys[key] = job.id
+            self._queue.append(job.id)
+            self._submitted += 1
+
+            self._assign_jobs()
+            return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list[dict]:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def cancel(self, job_id: str) -> bool:
+        """Отменяет задачу: ожидающая снимается с очереди, выполняющаяся прерывается на ближайшем шаге."""
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+
+            if job is None or not job.active:
+                return False
+
+            job.cancel_requested = True
+
+            if job.status == "queued":
+                if job_id in self._queue:
+                    self._queue.remove(job_id)
+                    self._finish(job, "cancelled")
+                # Иначе задача уже отправлена процессу - флаг отмены выставится по событию _started
+                return True
+
+            worker = self._worker_of(job)
+            if worker:
+                worker.cancel_event.set()
+            return True
+
+    def metrics(self) -> dict:
+        with self._lock:
+            statuses = { }
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+
+            return {
+                    "workers"        : self.workers_count,
+                    "workers_busy"   : sum(1 for worker in self._workers if worker.job_id),
+                    "queue_depth"    : len(self._queue),
+                    "queue_limit"    : self.max_queue,
+                    "submitted"      : self._submitted,
+                    "rejected"       : self._rejected,
+                    "deduplicated"   : self._deduplicated,
+                    "retried"        : self._retried,
+                    "statuses"       : statuses,
+                    "wait_avg_s"     : round(self._wait_total / self._started_jobs, 2) if self._started_jobs else 0.0,
+                    "wait_max_s"     : round(self._wait_max, 2),
+                    "run_avg_s"      : round(self._run_total / self._completed, 2) if self._completed else 0.0,
+                    "browser_pools"  : dict(self._pool_metrics),
+                    "rate_limits"    : dict(self._rate_limits),
+                    }
+
+    def stage_metrics(self) -> list[dict]:
+        """Снимки метрик этапов рабочих процессов (обновляются после каждой задачи, см. StageMetrics)."""
+
+        with self._lock:
+            return list(self._stage_metrics.values())
+
+    # --- Внутренняя логика ---
+
+    def _worker_of(self, job: Job) -> _Worker | None:
+        return next((worker for worker in self._workers if worker.job_id == job.id), None)
+
+    def _assign_jobs(self) -> None:
+        """Отправляет задачи из очереди свободным процессам. Вызывается под self._lock."""
+
+        for worker in self._workers:
+            if not self._queue:
+                return
+            if worker.job_id is None and worker.process.is_alive():
+                job = self._jobs[self._queue.popleft()]
+                # Попытка считается при выдаче: процесс может упасть и до события _started
+                job.attempts += 1
+                worker.job_id = job.id
+                job.worker = worker.index
+                worker.inbox.put({ "id": job.id, "params": job.params })
+
+    def _finish(self, job: Job, status: str, result: dict | None = None, error: str | None = None) -> None:
+        """Завершает задачу и сообщает подписчикам. Вызывается под self._lock."""
+
+        job.status = status
+        job.finished_at = time.time()
+        job.result = result
+        job.error = error
+
+        if job.started_at:
+            self._run_total += job.finished_at - job.started_at
+            self._completed += 1
+
+        if self._active_keys.get(job.key) == job.id:
+            del self._active_keys[job.key]
+
+        if status == "cancelled":
+            job.channel.publish('log_message', { 'data': "Задача отменена." })
+        elif status == "failed" and error:
+            job.channel.publish('log_message', { 'data': "--- КРИТИЧЕСКАЯ ОШИБКА ---" })
+            job.channel.publish('log_message', { 'data': error.splitlines()[0] })
+
+        job.channel.publish('parsing_finished', { **(result or { }), 'job_id': job.id })
+        job.channel.close()
+
+        self._finished.append(job.id)
+        while len(self._finished) > self.keep_finished:
+            self._jobs.pop(self._finished.popleft(), None)
+
+    def _dispatch_events(self) -> None:
+        """Поток главного процесса: принимает события рабочих процессов и следит за их здоровьем."""
+
+        next_check = time.monotonic() + WORKER_CHECK_INTERVAL
+
+        while not self._stopping:
+            try:
+                self._handle_event(*self._events.get(timeout=WORKER_CHECK_INTERVAL))
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                return
+
+            # Процессы проверяются по времени, а не только в паузах между событиями: пока другой процесс
+            # шлёт события, упавший всё равно будет замечен и перезапущен
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + WORKER_CHECK_INTERVAL
+
+    def _handle_event(self, job_id: str | None, event: str, payload: Any) -> None:
+        """Обрабатывает одно событие рабочего процесса."""
+
+        with self._lock:
+            if event == "_pool_metrics":
+                index, pool_metrics, rate_limits, stage_metrics = payload
+                self._pool_metrics[index] = pool_metrics
+                self._rate_limits[index] = rate_limits
+                self._stage_metrics[index] = stage_metrics
+                return
+
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+
+            if event == "_started":
+                job.status = "running"
+                job.started_at = time.time()
+                wait = job.started_at - job.created_at
+                self._started_jobs += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                if job.cancel_requested:
+                    self._workers[payload].cancel_event.set()
+
+            elif event in ("_finished", "_failed", "_cancelled"):
+                worker = self._worker_of(job)
+                if worker:
+                    worker.job_id = None
+                if event == "_finished":
+                    self._finish(job, "done", result=payload)
+                elif event == "_failed":
+                    self._finish(job, "failed", error=payload)
+                else:
+                    self._finish(job, "cancelled")
+                self._assign_jobs()
+
+            else:
+                if event == "product_row":
+                    job.rows += len(payload["rows"])
+                job.channel.publish(event, payload)
+
+    def _check_workers(self) -> None:
+        """Перезапускает упавшие процессы; их текущие задачи помечаются как проваленные."""
+
+        with self._lock:
+            for position, worker in enumerate(self._workers):
+                if worker.process.is_alive() or self._stopping:
+                    continue
+
+                job = self._jobs.get(worker.job_id) if worker.job_id else None
+                error = f"Рабочий процесс завершился с кодом {worker.process.exitcode}"
+
+                if job is not None and job.active:
+                    if job.attempts < self.max_attempts and not job.cancel_requested:
+                        # Задача возвращается в начало очереди и продолжится с контрольной точки
+                        job.status = "queued"
+                        job.worker = None
+                        self._queue.appendleft(job.id)
+                        self._retried += 1
+                        job.channel.publish('log_message', { 'data': f"{error}. Задача перезапущена." })
+                    else:
+                        self._finish(job, "failed", error=error)
+
+                self._workers[position] = self._spawn_worker(worker.index)
+
+            self._assign_jobs()
@@ -1,20 +1,28 @@
 # app.py
 
+import gzip
+import mimetypes
 import os
 import re
-import threading
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 
-from flask import Flask, render_template, request, send_from_directory
+from flask import Flask, Response, render_template, request, send_from_directory, jsonify
 from flask_socketio import SocketIO
+from werkzeug.security import safe_join
 import pandas as pd
 
 # Импортируем наши модули
-from _1a_Class_BrowserManager import BrowserManager
 from _1b_Class_OzonScraper import OzonScraper
-from _2_scenarios import run_scenario_by_query, run_scenario_by_url  # Импортируем сценарии
-from _3_save_files import save_parsing_results
+from _1f_Class_ProductCache import LinkCache
+from _1i_Class_Metrics import DEFAULT_METRICS, merge_snapshots, render_prometheus
+from _1j_Class_PriceHistory import PriceHistory
+from _1l_Class_DebugArtifacts import DEBUG_DIR, INDEX_HTML
+from _1n_Class_ResultStore import ResultStore
+from _2d_batch import is_product_url, parse_batch_text
+from _3_save_files import ensure_xlsx
+from _4_jobs import JobManager, QueueFullError
 
 load_dotenv()
 
@@ -29,7 +37,66 @@ DOWNLOAD_FOLDER = 'downloads'
 socketio = SocketIO(app, async_mode='threading', cors_allowed_origins=[CORS_ALLOWED_ORIGINS, "http://127.0.0.1:5000"])
 
 
-# browser_manager = BrowserManager()
+# Параметры парсинга страниц товаров для всех задач (см. _2_scenarios.process_query):
+# PARSE_WORKERS - сколько браузеров пула одна задача может использовать параллельно,
+# PARSE_ENGINE=async - асинхронный конвейер с PARSE_CONCURRENCY одновременными загрузками,
+# PARSE_EXTRACTION=tiles - данные только из плиток выдачи, hybrid - страницы только для неполных плиток.
+QUERY_OPTIONS = {
+        "workers"    : int(os.getenv("PARSE_WORKERS", 2)),
+        "engine"     : os.getenv("PARSE_ENGINE", "sync"),
+        "concurrency": int(os.getenv("PARSE_CONCURRENCY", 16)),
+        "extraction" : os.getenv("PARSE_EXTRACTION", "pages"),
+        }
+# Задачи выполняются в JOB_WORKERS рабочих процессах, у каждого свой пул из BROWSER_POOL_SIZE браузеров.
+# Ожидать могут не больше JOB_QUEUE_SIZE задач, остальные отклоняются. Процессы запускаются при первой задаче.
+job_manager = JobManager(
+        workers=int(os.getenv("JOB_WORKERS", 2)),
+        max_queue=int(os.getenv("JOB_QUEUE_SIZE", 20)),
+        worker_config={
+                "download_folder"  : DOWNLOAD_FOLDER,
+                "browsers"         : int(os.getenv("BROWSER_POOL_SIZE", 2)),
+                "max_pages"        : int(os.getenv("BROWSER_POOL_MAX_PAGES", 50)),
+                # Облегчённый профиль Chrome: без картинок, шрифтов, видео и трекеров, без Xvfb (LEAN_BROWSER=0 - выкл.)
+                "lean_browser"     : os.getenv("LEAN_BROWSER", "1") == "1",
+                # chromedriver: CHROMEDRIVER_PATH или локальный кэш; CHROMEDRIVER_DOWNLOAD=1 - разрешить загрузку
+                "driver_path"      : os.getenv("CHROMEDRIVER_PATH") or None,
+                "driver_download"  : os.getenv("CHROMEDRIVER_DOWNLOAD", "0") == "1",
+                # Сессия сайта (cookies, localStorage) общая для браузеров всех процессов (SESSION_STATE=0 - выкл.)
+                "session_state"    : os.getenv("SESSION_STATE", "1") == "1",
+                # FETCH_BACKEND=http - сначала пробовать страницы товаров лёгким HTTP-клиентом
+                "fetch_backend"    : os.getenv("FETCH_BACKEND", "selenium"),
+                # Кэш разобранных страниц товара на диске, общий для процессов (PRODUCT_CACHE=0 - отключить)
+                "product_cache"    : os.getenv("PRODUCT_CACHE", "1") == "1",
+                "cache_max_entries": int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", 20000)),
+                # Ссылки из поисковой выдачи: повторный поиск в пределах TTL обходится без прокрутки
+                "link_cache_ttl"   : float(os.getenv("LINK_CACHE_TTL", 600)),
+                # История цен товаров: результаты задач дописываются в общую базу (PRICE_HISTORY=0 - отключить)
+                "price_history"    : os.getenv("PRICE_HISTORY", "1") == "1",
+                # Результаты в Parquet рядом с CSV (RESULT_PARQUET=0 - только CSV); XLSX - при первом скачивании
+                "parquet"          : os.getenv("RESULT_PARQUET", "1") == "1",
+                # Аналоги по URL: страницы открываются только для самых похожих по названию (ANALOG_RANKING=0 - выкл.)
+                "analog_ranking"   : os.getenv("ANALOG_RANKING", "1") == "1",
+                # Файлы результатов по хешу содержимого со сжатыми копиями (RESULT_STORE=0 - как есть, без очистки)
+                "result_store"     : os.getenv("RESULT_STORE", "1") == "1",
+                # Строки результата уходят клиенту пакетами
+                "row_batch_size"   : int(os.getenv("ROW_BATCH_SIZE", 20)),
+                "row_batch_delay"  : float(os.getenv("ROW_BATCH_DELAY", 0.5)),
+                # Метрики пулов и этапов приходят от процессов каждые METRICS_INTERVAL секунд, и во время задачи
+                "metrics_interval" : float(os.getenv("METRICS_INTERVAL", 5)),
+                "query_options"    : QUERY_OPTIONS,
+                },
+        )
+# Максимальное число входов в пакете, загружаемом через панель
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", 500))
+# История цен для чтения (пишут рабочие процессы)
+price_history = PriceHistory()
+# Хранилище результатов (публикуют рабочие процессы): результаты, не скачивавшиеся RESULT_MAX_AGE_DAYS дней,
+# и давно не использовавшиеся сверх RESULT_MAX_MB удаляются фоновой очисткой
+result_store = ResultStore(DOWNLOAD_FOLDER, max_age=float(os.getenv("RESULT_MAX_AGE_DAYS", 7)) * 24 * 3600,
+                           max_bytes=int(os.getenv("RESULT_MAX_MB", 2048)) * 2 ** 20
+                           )
+if os.getenv("RESULT_STORE", "1") == "1":
+    result_store.start_retention(interval=float(os.getenv("RESULT_RETENTION_INTERVAL", 600)))
 
 
 # --- Маршруты Flask ---
@@ -38,10 +105,130 @@ def index():
     return render_template('index.html')
 
 
+# Оглавление результатов: файлы, размеры и сжатые копии
+@app.route('/downloads/')
+def downloads_index():
+    results = result_store.list_results()
+    for result in results:
+        for file in result["files"]:
+            file["url"] = f'/{DOWNLOAD_FOLDER}/{file["name"]}'
+    return jsonify({ "results"  : results,
+                     "bytes"    : sum(result["bytes"] for result in results),
+                     "max_bytes": result_store.max_bytes,
+                     "max_age_s": result_store.max_age })
+
+
 # Маршрут для скачивания файлов из папки downloads
 @app.route('/downloads/<path:filename>')
 def static_files(filename):
-    return send_from_directory(DOWNLOAD_FOLDER, filename, as_attachment=True)
+    entry = result_store.lookup(filename)
+
+    # XLSX не пишется при парсинге: он строится из Parquet или CSV при первом скачивании
+    if entry is None and filename.endswith('.xlsx'):
+        xlsx_filepath = safe_join(DOWNLOAD_FOLDER, filename)
+        if xlsx_filepath is not None and ensure_xlsx(xlsx_filepath):
+            entry = result_store.register(filename)
+
+    if entry is None:
+        # Файлы вне хранилища: RESULT_STORE=0 или файлы, сохранённые до его появления
+        return send_from_directory(DOWNLOAD_FOLDER, filename, as_attachment=True)
+
+    # Содержимое файла хранилища по имени не меняется: клиент кэширует его и переспрашивает по ETag
+    accepted = [encoding for encoding, quality in request.accept_encodings if quality > 0]
+    sent_name, encoding, etag = result_store.representation(entry, accepted)
+    mimetype = mimetypes.guess_type(entry["download_name"])[0] or "application/octet-stream"
+    response = send_from_directory(DOWNLOAD_FOLDER, sent_name, as_attachment=True,
+                                   download_name=entry["download_name"], mimetype=mimetype,
+                                   etag=etag, conditional=True, max_age=365 * 24 * 3600
+                                   )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.immutable = True
+    result_store.touch(filename)
+    return response
+
+
+# Метрики пулов браузеров рабочих процессов: ожидание выдачи драйвера и стоимость холодного старта
+@app.route('/pool/metrics')
+def pool_metrics():
+    return jsonify(job_manager.metrics()["browser_pools"])
+
+
+# Метрики в формате Prometheus: длительность этапов и счётчики полей из рабочих процессов,
+# задачи и браузеры. METRICS_ENABLED=0 отключает замеры этапов.
+@app.route('/metrics')
+def prometheus_metrics():
+    metrics = job_manager.metrics()
+    pools = metrics["browser_pools"].values()
+    gauges = {
+            "ozon_jobs_active"     : ("Задачи в работе", metrics["workers_busy"]),
+            "ozon_jobs_queued"     : ("Задачи в очереди", metrics["queue_depth"]),
+            "ozon_job_workers"     : ("Рабочие процессы", metrics["workers"]),
+            "ozon_browsers_live"   : ("Запущенные браузеры", sum(pool["live"] for pool in pools)),
+            "ozon_browsers_in_use" : ("Браузеры, выданные задачам", sum(pool["in_use"] for pool in pools)),
+            }
+    snapshot = merge_snapshots(job_manager.stage_metrics() + [DEFAULT_METRICS.snapshot()])
+    return Response(render_prometheus(snapshot, gauges), mimetype="text/plain; version=0.0.4")
+
+
+# Отладочные материалы страниц с ошибками: оглавление, HTML (распаковывается и отдаётся текстом) и скриншоты
+@app.route('/debug/')
+@app.route('/debug/<path:filename>')
+def debug_artifacts(filename=INDEX_HTML):
+    if filename.endswith('.html.gz'):
+        filepath = safe_join(DEBUG_DIR, filename)
+        if filepath is None or not os.path.isfile(filepath):
+            return jsonify({ "error": "Файл не найден" }), 404
+        with gzip.open(filepath, 'rb') as f:
+            # Текстом, а не HTML: скрипты сохранённой страницы не выполняются
+            return Response(f.read(), mimetype="text/plain; charset=utf-8")
+    return send_from_directory(DEBUG_DIR, filename)
+
+
+# История цен товара по URL: только изменения цены, рейтинга и числа отзывов
+@app.route('/prices/history')
+def prices_history():
+    url = request.args.get('url', '').strip()
+    if not is_product_url(url):
+        return jsonify({ "error": "Укажите ссылку на товар Ozon в параметре url" }), 400
+    return jsonify({ "url": url, "history": price_history.history(url) })
+
+
+# Товары, подешевевшие с прошлого запуска не меньше чем на percent процентов
+# (since_hours - вместо прошлого запуска снижения за последние since_hours часов)
+@app.route('/prices/drops')
+def prices_drops():
+    try:
+        percent = float(request.args.get('percent', 10))
+        since_hours = request.args.get('since_hours', type=float)
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({ "error": "Некорректные параметры percent, since_hours или limit" }), 400
+
+    since = time.time() - since_hours * 3600 if since_hours is not None else None
+    return jsonify({ "percent": percent, "drops": price_history.price_drops(percent, since, limit) })
+
+
+# Очередь задач: список задач и метрики (глубина очереди, время ожидания, отклонённые задачи)
+@app.route('/jobs')
+def jobs_list():
+    return jsonify({ "jobs": job_manager.list_jobs(), "metrics": job_manager.metrics() })
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({ "error": "Задача не найдена" }), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    if not job_manager.cancel(job_id):
+        return jsonify({ "error": "Задача не найдена или уже завершена" }), 404
+    return jsonify(job_manager.get(job_id).to_dict())
 
 
 # --- Обработчики SocketIO ---
@@ -57,76 +244,71 @@ def handle_disconnect():
 
 @socketio.on('start_parsing')
 def handle_start_parsing(data):
+    """
+    Ставит задачу парсинга в очередь. Задача выполняется в рабочем процессе, её события
+    (log_message, product_row, parsing_finished) пересылаются клиенту. Одинаковые одновременные
+    запросы разных пользователей выполняются один раз.
+    """
     session_id = request.sid
-    print(f"Получен запрос на парсинг от {session_id} с данными: {data}")
+    print(f"Получен запрос на парсинг от {session_id} с данными: "
+          f"{ {key: value for key, value in data.items() if key != 'batch_text'} }")
 
     def socket_logger(message):
         socketio.emit('log_message', { 'data': str(message) }, room=session_id)
 
-    def parsing_thread_function(task_data):
-        """
-        Основная функция, выполняющая парсинг.
-        Определяет, это URL или поисковый запрос, и запускает нужный сценарий.
-        """
-        input_data = task_data.get('input_data', '').strip()
-        pages = task_data.get('pages', 1)
-        max_items = task_data.get('max_items', 5)
+    def socket_publisher(event, payload):
+        socketio.emit(event, payload, room=session_id)
 
-        df_results = None
+    input_data = data.get('input_data', '').strip()
+    pages = data.get('pages', 1)
+    max_items = data.get('max_items', 5)
 
-        # Определяем, URL это или поисковый запрос
-        is_url = input_data.startswith('http') and 'ozon.ru' in input_data
-
-        try:
-
-            if is_url:
-                df_results = run_scenario_by_url(input_data, pages, max_items, logger_callback=socket_logger)
-            else:
-                df_results = run_scenario_by_query(input_data, pages, max_items, logger_callback=socket_logger)
-
-            if df_results is not None and not df_results.empty:
-                # Используем централизованную функцию для сохранения
-                saved_info = save_parsing_results(
-                        df=df_results,
-                        input_data=input_data,
-                        is_url=is_url,
-                        directory=DOWNLOAD_FOLDER,
-                        logger_callback=socket_logger
-                        )
-
-                response_data = { }
-
-                if saved_info and 'csv_filepath' in saved_info and 'csv_content' in saved_info:
-                    result_filename = os.path.basename(saved_info['csv_filepath'])
-                    response_data['result_url'] = f'/{DOWNLOAD_FOLDER}/{result_filename}'
-                    response_data['csv_data'] = saved_info['csv_content']
-
-                if saved_info and 'xlsx_filepath' in saved_info:
-                    xlsx_filename = os.path.basename(saved_info['xlsx_filepath'])
-                    response_data['xlsx_url'] = f'/{DOWNLOAD_FOLDER}/{xlsx_filename}'
-
-                if response_data:
-                    socketio.emit('parsing_finished', response_data, room=session_id)
-                else:
-                    socket_logger("Ошибка при сохранении результатов парсинга.")
-                    socketio.emit('parsing_finished', { }, room=session_id)
-
-            else:
-                socket_logger("Парсинг завершился безрезультатно.")
-                socketio.emit('parsing_finished', { }, room=session_id)  # Завершаем без ссылки
-
-        except Exception as e:
-            socket_logger(f"--- КРИТИЧЕСКАЯ ОШИБКА ---")
-            socket_logger(str(e))
+    if data.get('batch_text'):
+        # Пакет: файл со списком запросов/URL, все входы выполняются одной задачей
+        items = parse_batch_text(data['batch_text'], data.get('batch_format', ''), pages, max_items)[:MAX_BATCH_ITEMS]
+        if not items:
+            socket_logger("В файле пакета нет ни одного запроса или URL.")
             socketio.emit('parsing_finished', { }, room=session_id)
+            return
+
+        params = { "input_data": f"Пакет: {len(items)} входов",
+                   "batch"     : [{ "input_data": item.input_data, "pages": item.pages, "max_items": item.max_items }
+                                  for item in items] }
+        task_key = ("batch", tuple(item.key for item in items))
+
+    else:
+        # Определяем, URL это или поисковый запрос
+        is_url = is_product_url(input_data)
+        params = { "input_data": input_data, "is_url": is_url, "pages": pages, "max_items": max_items }
+
+        if is_url:
+            task_key = ("url", OzonScraper.normalize_product_url(input_data), pages, max_items)
+        else:
+            task_key = ("query", LinkCache.normalize_query(input_data), pages, max_items)
+
+    # Сообщаем о старте до постановки в очередь, чтобы клиент очистил таблицу раньше первых строк
+    socketio.emit('task_started', { 'data': 'Задача парсинга поставлена в очередь...' }, room=session_id)
 
-    thread = threading.Thread(target=parsing_thread_function, args=(data,))
-    thread.start()
+    try:
+        job = job_manager.submit(
+                params,
+                task_key,
+                socket_publisher,
+                on_join=lambda: socket_logger("Такой же запрос уже выполняется - подключаемся к нему.")
+                )
+    except QueueFullError as e:
+        socket_logger(f"Задача отклонена: {e}")
+        socketio.emit('parsing_finished', { }, room=session_id)
+        return
 
-    socketio.emit('task_started', { 'data': 'Задача парсинга запущена...' }, room=session_id)
+    socketio.emit('job_accepted', { 'job_id': job.id }, room=session_id)
 
 
 # --- Запуск приложения ---
 if __name__ == '__main__':
     os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
-    socketio.run(app, debug=True, allow_unsafe_werkzeug=True)
+    try:
+        # Без перезагрузчика: он перезапускает процесс и вместе с ним рабочие процессы с браузерами
+        socketio.run(app, debug=True, use_reloader=False, allow_unsafe_werkzeug=True)
+    finally:
+        job_manager.shutdown()
@@ -0,0 +1,78 @@
+# bench/bench_backends.py
+"""
+Сравнение бэкендов загрузки страницы товара на локальных фикстурах, без доступа к ozon.ru.
+
+Запуск из корня проекта:
+    python -m bench.bench_backends --count 50 --latency 100
+    python -m bench.bench_backends --count 20 --selenium
+"""
+
+import argparse
+import json
+import time
+
+from _1d_Class_RateLimiter import RateLimiter
+from _1e_Class_FetchBackends import FetchBackend, HttpFetchBackend, SeleniumFetchBackend
+from bench.fixture_server import FixtureServer, product_fields
+
+
+def run_backend(backend: FetchBackend, server: FixtureServer, count: int) -> dict:
+    """Прогоняет бэкенд по count страницам и сверяет извлечённые поля с эталоном."""
+
+    latencies = []
+    mismatches = 0
+
+    started = time.perf_counter()
+    for product_id in range(1, count + 1):
+        t0 = time.perf_counter()
+        data = backend.fetch_product(server.product_url(product_id))
+        latencies.append(time.perf_counter() - t0)
+
+        expected = product_fields(product_id)
+        if not data or any(data[key] != expected[key] for key in ("title", "price", "rating", "reviews_count")):
+            mismatches += 1
+    total = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+            "backend"     : backend.name,
+            "pages"       : count,
+            "total_s"     : round(total, 3),
+            "pages_per_s" : round(count / total, 2) if total else None,
+            "p50_ms"      : round(latencies[len(latencies) // 2] * 1000, 1),
+            "p95_ms"      : round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+            "mismatches"  : mismatches,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов загрузки страниц товара")
+    parser.add_argument("--count", type=int, default=50, help="Количество страниц товара")
+    parser.add_argument("--latency", type=int, default=0, help="Искусственная задержка сервера, мс")
+    parser.add_argument("--padding-kb", type=int, default=200, help="Размер балласта страницы, КБ")
+    parser.add_argument("--selenium", action="store_true", help="Также замерить Selenium-бэкенд")
+    args = parser.parse_args()
+
+    results = []
+
+    with FixtureServer(latency_ms=args.latency, padding_kb=args.padding_kb) as server:
+        http_backend = HttpFetchBackend()
+        results.append(run_backend(http_backend, server, args.count))
+        http_backend.close()
+
+        if args.selenium:
+            from _1a_Class_BrowserManager import BrowserManager
+            from _1b_Class_OzonScraper import OzonScraper
+
+            with BrowserManager(logger_callback=lambda message: None) as driver:
+                # Большой бюджет запросов убирает паузы между страницами - меряем только загрузку и разбор
+                scraper = OzonScraper(driver, logger_callback=lambda message: None,
+                                      rate_limiter=RateLimiter(rate_per_minute=60000, burst=1000)
+                                      )
+                results.append(run_backend(SeleniumFetchBackend(scraper), server, args.count))
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+# bench/bench_scraper.py
+"""
+Бенчмарк скрапера на локальной копии Ozon (bench/fixture_server.py), без доступа к ozon.ru:
+сбор ссылок из выдачи с бесконечной прокруткой, разбор страниц товара, сценарий process_query целиком
+и сохранение результатов. Итог - JSON для отслеживания регрессий: пропускная способность, p50/p95,
+пиковый RSS (бенчмарк + chromedriver + Chrome) и число процессов Chrome.
+
+Запуск из корня проекта:
+    python -m bench.bench_scraper --queries 3 --results 36 --latency 50
+    python -m bench.bench_scraper --workers 2 --engine async --lean --output bench_scraper.json
+"""
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+
+import psutil
+
+from _1a_Class_BrowserManager import PerformanceProfile
+from _1b_Class_OzonScraper import OzonScraper
+from _1c_Class_BrowserPool import BrowserPool
+from _1d_Class_RateLimiter import RateLimiter
+from _1e_Class_FetchBackends import HttpFetchBackend
+from _2_scenarios import process_query
+from _3_save_files import save_parsing_results
+from bench.fixture_server import FixtureServer, product_fields, search_product_ids
+
+FIELDS = ("title", "price", "rating", "reviews_count")
+
+
+class ResourceSampler:
+    """
+    Фоновый замер ресурсов: суммарный RSS процесса бенчмарка и всех дочерних процессов (chromedriver, Chrome)
+    и число процессов Chrome. Пики считаются за весь прогон и отдельно между вызовами stage_peaks().
+    """
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_chrome = 0
+        self._stage_rss = 0
+        self._stage_chrome = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self) -> None:
+        process = psutil.Process()
+        rss = 0
+        chrome = 0
+
+        for child in [process] + process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+                name = child.name().lower()
+            except psutil.Error:
+                continue  # процесс завершился между перечислением и замером
+            if "chrome" in name and "chromedriver" not in name:
+                chrome += 1
+
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_chrome = max(self.peak_chrome, chrome)
+        self._stage_rss = max(self._stage_rss, rss)
+        self._stage_chrome = max(self._stage_chrome, chrome)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def stage_peaks(self) -> dict:
+        """Пики с прошлого вызова; счётчики этапа обнуляются."""
+
+        self._sample()
+        peaks = { "peak_rss_mb": round(self._stage_rss / 2 ** 20, 1), "peak_chrome_processes": self._stage_chrome }
+        self._stage_rss = 0
+        self._stage_chrome = 0
+        return peaks
+
+    def __enter__(self) -> "ResourceSampler":
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def summarize(latencies: list[float], total: float, **extra) -> dict:
+    """Пропускная способность и перцентили задержки одной операции этапа."""
+
+    ordered = sorted(latencies)
+
+    def percentile(q: float) -> float | None:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 1) if ordered else None
+
+    return {
+            "operations" : len(ordered),
+            "total_s"    : round(total, 3),
+            "ops_per_s"  : round(len(ordered) / total, 2) if total else None,
+            "p50_ms"     : percentile(0.5),
+            "p95_ms"     : percentile(0.95),
+            **extra,
+            }
+
+
+def product_id_of(url: str) -> int:
+    return int(url.rstrip("/").rsplit("-", 1)[-1])
+
+
+def matches_fixture(product_data: dict | None) -> bool:
+    """Совпадают ли разобранные поля с эталоном фикстуры."""
+
+    if not product_data or not product_data.get("url"):
+        return False
+
+    expected = product_fields(product_id_of(product_data["url"]))
+    return all(product_data.get(key) == expected[key] for key in FIELDS)
+
+
+def bench_links(scraper: OzonScraper, server: FixtureServer, queries: list[str], pages: int,
+                max_products: int) -> tuple[dict, list[str]]:
+    """Этап fetch_product_links: одна операция - сбор выдачи по одному запросу."""
+
+    latencies = []
+    all_links = []
+    missing = 0
+
+    started = time.perf_counter()
+    for query in queries:
+        t0 = time.perf_counter()
+        links = scraper.fetch_product_links(query, pages, max_products)
+        latencies.append(time.perf_counter() - t0)
+
+        expected = { server.product_url(product_id)
+                     for product_id in search_product_ids(query, server.httpd.search_results)[:max_products] }
+        missing += len(expected - set(links))
+        all_links.extend(links)
+    total = time.perf_counter() - started
+
+    return summarize(latencies, total, links=len(all_links), missing_links=missing), all_links
+
+
+def bench_products(scraper: OzonScraper, links: list[str]) -> dict:
+    """Этап parse_product_page: одна операция - одна страница товара."""
+
+    latencies = []
+    mismatches = 0
+
+    started = time.perf_counter()
+    for link in links:
+        t0 = time.perf_counter()
+        product_data = scraper.parse_product_page(link)
+        latencies.append(time.perf_counter() - t0)
+        mismatches += not matches_fixture(product_data)
+    total = time.perf_counter() - started
+
+    return summarize(latencies, total, mismatches=mismatches)
+
+
+def bench_process_query(scraper: OzonScraper, queries: list[str], pages: int, max_products: int,
+                        pool: BrowserPool, query_options: dict) -> tuple[dict, list]:
+    """Этап process_query: одна операция - сценарий по одному запросу (выдача + все страницы товаров)."""
+
+    latencies = []
+    frames = []
+    rows = 0
+    mismatches = 0
+
+    started = time.perf_counter()
+    for query in queries:
+        t0 = time.perf_counter()
+        df = process_query(scraper, query, pages, max_products, pool=pool, **query_options)
+        latencies.append(time.perf_counter() - t0)
+
+        frames.append((query, df))
+        rows += len(df)
+        mismatches += sum(not matches_fixture(product_data) for product_data in df.to_dict('records'))
+    total = time.perf_counter() - started
+
+    return summarize(latencies, total, rows=rows, rows_per_s=round(rows / total, 2) if total else None,
+                     mismatches=mismatches), frames
+
+
+def bench_save(frames: list, repeat: int) -> dict:
+    """Этап save_parsing_results: одна операция - сохранение результата одного запроса (CSV + XLSX)."""
+
+    latencies = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query, df in frames:
+                t0 = time.perf_counter()
+                save_parsing_results(df, query, False, directory, logger_callback=lambda message: None)
+                latencies.append(time.perf_counter() - t0)
+        total = time.perf_counter() - started
+
+    return summarize(latencies, total, rows=sum(len(df) for _, df in frames) * repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк скрапера на локальной копии Ozon")
+    parser.add_argument("--queries", type=int, default=3, help="Количество поисковых запросов")
+    parser.add_argument("--results", type=int, default=36, help="Товаров в выдаче по каждому запросу")
+    parser.add_argument("--page-size", type=int, default=12, help="Плиток в одной порции прокрутки")
+    parser.add_argument("--max-products", type=int, default=None, help="Сколько ссылок собирать (по умолчанию все)")
+    parser.add_argument("--latency", type=int, default=0, help="Искусственная задержка сервера, мс")
+    parser.add_argument("--padding-kb", type=int, default=200, help="Размер балласта страницы товара, КБ")
+    parser.add_argument("--workers", type=int, default=1, help="Браузеров для process_query")
+    parser.add_argument("--engine", default="sync", choices=["sync", "async"], help="Движок process_query")
+    parser.add_argument("--concurrency", type=int, default=16, help="Одновременных загрузок для engine=async")
+    parser.add_argument("--backend", default="selenium", choices=["selenium", "http"],
+                        help="Загрузка страниц товара: только браузер или сначала HTTP")
+    parser.add_argument("--link-collection", default="incremental", choices=["incremental", "legacy"])
+    parser.add_argument("--extraction", default="pages", choices=["pages", "tiles", "hybrid"],
+                        help="Данные товаров для process_query: страницы, плитки выдачи или плитки + неполные страницы")
+    parser.add_argument("--lean", action="store_true", help="Облегчённый профиль Chrome (PerformanceProfile)")
+    parser.add_argument("--allow-driver-download", action="store_true", help="Разрешить загрузку chromedriver")
+    parser.add_argument("--save-repeat", type=int, default=3, help="Повторов этапа save_parsing_results")
+    parser.add_argument("--output", default=None, help="Файл для JSON-результата (иначе только stdout)")
+    parser.add_argument("--verbose", action="store_true", help="Выводить лог скрапера")
+    args = parser.parse_args()
+
+    log = print if args.verbose else (lambda message: None)
+    queries = [f"тестовый запрос {number}" for number in range(1, args.queries + 1)]
+    max_products = args.max_products or args.results
+    # Итераций прокрутки с запасом: по одной на порцию плиток плюс холостые
+    pages = -(-args.results // args.page_size) + OzonScraper.IDLE_SCROLLS + 1
+    query_options = { "workers"   : args.workers, "engine": args.engine, "concurrency": args.concurrency,
+                      "extraction": args.extraction }
+    backend = HttpFetchBackend() if args.backend == "http" else None
+
+    report = { "config": vars(args), "started_at": time.time(), "stages": { } }
+
+    with ResourceSampler() as sampler, \
+            FixtureServer(latency_ms=args.latency, padding_kb=args.padding_kb, search_results=args.results,
+                          search_page_size=args.page_size) as server:
+        pool = BrowserPool(size=max(1, args.workers), logger_callback=log,
+                           performance_profile=PerformanceProfile() if args.lean else None,
+                           allow_driver_download=args.allow_driver_download
+                           )
+        try:
+            pool.start()
+            report["stages"]["startup"] = { **pool.metrics()["startup_phases_s"], **sampler.stage_peaks() }
+
+            with pool.lease() as lease:
+                if lease is None:
+                    raise RuntimeError("Не удалось запустить браузер для бенчмарка.")
+
+                # Большой бюджет запросов убирает паузы между страницами - меряем только загрузку и разбор
+                scraper = OzonScraper(lease.driver, logger_callback=log, backend=backend,
+                                      rate_limiter=RateLimiter(rate_per_minute=60000, burst=1000),
+                                      link_collection=args.link_collection
+                                      )
+                scraper.BASE_DOMAIN = server.base_url
+
+                stage, links = bench_links(scraper, server, queries, pages, max_products)
+                report["stages"]["fetch_product_links"] = { **stage, **sampler.stage_peaks() }
+
+                stage = bench_products(scraper, links)
+                report["stages"]["parse_product_page"] = { **stage, **sampler.stage_peaks() }
+
+                stage, frames = bench_process_query(scraper, queries, pages, max_products, pool, query_options)
+                report["stages"]["process_query"] = { **stage, **sampler.stage_peaks() }
+
+            stage = bench_save(frames, args.save_repeat)
+            report["stages"]["save_parsing_results"] = { **stage, **sampler.stage_peaks() }
+
+        finally:
+            pool.close()
+            if backend:
+                backend.close()
+
+    report["duration_s"] = round(time.time() - report["started_at"], 3)
+    report["peak_rss_mb"] = round(sampler.peak_rss / 2 ** 20, 1)
+    report["peak_chrome_processes"] = sampler.peak_chrome
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# bench/fixture_server.py
+
+import html
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from string import Template
+from urllib.parse import urlparse, parse_qs, quote
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def product_fields(product_id: int) -> dict:
+    """Детерминированные данные синтетического товара - по ним бенчмарк сверяет результат парсинга."""
+
+    rnd = random.Random(product_id)
+    price = rnd.randint(300, 90000)
+    return {
+            "title"        : f"Тестовый товар №{product_id}",
+            "price"        : price,
+            "old_price"    : price + rnd.randint(100, 5000),
+            "rating"       : round(rnd.uniform(3.0, 5.0), 1),
+            "reviews_count": rnd.randint(0, 20000),
+            }
+
+
+def search_product_ids(query: str, total: int) -> list[int]:
+    """Детерминированная выдача синтетического поиска: total разных id товаров для запроса."""
+
+    base = (zlib.crc32(query.encode("utf-8")) % 100000) * 10000
+    return [base + index for index in range(1, total + 1)]
+
+
+def _format_rub(value: int) -> str:
+    # Ozon разделяет разряды узким пробелом
+    return f"{value:,}".replace(",", " ")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    Отдаёт синтетические страницы в разметке Ozon:
+    /product/<slug>-<id>/ - страница товара с виджетами webPrice и webSingleProductScore;
+    /search/?text=<запрос> - выдача tileGridDesktop с бесконечной прокруткой и окном cookieBubble,
+    следующие порции плиток подгружаются скриптом страницы с /search/tiles?text=<запрос>&offset=<n>;
+    в плитке, как на Ozon, есть название, цена, рейтинг и число отзывов.
+    Параметр ?latency=<мс> добавляет задержку ответа.
+    """
+
+    product_template: Template = None
+    search_template: Template = None
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+
+        latency_ms = int(query.get("latency", [self.server.latency_ms])[0])
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+        if parsed.path.startswith("/product/"):
+            self._send_html(self._render_product(parsed.path))
+        elif parsed.path == "/search/tiles":
+            self._send_html(self._render_tiles(query["text"][0], int(query["offset"][0])))
+        elif parsed.path.rstrip("/") == "/search":
+            self._send_html(self._render_search(query["text"][0]))
+        else:
+            self.send_error(404)
+
+    def _render_product(self, path: str) -> str:
+        product_id = int(path.rstrip("/").rsplit("-", 1)[-1])
+        fields = product_fields(product_id)
+        return self.product_template.substitute(
+                title=fields["title"],
+                price=_format_rub(fields["price"]),
+                old_price=_format_rub(fields["old_price"]),
+                rating=fields["rating"],
+                reviews=_format_rub(fields["reviews_count"]),
+                # Балласт, чтобы размер страницы был ближе к настоящему
+                padding="x" * (self.server.padding_kb * 1024),
+                )
+
+    def _render_tiles(self, text: str, offset: int) -> str:
+        page_size = self.server.search_page_size
+        product_ids = search_product_ids(text, self.server.search_results)[offset:offset + page_size]
+        return "".join(self._render_tile(product_id) for product_id in product_ids)
+
+    @staticmethod
+    def _render_tile(product_id: int) -> str:
+        # Плитка как в выдаче Ozon: две ссылки на товар (картинка и название), цена, рейтинг и отзывы
+        fields = product_fields(product_id)
+        href = f"/product/testovyy-tovar-{product_id}/?at=search"
+        return (f'<div class="tile-root"><a href="{href}"><img alt=""></a>'
+                f'<div><span class="tsHeadline500Medium">{_format_rub(fields["price"])} ₽</span></div>'
+                f'<a href="{href}"><span class="tsBody500Medium">{html.escape(fields["title"])}</span></a>'
+                f'<div class="tsBodyMBold"><span>{fields["rating"]}</span> '
+                f'<span>{_format_rub(fields["reviews_count"])} отзывов</span></div></div>')
+
+    def _render_search(self, text: str) -> str:
+        return self.search_template.substitute(
+                query=html.escape(text),
+                tiles=self._render_tiles(text, 0),
+                total=self.server.search_results,
+                page_size=self.server.search_page_size,
+                )
+
+    def _send_html(self, body: str) -> None:
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """Локальный HTTP-сервер с фикстурами в отдельном потоке. Используется как контекстный менеджер."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: int = 0, padding_kb: int = 0,
+                 search_results: int = 36, search_page_size: int = 12
+                 ):
+        """
+        :param search_results: Сколько товаров в выдаче по любому запросу.
+        :param search_page_size: Сколько плиток приходит в первой и каждой следующей порции прокрутки.
+        """
+
+        with open(os.path.join(FIXTURES_DIR, "product.html"), encoding="utf-8") as f:
+            FixtureHandler.product_template = Template(f.read())
+        with open(os.path.join(FIXTURES_DIR, "search.html"), encoding="utf-8") as f:
+            FixtureHandler.search_template = Template(f.read())
+
+        self.httpd = ThreadingHTTPServer((host, port), FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency_ms = latency_ms
+        self.httpd.padding_kb = padding_kb
+        self.httpd.search_results = search_results
+        self.httpd.search_page_size = search_page_size
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def product_url(self, product_id: int) -> str:
+        return f"{self.base_url}/product/testovyy-tovar-{product_id}/"
+
+    def search_url(self, query: str) -> str:
+        return f"{self.base_url}/search/?text={quote(query)}&from_global=true"
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    with FixtureServer(port=8765) as server:
+        print(f"Фикстуры доступны на {server.base_url}, например {server.product_url(1)} "
+              f"и {server.search_url('игровая мышь')}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -6,7 +6,17 @@ import pandas as pd
 from datetime import datetime
 
 # Импортируем наши модули
+from _1a_Class_BrowserManager import PerformanceProfile
+from _1c_Class_BrowserPool import BrowserPool
+from _1e_Class_FetchBackends import HttpFetchBackend
+from _1f_Class_ProductCache import ProductCache, LinkCache
+from _1g_Class_CheckpointStore import CheckpointStore
+from _1j_Class_PriceHistory import PriceHistory
+from _1k_Class_SessionStore import SessionStore
+from _1m_Class_AnalogRanker import AnalogRanker
 from _2_scenarios import run_scenario_by_query, run_scenario_by_url
+from _2d_batch import load_batch_file, run_batch
+from _3_save_files import PARQUET_COMPRESSION, typed_frame
 
 
 def load_settings(filepath="settings.json"):
@@ -25,8 +35,8 @@ def load_settings(filepath="settings.json"):
         return None
 
 
-def save_results(df: pd.DataFrame, filename_prefix: str):
-    """Сохраняет DataFrame в CSV."""
+def save_results(df: pd.DataFrame, filename_prefix: str, write_parquet: bool = True):
+    """Сохраняет DataFrame в CSV и (по умолчанию) в Parquet с типами RESULT_SCHEMA."""
 
     if df is None or df.empty:
         print("Нет данных для сохранения.")
@@ -42,6 +52,11 @@ def save_results(df: pd.DataFrame, filename_prefix: str):
     print(f"--- РАБОТА ЗАВЕРШЕНА ---")
     print(f"Результаты ({len(df)} строк) сохранены в файл: {filename}")
 
+    if write_parquet:
+        parquet_filepath = os.path.splitext(filepath)[0] + ".parquet"
+        typed_frame(df).to_parquet(parquet_filepath, index=False, compression=PARQUET_COMPRESSION)
+        print(f"Parquet: {os.path.basename(parquet_filepath)}")
+
 
 def main():
     settings = load_settings()
@@ -51,29 +66,116 @@ def main():
         parse_conf = settings.get("parse_settings", { })
         pages = parse_conf.get("pages_to_parse", 1)
         max_items = parse_conf.get("max_analogs_or_products", 5)
-
+        # Число браузеров для параллельного парсинга страниц товаров (1 - последовательно)
+        workers = parse_conf.get("workers", 1)
+        # Облегчённый профиль Chrome: без картинок, шрифтов, видео и трекеров, маленькое окно, без Xvfb.
+        # chromedriver: закреплённый путь или локальный кэш; загрузка по сети - только если разрешена.
+        # Настройки браузера задаются пулу, поэтому пул создаётся и для одного браузера.
+        browser_conf = settings.get("browser", { })
+        # Сессия сайта (cookies и localStorage) переносится между запусками: новый браузер стартует «прогретым»
+        session_conf = settings.get("session", { })
+        session_store = None
+        if session_conf.get("enabled", True):
+            session_store = SessionStore(max_age=session_conf.get("max_age_hours", 12) * 3600,
+                                         refresh_after=session_conf.get("refresh_minutes", 60) * 60
+                                         )
+        # "async" - асинхронный конвейер с concurrency одновременными загрузками страниц.
+        # extraction: "pages" - страница каждого товара, "tiles" - только плитки выдачи,
+        # "hybrid" - плитки, а страницы только для товаров с неполными данными плитки
+        query_options = {
+                "workers"    : workers,
+                "engine"     : parse_conf.get("engine", "sync"),
+                "concurrency": parse_conf.get("concurrency", 16),
+                "extraction" : parse_conf.get("extraction", "pages"),
+                }
+        # "http" - страницы товаров сначала загружаются без браузера, "selenium" - только браузером
+        backend = HttpFetchBackend() if parse_conf.get("fetch_backend", "selenium") == "http" else None
+        # Кэш страниц товара на диске: TTL полей в секундах и лимит записей
+        cache_conf = settings.get("cache", { })
+        cache = None
+        if cache_conf.get("enabled", True):
+            cache = ProductCache(field_ttl=cache_conf.get("field_ttl"),
+                                 max_entries=cache_conf.get("max_entries", 20000)
+                                 )
+
+        # Контрольные точки: прерванный запуск с теми же параметрами продолжится с места остановки
+        checkpoints_conf = settings.get("checkpoints", { })
+        if checkpoints_conf.get("enabled", True):
+            query_options["checkpoints"] = CheckpointStore(max_age=checkpoints_conf.get("max_age_hours", 24) * 3600)
+
+        # История цен: результат каждого сценария дописывается в базу (только изменившиеся значения)
+        price_history = None
+        if settings.get("price_history", { }).get("enabled", True):
+            price_history = query_options["price_history"] = PriceHistory()
+
+        # Parquet рядом с CSV (типизированные колонки, сжатие zstd)
+        write_parquet = settings.get("output", { }).get("parquet", True)
+
+        # Пул создаётся последним и закрывается в finally: при ошибке сценария Chrome и Xvfb не остаются запущенными
+        pool = BrowserPool(size=workers,
+                           performance_profile=PerformanceProfile() if browser_conf.get("lean_profile") else None,
+                           driver_path=browser_conf.get("driver_path") or None,
+                           allow_driver_download=browser_conf.get("allow_driver_download", False),
+                           session_store=session_store
+                           )
         df_results = None
 
-        if mode == "query":
-            query = settings.get("input_query")
-
-            if not query:
-                print("Ошибка: в 'settings.json' не указан 'input_query' для режима 'query'.")
-            else:
-                df_results = run_scenario_by_query(query, pages=pages, max_products=max_items)
-                save_results(df_results, f"ozon_query_{query.replace(' ', '_')}")
-
-        elif mode == "url":
-            url = settings.get("input_url")
+        try:
+            if mode == "query":
+                query = settings.get("input_query")
+
+                if not query:
+                    print("Ошибка: в 'settings.json' не указан 'input_query' для режима 'query'.")
+                else:
+                    df_results = run_scenario_by_query(query, pages=pages, max_products=max_items, pool=pool,
+                                                       backend=backend, cache=cache, **query_options
+                                                       )
+                    save_results(df_results, f"ozon_query_{query.replace(' ', '_')}", write_parquet)
+
+            elif mode == "url":
+                url = settings.get("input_url")
+
+                if not url:
+                    print("Ошибка: в 'settings.json' не указан 'input_url' для режима 'url'.")
+                else:
+                    # Аналоги отбираются по названиям из плиток выдачи: страницы открываются только для самых похожих
+                    ranker = AnalogRanker() if parse_conf.get("analog_ranking", True) else None
+                    df_results = run_scenario_by_url(url, pages=pages, max_analogs=max_items, pool=pool,
+                                                     backend=backend, cache=cache, ranker=ranker, **query_options
+                                                     )
+                    save_results(df_results, "ozon_analogs", write_parquet)
+
+            elif mode == "batch":
+                batch_file = settings.get("input_batch_file")
+
+                if not batch_file:
+                    print("Ошибка: в 'settings.json' не указан 'input_batch_file' для режима 'batch'.")
+                else:
+                    # Все входы файла выполняются на одном наборе браузеров; повторный запуск продолжает пакет
+                    items = load_batch_file(batch_file, pages=pages, max_items=max_items)
+                    batch_name = f"batch_{os.path.splitext(os.path.basename(batch_file))[0]}"
+                    ranker = AnalogRanker() if parse_conf.get("analog_ranking", True) else None
+                    batch_info = run_batch(items, "results", batch_name, pool=pool, backend=backend, cache=cache,
+                                           link_cache=LinkCache(), write_parquet=write_parquet, ranker=ranker,
+                                           **query_options
+                                           )
+                    print("--- РАБОТА ЗАВЕРШЕНА ---")
+                    print(f"Сводный файл: {batch_info.get('csv_filepath')}, сводки по входам: "
+                          f"{batch_info['summary_filepath']}")
 
-            if not url:
-                print("Ошибка: в 'settings.json' не указан 'input_url' для режима 'url'.")
             else:
-                df_results = run_scenario_by_url(url, pages=pages, max_analogs=max_items)
-                save_results(df_results, "ozon_analogs")
-
-        else:
-            print(f"Ошибка: Неизвестный режим работы '{mode}' в 'settings.json'. Доступные режимы: 'query', 'url'.")
+                print(f"Ошибка: Неизвестный режим работы '{mode}' в 'settings.json'. "
+                      f"Доступные режимы: 'query', 'url', 'batch'.")
+
+        finally:
+            if pool:
+                pool.close()
+            if backend:
+                backend.close()
+            if cache:
+                cache.close()
+            if price_history:
+                price_history.close()
 
 
 if __name__ == '__main__':
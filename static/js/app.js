@@ -7,30 +7,83 @@ let sortState = {
 };
 
 /**
- * Парсит CSV-строку и сохраняет данные в глобальную переменную tableData,
- * затем вызывает отрисовку таблицы.
- * @param {string} csvData - Содержимое CSV файла.
+ * Экранирует значение ячейки для вставки в HTML. Пустые значения (null) отображаются пустой строкой.
+ * @param {*} value - Значение ячейки.
+ * @returns {string}
  */
-function parseAndDisplayCsv(csvData) {
-    if (!csvData) {
-        tableData = [];
-        document.getElementById('csv-table-container').innerHTML = '';
-        return;
+function escapeHtml(value) {
+    if (value === null || value === undefined) {
+        return '';
     }
+    return String(value)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;');
+}
 
-    const rows = csvData.trim().split('\n');
-    const headers = rows.shift().split(';');
+/**
+ * Очищает таблицу перед новой задачей.
+ */
+function resetTable() {
+    tableData = [];
+    sortState = { column: null, direction: 'asc' };
+    document.getElementById('csv-table-container').innerHTML = '';
+}
 
-    tableData = rows.map(rowStr => {
-        const cells = rowStr.split(';');
+/**
+ * Добавляет пакет строк, пришедший в событии product_row.
+ * Пока таблица не отсортирована, новые строки дописываются в конец без полной перерисовки.
+ * @param {string[]} columns - Названия колонок.
+ * @param {Array[]} rows - Строки в порядке колонок.
+ */
+function appendRows(columns, rows) {
+    const newObjects = rows.map(cells => {
         const rowObject = {};
-        headers.forEach((header, index) => {
+        columns.forEach((header, index) => {
             rowObject[header] = cells[index];
         });
         return rowObject;
     });
 
-    renderTable(); // Первая отрисовка
+    const tbody = document.querySelector('#csv-table-container tbody');
+    tableData.push(...newObjects);
+
+    if (!tbody || sortState.column !== null) {
+        renderTable();
+        return;
+    }
+
+    tbody.insertAdjacentHTML('beforeend', newObjects.map(rowToHtml).join(''));
+}
+
+/**
+ * Формирует HTML одной строки таблицы.
+ * @param {Object} rowObject - Строка в виде объекта { колонка: значение }.
+ * @returns {string}
+ */
+function rowToHtml(rowObject) {
+    let html = '<tr>';
+    Object.keys(tableData[0]).forEach(header => {
+        html += `<td>${escapeHtml(rowObject[header])}</td>`;
+    });
+    return html + '</tr>';
+}
+
+/**
+ * Формирует HTML сводки по результатам из события parsing_finished.
+ * @param {Object} summary - Сводка: rows, with_price, price_min, price_max, price_avg, rating_avg, duration_s.
+ * @returns {string}
+ */
+function summaryToHtml(summary) {
+    if (!summary) {
+        return '';
+    }
+    return `<p>Товаров: ${summary.rows} (с ценой: ${summary.with_price}). ` +
+        `Цена: ${escapeHtml(summary.price_min)} – ${escapeHtml(summary.price_max)} ₽, ` +
+        `средняя ${escapeHtml(summary.price_avg)} ₽. ` +
+        `Средний рейтинг: ${escapeHtml(summary.rating_avg)}. ` +
+        `Время: ${summary.duration_s} с.</p>`;
 }
 
 /**
@@ -57,11 +110,7 @@ function renderTable() {
     html += '</tr></thead><tbody>';
 
     tableData.forEach(rowObject => {
-        html += '<tr>';
-        headers.forEach(header => {
-            html += `<td>${rowObject[header]}</td>`;
-        });
-        html += '</tr>';
+        html += rowToHtml(rowObject);
     });
 
     html += '</tbody></table>';
@@ -122,8 +171,8 @@ function sortTable(column) {
             return (numA - numB) * direction;
         }
 
-        // Если не числа, сравниваем как строки
-        return valA.localeCompare(valB) * direction;
+        // Если не числа, сравниваем как строки (пустые значения - как пустые строки)
+        return String(valA ?? '').localeCompare(String(valB ?? '')) * direction;
     });
 
     renderTable(); // Перерисовываем таблицу с отсортированными данными
@@ -135,6 +184,7 @@ function sortTable(column) {
 const socket = io();
 const form = document.getElementById('parser-form');
 const startButton = document.getElementById('start-button');
+const cancelButton = document.getElementById('cancel-button');
 const logsContainer = document.getElementById('logs');
 const resultContainer = document.getElementById('result');
 
@@ -148,28 +198,60 @@ socket.on('log_message', (msg) => {
     logsContainer.scrollTop = logsContainer.scrollHeight;
 });
 
+// Идентификатор задачи в очереди сервера - для отмены
+let currentJobId = null;
+
+socket.on('job_accepted', (msg) => {
+    currentJobId = msg.job_id;
+    cancelButton.disabled = false;
+    logsContainer.innerHTML += `<div>[SYSTEM] Задача ${msg.job_id} принята.</div>`;
+});
+
+cancelButton.addEventListener('click', () => {
+    if (!currentJobId) {
+        return;
+    }
+    cancelButton.disabled = true;
+    fetch(`/jobs/${currentJobId}/cancel`, { method: 'POST' });
+});
+
 socket.on('task_started', (msg) => {
     startButton.disabled = true;
     startButton.innerText = 'В процессе...';
     resultContainer.innerHTML = '';
+    resetTable();
     logsContainer.innerHTML += `<div>[SYSTEM] ${msg.data}</div>`;
 });
 
+// Строки результата приходят пакетами по мере парсинга
+socket.on('product_row', (msg) => {
+    appendRows(msg.columns, msg.rows);
+});
+
 socket.on('parsing_finished', (msg) => {
+    currentJobId = null;
+    cancelButton.disabled = true;
     startButton.disabled = false;
     startButton.innerText = 'Начать парсинг';
 
     let resultHtml = '<h3>Готово!</h3>';
 
     if (msg.result_url) {
-        parseAndDisplayCsv(msg.csv_data); // Используем новую функцию
+        resultHtml += summaryToHtml(msg.summary);
         resultHtml += `<a href="${msg.result_url}" download>Скачать результаты (CSV)</a>`;
         logsContainer.innerHTML += `<div>[SUCCESS] Задача выполнена. <a href="${msg.result_url}" download>Скачать CSV</a>.</div>`;
     } else {
-        parseAndDisplayCsv(null); // Очищаем таблицу
         logsContainer.innerHTML += `<div>[INFO] Парсинг завершен безрезультатно.</div>`;
     }
 
+    if (msg.summary_url) {
+        resultHtml += `<br><a href="${msg.summary_url}" download>Сводки по входам пакета (JSONL)</a>`;
+    }
+
+    if (msg.parquet_url) {
+        resultHtml += `<br><a href="${msg.parquet_url}" download>Скачать результаты (Parquet)</a>`;
+    }
+
     if (msg.xlsx_url) {
         resultHtml += `<br><a href="${msg.xlsx_url}" download>Скачать результаты (XLSX)</a>`;
         logsContainer.innerHTML += `<div>[INFO] Доступен XLSX файл: <a href="${msg.xlsx_url}" download>Скачать XLSX</a>.</div>`;
@@ -185,19 +267,31 @@ socket.on('parsing_finished', (msg) => {
     logsContainer.scrollTop = logsContainer.scrollHeight;
 });
 
-form.addEventListener('submit', (e) => {
+form.addEventListener('submit', async (e) => {
     e.preventDefault();
     logsContainer.innerHTML = '';
 
     const inputData = document.getElementById('input_data').value;
     const maxItems = document.getElementById('max_items').value;
     const pages = document.getElementById('pages').value;
+    const batchFile = document.getElementById('batch_file').files[0];
 
-    socket.emit('start_parsing', {
+    const payload = {
         input_data: inputData,
         max_items: parseInt(maxItems),
         pages: parseInt(pages)
-    });
+    };
+
+    // Пакетный режим: содержимое файла разбирается на сервере, формат - по расширению
+    if (batchFile) {
+        payload.batch_text = await batchFile.text();
+        payload.batch_format = batchFile.name.split('.').pop().toLowerCase();
+    } else if (!inputData.trim()) {
+        logsContainer.innerHTML = '<div>[INFO] Укажите URL, поисковый запрос или файл со списком.</div>';
+        return;
+    }
+
+    socket.emit('start_parsing', payload);
 });
 
 // --- Надёжное делегирование и экспорт sortTable ---